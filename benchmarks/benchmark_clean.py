@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark comparing functions.clean with the original implementation.
+
+Usage: python benchmarks/benchmark_clean.py [-r <rows>] [-s <seed>]
+
+Values are taken from a synthetic Nielsen product file (see synthetic_feed.py).
+Both implementations are checked to give the same output for every value."""
+
+# Import required modules
+import getopt
+import sys
+import time
+import unicodedata
+
+import regex as re
+
+from synthetic_feed import *
+from nielsenTools.functions import clean, _clean_cached
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def clean_original(string):
+    """clean() as it was before the fast path and cache were added"""
+    if string is None or not string: return None
+    string = re.sub(r'[\u0022\u055A\u05F4\u2018-\u201F\u275B-\u275E\uFF07]', '\'', string)
+    string = re.sub(r'[\u0000-\u001F\u0080-\u009F\u2028\u2029]+', '', string)
+    string = re.sub(r'^[:;/\s\?\$\.,\\\]\)}]|[;/\s\$\.,\\\[\({]+$', '', string.strip())
+    string = re.sub(r'\s+', ' ', string).strip()
+    if string is None or not string: return None
+    return unicodedata.normalize('NFC', string)
+
+
+def measure(function, values):
+    start = time.perf_counter()
+    for value in values:
+        function(value)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    rows, seed = 2000, 1
+    try: opts, args = getopt.getopt(argv, 'r:s:', ['rows=', 'seed='])
+    except getopt.GetoptError as err:
+        print('Error: {}'.format(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ['-r', '--rows']: rows = int(arg)
+        elif opt in ['-s', '--seed']: seed = int(arg)
+
+    feed = feed_rows('product', rows, seed)
+    next(feed)
+    values = [value for row in feed for value in row]
+    values.extend(value + ' ' for value in values[:len(values) // 10])
+
+    mismatches = sum(1 for value in values if clean(value) != clean_original(value))
+    print('{} values ({} distinct), {} mismatches'.format(str(len(values)), str(len(set(values))), str(mismatches)))
+
+    _clean_cached.cache_clear()
+    base = measure(clean_original, values)
+    fast = measure(clean, values)
+    print('{:<20}{:>12.0f} values/sec'.format('original', len(values) / base))
+    print('{:<20}{:>12.0f} values/sec'.format('clean', len(values) / fast))
+    print('Speed-up: {:.2f}x'.format(base / fast))
+    info = _clean_cached.cache_info()
+    print('Cache: {} hits, {} misses'.format(str(info.hits), str(info.misses)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark comparing isbn_tools.normalise_isbns with and without numpy.
+
+Usage: python benchmarks/benchmark_isbn.py [-r <rows>] [-s <seed>]
+
+ISBNs are generated as in synthetic_feed.py: a mixture of ISBN-13s, hyphenated and qualified ISBN-10s,
+and invalid ISBNs. Both paths are checked to give the same output for every ISBN."""
+
+# Import required modules
+import getopt
+import random
+import sys
+import time
+
+from synthetic_feed import *
+import nielsenTools.isbn_tools as isbn_tools
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def isbn_values(rows, seed):
+    rnd = random.Random(seed)
+    values = []
+    for n in range(rows):
+        isbn = isbn13(rnd.randint(0, 999999999))
+        choice = rnd.random()
+        if choice < 0.5: values.append(isbn)
+        elif choice < 0.7: values.append(isbn_tools.isbn13_convert(isbn))
+        elif choice < 0.8:
+            isbn10 = isbn_tools.isbn13_convert(isbn)
+            values.append('{}-{}-{}-{} (pbk.)'.format(isbn10[0], isbn10[1:4], isbn10[4:9], isbn10[9]))
+        elif choice < 0.9: values.append(isbn[:-1] + str((int(isbn[-1]) + 1) % 10))
+        else: values.append(isbn[:rnd.randint(0, 12)])
+    return values
+
+
+def scalar(values):
+    """normalise_isbns without numpy"""
+    np, isbn_tools.np = isbn_tools.np, None
+    try: return isbn_tools.normalise_isbns(values)
+    finally: isbn_tools.np = np
+
+
+def measure(function, values):
+    start = time.perf_counter()
+    function(values)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    rows, seed = 1000000, 1
+    try: opts, args = getopt.getopt(argv, 'r:s:', ['rows=', 'seed='])
+    except getopt.GetoptError as err:
+        print('Error: {}'.format(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ['-r', '--rows']: rows = int(arg)
+        elif opt in ['-s', '--seed']: seed = int(arg)
+    if isbn_tools.np is None:
+        print('Error: numpy is not installed')
+        sys.exit(2)
+
+    values = isbn_values(rows, seed)
+    batch, expected = isbn_tools.normalise_isbns(values), scalar(values)
+    mismatches = sum(1 for field in isbn_tools.IsbnBatch._fields
+                     for a, b in zip(getattr(batch, field).tolist(), getattr(expected, field)) if a != b)
+    print('{} ISBNs ({} valid), {} mismatches'.format(str(len(values)), str(sum(expected.valid)), str(mismatches)))
+
+    base = measure(scalar, values)
+    fast = measure(isbn_tools.normalise_isbns, values)
+    print('{:<20}{:>12.0f} ISBNs/sec'.format('scalar', len(values) / base))
+    print('{:<20}{:>12.0f} ISBNs/sec'.format('numpy', len(values) / fast))
+    print('Speed-up: {:.2f}x'.format(base / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark comparing csv.DictReader with TSVReader for reading Nielsen TSV files.
+
+Usage: python benchmarks/benchmark_tsv_reader.py [-i <input file>] [-r <rows>] [-c <columns>]
+
+If no input file is given, a synthetic file with the given number of rows and columns is created."""
+
+# Import required modules
+import csv
+import getopt
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from nielsenTools.tsv_tools import *
+
+csv.field_size_limit(2147483647)
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def synthetic_file(path, rows, columns):
+    """Function to write a synthetic TSV file resembling a Nielsen product file"""
+    random.seed(1)
+    fieldnames = ['ISBN13'] + ['COL{}'.format(str(i)) for i in range(columns - 1)]
+    words = ['Alpha', 'Beta Gamma', 'Delta', '', '', '', '"Quoted" title', 'Café']
+    with open(path, mode='w', encoding='utf-8', newline='') as ofile:
+        ofile.write('\t'.join(fieldnames) + '\r\n')
+        for n in range(rows):
+            ofile.write('\t'.join(['978{n:010d}'.format(n=n)] + [random.choice(words) for i in range(columns - 1)]) + '\r\n')
+    return fieldnames
+
+
+def read_dictreader(path, keys, keep=0):
+    ifile = open(path, mode='r', encoding='utf-8', errors='replace', newline='')
+    count, kept = 0, []
+    for row in csv.DictReader(ifile, delimiter='\t'):
+        for key in keys:
+            row[key]
+        if count < keep: kept.append(row)
+        count += 1
+    ifile.close()
+    return count, kept
+
+
+def read_tsvreader(path, keys, keep=0):
+    ifile = open(path, mode='rb')
+    count, kept = 0, []
+    for row in TSVReader(ifile):
+        for key in keys:
+            row[key]
+        if count < keep: kept.append(row)
+        count += 1
+    ifile.close()
+    return count, kept
+
+
+def measure(function, path, keys, keep=1000):
+    """Function to return (rows, seconds, bytes allocated per row, peak memory) for a reader function.
+
+    Bytes per row are measured by keeping the first rows read in memory."""
+    start = time.perf_counter()
+    count, kept = function(path, keys)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    count, kept = function(path, keys, keep)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, seconds, current / max(len(kept), 1), peak
+
+
+def main(argv=None):
+    if argv is None:
+        name = sys.argv[0]
+        argv = sys.argv[1:]
+    input_path, rows, columns = None, 20000, 400
+    try: opts, args = getopt.getopt(argv, 'i:r:c:', ['input_path=', 'rows=', 'columns='])
+    except getopt.GetoptError as err:
+        print('Error: {}'.format(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ['-i', '--input_path']: input_path = arg
+        elif opt in ['-r', '--rows']: rows = int(arg)
+        elif opt in ['-c', '--columns']: columns = int(arg)
+
+    temp = None
+    if not input_path:
+        temp = tempfile.NamedTemporaryFile(suffix='.add', delete=False)
+        temp.close()
+        input_path = temp.name
+        print('Creating synthetic file with {} rows and {} columns ...'.format(str(rows), str(columns)))
+        synthetic_file(input_path, rows, columns)
+
+    with open(input_path, mode='rb') as ifile:
+        fieldnames = TSVReader(ifile).fieldnames
+    # Access a handful of columns from each row, as the Nielsen classes do
+    keys = fieldnames[::max(len(fieldnames) // 20, 1)]
+
+    results = {}
+    for label, function in [('csv.DictReader', read_dictreader), ('TSVReader', read_tsvreader)]:
+        results[label] = measure(function, input_path, keys)
+        count, seconds, per_row, peak = results[label]
+        print('{:<16}{:>10} rows{:>12.0f} rows/sec{:>12.0f} bytes/row{:>10.1f} MB peak'.format(
+            label, count, count / seconds if seconds else 0, per_row, peak / 1048576))
+    base, fast = results['csv.DictReader'], results['TSVReader']
+    if fast[1]: print('Speed-up: {:.2f}x'.format(base[1] / fast[1]))
+    if fast[2]: print('Memory per row reduction: {:.2f}x'.format(base[2] / fast[2]))
+
+    if temp: os.remove(input_path)
+
+
+if __name__ == '__main__':
+    main()
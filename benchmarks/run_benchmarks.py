@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark suite for the Nielsen converters and database ingestion.
+
+Usage: python benchmarks/run_benchmarks.py [-r <rows>] [-s <seed>] [-w <workers>] [-o <results.json>] [-c <previous.json>]
+
+Synthetic Nielsen files are generated with synthetic_feed.py (in this folder). Each benchmark is run in a fresh process,
+and reports rows per second, peak resident memory and timings for each stage.
+Results are written as JSON (with the current git commit, if known) so that runs can be compared across commits:
+use -c to compare with the results of a previous run."""
+
+# Import required modules
+import datetime
+import getopt
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+try: import resource
+except ImportError: resource = None
+
+# database_tools is imported before anything which imports nielsen_tools, as in nielsen_isbn_analysis
+import nielsenTools.database_tools as database_tools
+from synthetic_feed import *
+from nielsenTools.conversion_tools import *
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Constants
+# ====================
+
+
+# Database ingestion modes, and the IsbnDatabase methods which implement them
+DATABASE_MODES = {
+    'product': 'add_nielsen_product',
+    'organisation': 'add_nielsen_org',
+    'cluster': 'add_nielsen',
+}
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def peak_rss():
+    """Function to return the peak resident memory of the current process in MB, or None if it is not available"""
+    if resource is None: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return rss / 1048576 if sys.platform == 'darwin' else rss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+
+def quietly(function, *args, **kwargs):
+    """Function to call a function with its progress messages suppressed"""
+    with open(os.devnull, mode='w') as devnull, redirect_stdout(devnull):
+        return function(*args, **kwargs)
+
+
+def bench_stages(conversion_type, input_file, work_dir, workers=1):
+    """Function to time each stage of converting a file: reading rows, building records, serializing and writing"""
+    convert = CONVERSIONS[conversion_type]
+    stages = dict.fromkeys(['read', 'build', 'serialize', 'write'], 0.0)
+    rows = 0
+    clock = time.perf_counter
+    with open(input_file, mode='rb') as ifile, open(os.path.join(work_dir, 'stages.lex'), mode='wb') as ofile, \
+            open(os.devnull, mode='w') as devnull, redirect_stdout(devnull):
+        writer = MARCWriter(ofile)
+        reader = TSVReader(ifile)
+        columns = reader.columns
+        iterator = iter(reader)
+        while True:
+            start = clock()
+            try: row = next(iterator)
+            except StopIteration: break
+            t1 = clock()
+            record = convert(row, STATUS_CODES['add'], columns)[0]
+            t2 = clock()
+            marc = record.as_marc()
+            t3 = clock()
+            writer.write(marc)
+            t4 = clock()
+            stages['read'] += t1 - start
+            stages['build'] += t2 - t1
+            stages['serialize'] += t3 - t2
+            stages['write'] += t4 - t3
+            rows += 1
+    return rows, stages
+
+
+def bench_conversion(conversion_type, input_file, work_dir, workers=1):
+    """Function to time a complete conversion with convert_files, after timing its stages separately"""
+    rows, stages = bench_stages(conversion_type, input_file, work_dir)
+    output_path = os.path.join(work_dir, 'output')
+    os.makedirs(output_path)
+    start = time.perf_counter()
+    quietly(convert_files, conversion_type, os.path.dirname(input_file), output_path, workers=workers)
+    stages['total'] = time.perf_counter() - start
+    return rows, stages
+
+
+def bench_database(conversion_type, input_file, work_dir, workers=1):
+    """Function to time adding a file to a new ISBN database"""
+    database_tools.DATABASE_PATH = os.path.join(work_dir, 'isbns.db')
+    with open(input_file, mode='rb') as ifile:
+        rows = sum(1 for values in TSVReader(ifile).iter_values())
+    stages = {}
+    start = time.perf_counter()
+    db = quietly(database_tools.IsbnDatabase)
+    stages['connect'] = time.perf_counter() - start
+    start = time.perf_counter()
+    quietly(getattr(db, DATABASE_MODES[conversion_type]), os.path.dirname(input_file))
+    stages['ingest'] = time.perf_counter() - start
+    db.close()
+    stages['total'] = stages['connect'] + stages['ingest']
+    return rows, stages
+
+
+BENCHMARKS = {
+    'convert': bench_conversion,
+    'database': bench_database,
+}
+
+
+def run_case(args):
+    """Function to run a single benchmark in a worker process, returning its results as a dictionary"""
+    benchmark, conversion_type, input_file, workers = args
+    work_dir = tempfile.mkdtemp(prefix='nielsen_benchmark_')
+    try:
+        rows, stages = BENCHMARKS[benchmark](conversion_type, input_file, work_dir, workers)
+    finally: shutil.rmtree(work_dir, ignore_errors=True)
+    seconds = stages['total']
+    return {'name': '{}_{}'.format(benchmark, conversion_type), 'benchmark': benchmark, 'type': conversion_type,
+            'rows': rows, 'seconds': round(seconds, 4), 'rows_per_sec': round(rows / seconds, 1) if seconds else None,
+            'peak_rss_mb': round(peak_rss(), 1) if resource else None,
+            'stages': {stage: round(value, 4) for stage, value in stages.items()}}
+
+
+def run_benchmarks(rows=10000, seed=1, workers=1):
+    """Function to generate synthetic feeds and run every benchmark, returning the results as a dictionary"""
+    feed_dir = tempfile.mkdtemp(prefix='nielsen_feed_')
+    results = {'commit': git_commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'platform': platform.platform(),
+               'rows': rows, 'seed': seed, 'workers': workers, 'results': []}
+    # A new process is used for each benchmark, so that peak memory is measured separately
+    context = multiprocessing.get_context('spawn')
+    try:
+        for conversion_type in FEED_TYPES:
+            # Each feed is written to its own folder, since the converters process every file in a folder
+            input_path = os.path.join(feed_dir, conversion_type)
+            os.makedirs(input_path)
+            input_file = write_feed(conversion_type, input_path, rows, seed)
+            for benchmark in BENCHMARKS:
+                with context.Pool(1, maxtasksperchild=1) as pool:
+                    result = pool.apply(run_case, ((benchmark, conversion_type, input_file, workers),))
+                results['results'].append(result)
+                print_result(result)
+    finally: shutil.rmtree(feed_dir, ignore_errors=True)
+    return results
+
+
+def print_result(result, previous=None):
+    line = '{:<24}{:>8} rows{:>12.0f} rows/sec'.format(result['name'], result['rows'], result['rows_per_sec'] or 0)
+    if result['peak_rss_mb'] is not None: line += '{:>10.1f} MB peak'.format(result['peak_rss_mb'])
+    if previous and previous.get('rows_per_sec') and result['rows_per_sec']:
+        line += '{:>+9.1%} vs previous'.format(result['rows_per_sec'] / previous['rows_per_sec'] - 1)
+    print(line)
+    print('    ' + '  '.join('{} {:.3f}s'.format(stage, value) for stage, value in result['stages'].items()))
+
+
+def compare(results, previous):
+    """Function to print the results of this run alongside those of a previous run"""
+    print('\nComparison with commit {} ({}):'.format(previous.get('commit'), previous.get('date')))
+    before = {result['name']: result for result in previous.get('results', [])}
+    for result in results['results']:
+        print_result(result, before.get(result['name']))
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    rows, seed, workers, output_file, previous_file = 10000, 1, 1, None, None
+    try: opts, args = getopt.getopt(argv, 'r:s:w:o:c:', ['rows=', 'seed=', 'workers=', 'output=', 'compare='])
+    except getopt.GetoptError as err:
+        print('Error: {}'.format(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ['-r', '--rows']: rows = int(arg)
+        elif opt in ['-s', '--seed']: seed = int(arg)
+        elif opt in ['-w', '--workers']: workers = int(arg)
+        elif opt in ['-o', '--output']: output_file = arg
+        elif opt in ['-c', '--compare']: previous_file = arg
+
+    print('Running benchmarks with {} rows per file (seed {}) ...'.format(str(rows), str(seed)))
+    results = run_benchmarks(rows, seed, workers)
+    if previous_file:
+        with open(previous_file, mode='r', encoding='utf-8') as ifile:
+            compare(results, json.load(ifile))
+    if output_file:
+        with open(output_file, mode='w', encoding='utf-8') as ofile:
+            json.dump(results, ofile, indent=2)
+        print('Results written to {}'.format(output_file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Seeded generator for synthetic Nielsen TSV files, used for benchmarking.
+
+Usage: python benchmarks/synthetic_feed.py -o <output_path> [-t <type>] [-r <rows>] [-s <seed>] [--status <status>]
+
+Files are created for products, organisations and clusters (or just the type given by -t),
+using the column families found in real Nielsen files. The same seed always produces the same files."""
+
+# Import required modules
+import getopt
+import os
+import random
+import sys
+
+from nielsenTools.nielsen_tools import *
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Constants
+# ====================
+
+
+FEED_TYPES = ['product', 'organisation', 'cluster']
+
+# Proportion of optional values left empty, as in real Nielsen files
+EMPTY_RATE = 0.45
+
+PRODUCT_COLUMNS = [
+    'ISBN13', 'FTS', 'LA', 'TL', 'ST', 'PVNO1', 'PT1', 'PVNO2', 'PT2', 'YS', 'EDSL', 'EDSS', 'EDN',
+    'PFC', 'PFCT', 'COP', 'POP', 'IMPN', 'PUBN', 'IMPID', 'PUBID', 'PUBPD', 'CY', 'REISD', 'PUBST', 'PUBSC',
+    'ILL', 'PAG', 'PAGNUM', 'HMM', 'SN', 'NWS', 'ISSN', 'KEYWORDS', 'PRODCT', 'PRODCC', 'IA', 'RA',
+    'NBDLD', 'NBDFLD', 'NBDTOC', 'NBDBIOG', 'NBDREV', 'TS', 'REPIS13', 'EPRIS13', 'CBMCCODE', 'CIS']
+NUMBERED_PRODUCT_COLUMNS = [
+    'CR', 'CRT', 'CCI', 'ICTBN', 'ICFN', 'ICKN', 'ICKNS', 'ICCY',
+    'LC', 'LT', 'NAC', 'OAC', 'OAT', 'PFD', 'PCTC', 'PCTCT',
+    'BIC2SC', 'BIC2ST', 'BIC2QC', 'BIC2QT', 'BISACC', 'BISACT', 'THEMASC', 'THEMAST', 'THEMAQC', 'THEMAQT',
+    'DEWEY', 'DEWS', 'LOCC', 'LOCSH', 'PFFT', 'PFFTT', 'PWU', 'PWTT', 'CIID', 'OTHERNBDAA', 'OTHERNBDEAD',
+    'RII', 'RIIT', 'RIT', 'RIITN', 'RPI', 'RPIT', 'RPT', 'RPITN', 'RWI', 'RWIT', 'RWT', 'RWITN']
+AREA_PRODUCT_COLUMNS = ['NBDEAD', 'NBDPAC', 'NBDPAT']
+PRICE_COLUMNS = ['CCPRC', 'CCPTC', 'CCPRRRP', 'CCPRPN', 'CCPRPTOP', 'CCPRA']
+
+ORGANISATION_COLUMNS = ['ORGID', 'ORGN', 'ORGAL1', 'ORGAL2', 'ORGAL3', 'ORGAT', 'ORGACOS', 'ORGAPC', 'ORGCTRY',
+                        'ORGPA', 'ORGCP', 'ORGGA', 'ORGCGD', 'ORGCGN', 'ORGVAT', 'ORGEDI', 'ORGPREF',
+                        'ORGREFN', 'ORGPREVN', 'ORGWAS', 'UKAORGSN', 'USAORGSN', 'AUSAORGSN', 'WWWAORGSN', 'OTHERAORGSN']
+
+WORDS = ['history', 'Fiction', 'biography', 'poetry', 'the', 'of', 'and', 'London', 'war', 'garden', 'Café',
+         'children', '"quoted"', 'Introduction', 'science', 'Dragon', 'sea', '‘single’', 'volume']
+FORENAMES = ['John', 'J.K.', 'Mary Ann', 'Li', 'Ángel', 'Siobhán', 'A.B.']
+SURNAMES = ['Smith', 'Rowling', "O'Brien", 'Zhang', 'Nakamura', 'de la Cruz', 'Müller']
+CONTRIBUTOR_ROLES = ['A01', 'A01', 'A01', 'B01', 'A12', 'B06']
+PRODUCT_FORMS = ['BB', 'BC', 'BC', 'AC', 'DG', 'VI', 'CB', 'PI', 'EA', 'ZZ']
+COUNTRIES = ['United Kingdom', 'United Kingdom', 'United States', 'France', 'Australia']
+SUBJECTS = [('FA', 'Modern & contemporary fiction'), ('FF', 'Crime & mystery'), ('DC', 'Poetry'),
+            ('BG', 'Biography: general'), ('YFB', "Children's fiction")]
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def isbn13(n):
+    """Function to return a valid ISBN-13 in the 978 range for an integer"""
+    digits = '978{:09d}'.format(n % 1000000000)
+    check = (10 - sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(digits)) % 10) % 10
+    return digits + str(check)
+
+
+def words(rnd, low=1, high=6):
+    return ' '.join(rnd.choice(WORDS) for i in range(rnd.randint(low, high)))
+
+
+def product_fieldnames():
+    """Function to return the columns of a synthetic product file"""
+    fieldnames = list(PRODUCT_COLUMNS)
+    for i in range(1, 10):
+        fieldnames.extend('{}{}'.format(prefix, str(i)) for prefix in NUMBERED_PRODUCT_COLUMNS)
+    for c in DISTRIBUTION_AREAS:
+        fieldnames.extend('{}{}'.format(c, column) for column in AREA_PRODUCT_COLUMNS)
+        fieldnames.extend(DISTRIBUTOR_PREFIXES[c][:2])
+    for cur in sorted(set(DISTRIBUTION_AREAS[c][1] for c in DISTRIBUTION_AREAS)):
+        fieldnames.extend('{}{}'.format(cur, column) for column in PRICE_COLUMNS)
+    return fieldnames
+
+
+def product_value(rnd, name, n):
+    """Function to return a synthetic value for a column of a product file"""
+    if name == 'ISBN13': return isbn13(n)
+    if name == 'PFC': return rnd.choice(PRODUCT_FORMS)
+    if name in ('TL', 'PUBN', 'IMPN'): return words(rnd).title()
+    if rnd.random() < EMPTY_RATE: return ''
+    prefix = name.rstrip('123456789')
+    if name[-1].isdigit() and name[-1] != '1' and rnd.random() < 0.6: return ''
+    if prefix == 'CR': return rnd.choice(CONTRIBUTOR_ROLES)
+    if prefix == 'ICFN': return rnd.choice(FORENAMES)
+    if prefix == 'ICKN': return rnd.choice(SURNAMES)
+    if prefix == 'CCI': return rnd.choice(['N', 'N', 'Y'])
+    if prefix in ('LC', 'NAC', 'OAC'): return rnd.choice(['eng', 'eng', 'fre', 'ger', 'spa'])
+    if prefix in ('LT', 'OAT'): return rnd.choice(['English', 'French', 'German, Spanish'])
+    if prefix in ('BIC2SC', 'THEMASC', 'BISACC'): return rnd.choice(SUBJECTS)[0]
+    if prefix in ('BIC2ST', 'THEMAST', 'BISACT'): return rnd.choice(SUBJECTS)[1]
+    if prefix in ('RII', 'RPI', 'REPIS13', 'EPRIS13'): return isbn13(rnd.randint(1, n + 1000))
+    if prefix == 'RWI': return str(rnd.randint(100000, 999999))
+    if prefix in ('RIIT', 'RPIT'): return rnd.choice(['15', '15', '03'])
+    if prefix == 'RWIT': return '01'
+    if prefix == 'RWITN': return 'Biblio Work ID'
+    if prefix in ('RIT', 'RPT'): return rnd.choice(['06', '13', '27', '01'])
+    if prefix == 'RWT': return '01'
+    if prefix == 'DEWEY': return rnd.choice(['823.914', '941.08', '398.2'])
+    if prefix == 'PFFT': return rnd.choice(['01', '05', '09'])
+    if prefix in ('PCTC',): return rnd.choice(['10', '07', '09'])
+    if name in ('PUBPD', 'CY', 'REISD') or name.endswith('NBDEAD'): return rnd.choice(['20190101', '2005', '19991231'])
+    if name.endswith('NBDPAC'): return rnd.choice(['IP', 'OP', 'NP', 'TU'])
+    if name.endswith('CCPRC'): return name[:3]
+    if name.endswith('CCPTC'): return '02'
+    if name.endswith('CCPRRRP'): return '{:07.2f}'.format(rnd.uniform(1, 80))
+    if name in ('COP', 'POP'): return rnd.choice(COUNTRIES)
+    if name in ('EDN', 'PVNO1', 'PVNO2'): return str(rnd.randint(1, 5))
+    if name in ('HMM', 'PAGNUM'): return str(rnd.randint(48, 900))
+    if name.startswith('NBD'): return '<p>{}</p>'.format(words(rnd, 20, 120))
+    return words(rnd, 1, 4)
+
+
+def organisation_fieldnames():
+    """Function to return the columns of a synthetic organisation file"""
+    fieldnames = list(ORGANISATION_COLUMNS)
+    for column in sorted(ORG_FIELDS_REPEATABLE):
+        fieldnames.extend('{}{}'.format(column, str(i)) for i in range(1, 5))
+    return fieldnames
+
+
+def organisation_value(rnd, name, n):
+    """Function to return a synthetic value for a column of an organisation file"""
+    if name == 'ORGID': return str(100000 + n)
+    if name == 'ORGN': return '{} {}'.format(words(rnd, 1, 3).title(), rnd.choice(['Press', 'Books', 'Publishing Ltd']))
+    if rnd.random() < EMPTY_RATE: return ''
+    if name in ('ORGPA', 'ORGCP', 'ORGGA'): return rnd.choice(['N', 'N', 'N', 'Y'])
+    if name == 'ORGCTRY': return rnd.choice(COUNTRIES)
+    if name == 'ORGCGD': return '20190101'
+    if name.startswith('ORGEMAIL'): return 'info{}@example.com'.format(str(n))
+    if name.startswith('ORGURL'): return 'http://www.example.com/{}'.format(str(n))
+    if name.startswith(('ORGTEL', 'ORGFAX', 'ORGMOB', 'ORGTELX')): return '0{}'.format(str(rnd.randint(1000000000, 1999999999)))
+    if name in ORG_FIELDS_MULTIVALUED: return ';'.join(words(rnd, 1, 3).title() for i in range(rnd.randint(1, 3)))
+    return words(rnd, 1, 3)
+
+
+def cluster_fieldnames():
+    """Function to return the columns of a synthetic cluster file"""
+    fieldnames = ['ISBN13']
+    for i in range(1, 10):
+        for prefixes in RELATED_PRODUCT_PREFIXES:
+            fieldnames.extend('{}{}'.format(prefix, str(i)) for prefix in prefixes)
+    return fieldnames
+
+
+def cluster_values(rnd, fieldnames, n):
+    """Function to return a row of a cluster file.
+
+    ISBNs are grouped into works of one to four formats; each row lists the other formats of its work
+    as related ISBNs, and the work itself as a related work."""
+    work, position = divmod(n, 4)
+    size = 1 + work % 4
+    row = dict.fromkeys(fieldnames, '')
+    row['ISBN13'] = isbn13(work * 4 + position % size)
+    related = [isbn13(work * 4 + j) for j in range(size) if j != position % size]
+    for i, isbn in enumerate(related, start=1):
+        row['RII{}'.format(i)] = isbn
+        row['RIIT{}'.format(i)] = '15'
+        row['RIT{}'.format(i)] = rnd.choice(['06', '06', '13', '27'])
+    row['RWI1'], row['RWIT1'], row['RWT1'], row['RWITN1'] = str(1000000 + work), '01', '01', 'Biblio Work ID'
+    return [row[name] for name in fieldnames]
+
+
+def feed_rows(conversion_type, rows, seed=1):
+    """Generator yielding the header and then each row of a synthetic feed, as lists of values"""
+    rnd = random.Random('{}:{}'.format(conversion_type, str(seed)))
+    if conversion_type == 'product': fieldnames, value = product_fieldnames(), product_value
+    elif conversion_type == 'organisation': fieldnames, value = organisation_fieldnames(), organisation_value
+    elif conversion_type == 'cluster': fieldnames, value = cluster_fieldnames(), None
+    else: raise ValueError('Unknown feed type {}'.format(conversion_type))
+    yield fieldnames
+    for n in range(1, rows + 1):
+        if value is None: yield cluster_values(rnd, fieldnames, n)
+        else: yield [value(rnd, name, n) for name in fieldnames]
+
+
+def write_feed(conversion_type, output_path, rows, seed=1, status='add'):
+    """Function to write a synthetic Nielsen TSV file, returning its path"""
+    path = os.path.join(output_path, 'synthetic_{}.{}'.format(conversion_type, status))
+    with open(path, mode='w', encoding='utf-8', newline='') as ofile:
+        for values in feed_rows(conversion_type, rows, seed):
+            ofile.write('\t'.join(v.replace('\t', ' ') for v in values) + '\r\n')
+    return path
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    output_path, feed_types, rows, seed, status = None, FEED_TYPES, 10000, 1, 'add'
+    try: opts, args = getopt.getopt(argv, 'o:t:r:s:', ['output_path=', 'type=', 'rows=', 'seed=', 'status='])
+    except getopt.GetoptError as err:
+        print('Error: {}'.format(err))
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ['-o', '--output_path']: output_path = arg
+        elif opt in ['-t', '--type']: feed_types = [arg]
+        elif opt in ['-r', '--rows']: rows = int(arg)
+        elif opt in ['-s', '--seed']: seed = int(arg)
+        elif opt == '--status': status = arg
+    if not output_path or not os.path.isdir(output_path):
+        print('Error: Invalid path to output files')
+        sys.exit(2)
+    for feed_type in feed_types:
+        print('Writing {}'.format(write_feed(feed_type, output_path, rows, seed, status)))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,9 @@
 
 # Import required modules
 import getopt
+import multiprocessing
 from nielsenTools.nielsen_tools import *
+from nielsenTools.conversion_tools import *
 
 # Set threshold for garbage collection (helps prevent the program run out of memory)
 gc.set_threshold(400, 5, 5)
@@ -22,142 +24,6 @@ __status__ = '4 - Beta Development'
 
 MAX_RECORDS_PER_FILE = 2000000
 
-# ====================
-#      Classes
-# ====================
-
-class NielsenCSVProducts:
-
-    def __init__(self, csv_row, status):
-        self.row = csv_row
-        self.status = status
-        self.values = {}
-        for v in ['ISBN13', 'FTS']:
-            try: self.values[v] = clean(self.row[v])
-            except: self.values[v] = None
-        if not self.values['ISBN13']: self.values['ISBN13'] = '[NO RECORD IDENTIFIER]'
-
-    def record_id(self):
-        if self.values['ISBN13'] and self.values['ISBN13'] != '[NO RECORD IDENTIFIER]':
-            return self.values['ISBN13']
-        return None
-
-    def marc(self):
-
-        # Leader (NR)
-        record = Record(leader='     {}am a22     2  4500'.format(self.status))
-
-        # 001 - Control Number
-        record.add_field(Field(tag='001', data=self.values['ISBN13']))
-
-        # 003 - Control Number Identifier (NR)
-        record.add_field(Field(tag='003', data='UK-WkNB'))
-
-        # 005 - Date and Time of Latest Transaction (NR)
-        record.add_field(Field(tag='005', data='{}.0'.format(datetime.datetime.now().strftime('%Y%m%d%H%M%S'))))
-
-        # 007 - Physical Description Fixed Field-General Information (R)
-
-        # 008 - Fixed-Length Data Elements-General Information (NR)
-        # 00-05 - Date entered on file
-        data = datetime.datetime.now().strftime('%y%m%d')
-        # 06 - Type of date/Publication status
-        # 07-10 - Date 1
-        # 11-14 - Date 2
-        data += 'nuuuuuuuu'
-        # 15-17 - Place of publication, production, or execution
-        data += 'xx '
-        data += '|||||||||||||||||'
-        # 35-37 - Language
-        data += '   '
-        # 38 - Modified record
-        data += '|'
-        # 39 - Cataloging source
-        data += ' '
-        record.add_field(Field(tag='008', data=data))
-
-        # 020 - International Standard Book Number (R)
-        try: v = clean(re.sub(r'[^0-9X]', '', self.row['ISBN13'].upper()))
-        except: v = None
-        if v: record.add_field(Field('020', [' ', ' '], ['a', v]))
-
-        cluster = NielsenCluster(self.row)
-        for isbn in cluster.isbns:
-            if ':' not in isbn:
-                record.add_field(Field('020', [' ', ' '], ['z', isbn]))
-
-        for isbn in cluster.isbns:
-            if ':' in isbn:
-                identifier_type, identifier = isbn.split(':', 1)
-                record.add_field(Field('024', ['7', ' '], ['a', identifier, '2', identifier_type]))
-
-        # 100 - Main Entry-Personal Name (NR)
-        names = set()
-        for i in range(1, 10):
-            name = ContribName(i, self.row)
-            if str(name) != '':
-                names.add(name)
-
-        authors = [str(n) for n in names if n.role == 'author']
-        if len(authors) > 1: resp = ', '.join(authors[:-1]) + ' and ' + authors[-1]
-        elif authors: resp = authors[0]
-        else: resp = ''
-
-        editors = [str(n) for n in names if n.role == 'editor']
-        if len(editors) > 1: resp += ' ; edited by ' + ', '.join(editors[:-1]) + ' and ' + editors[-1]
-        elif editors: resp += ' ; edited by ' + editors[0]
-
-        others = [clean('{} {}'.format(n.role, str(n))) for n in names if n.role not in ['author', 'editor']]
-        resp += ' ; '.join(others)
-
-        if resp != '': resp = clean(resp) + '.'
-
-        authors = [n for n in names if n.role == 'author']
-        if authors:
-            author = authors[0]
-            record.add_field(author.as_marc())
-            authors.remove(author)
-
-        # 245 - Title Statement (NR)
-        # LA    Leading Article of Title. Usually A or The
-        # TL    Main text of Title
-        # ST    Subtitle of text
-        # PVNO* Volume or Part number
-        # PT*   Title of this volume or part
-        # YS    Year Statement
-        try: TL = clean(self.row['FTS'])
-        except: TL = None
-        if not TL: TL = '[TITLE NOT PROVIDED]'
-        if resp: TL += ' /'
-        else: TL += '.'
-        subfields = ['a', TL]
-        if resp: subfields.extend(['c', resp])
-        indicators = ['1' if resp else '0', '0']
-        record.add_field(Field('245', indicators, subfields))
-
-        # 700 - Added Entry-Personal Name (R)
-        for name in authors:
-            record.add_field(name.as_marc(tag_start='7'))
-
-        editors = [n for n in names if n.role == 'editor']
-        for name in editors:
-            record.add_field(name.as_marc(tag_start='7'))
-
-        others = [n for n in names if n.role not in ['author', 'editor']]
-        for name in others:
-            record.add_field(name.as_marc(tag_start='7'))
-
-        # 787 - Other Relationship Entry (R)
-        for isbn, relationship in cluster.related:
-            record.add_field(Field('787', ['1', ' '], ['i', relationship, 'z', isbn.isbn]))
-
-        record.add_field(Field('FMT', [' ', ' '], ['a', 'BK']))
-
-        record.add_field(Field('SRC', [' ', ' '], ['a', 'Record converted from Nielsen CSV data to MARC21 by Collection Metadata.']))
-
-        return record
-
-
 # ====================
 #      Main code
 # ====================
@@ -171,6 +37,8 @@ def main(argv=None):
     input_path = os.path.join(dir, 'Input', 'Clusters')
     output_path = os.path.join(dir, 'Output', 'Clusters')
     text_output = False
+    resume = False
+    workers = 1
 
     print('========================================')
     print('nielsen2marc_clusters')
@@ -179,7 +47,7 @@ def main(argv=None):
           'for CLUSTERS to MARC 21 (Bibliographic)\n')
     magician()
 
-    try: opts, args = getopt.getopt(argv, 'i:o:t', ['input_path=', 'output_path=', 'help'])
+    try: opts, args = getopt.getopt(argv, 'i:o:t', ['input_path=', 'output_path=', 'workers=', 'resume', 'help'])
     except getopt.GetoptError as err:
         exit_prompt('Error: {}'.format(err))
     for opt, arg in opts:
@@ -187,6 +55,10 @@ def main(argv=None):
         elif opt in ['-i', '--input_path']: input_path = arg
         elif opt in ['-o', '--output_path']: output_path = arg
         elif opt == '-t': text_output = True
+        elif opt == '--resume': resume = True
+        elif opt == '--workers':
+            try: workers = int(arg)
+            except ValueError: exit_prompt('Error: Number of workers must be an integer')
         else: exit_prompt('Error: Option {} not recognised'.format(opt))
 
     if not input_path:
@@ -197,6 +69,8 @@ def main(argv=None):
         exit_prompt('Error: No path to output files has been specified')
     if not os.path.isdir(output_path):
         exit_prompt('Error: Invalid path to output files')
+    if workers < 1:
+        exit_prompt('Error: Number of workers must be at least 1')
 
     # --------------------
     # Parameters seem OK => start program
@@ -207,71 +81,19 @@ def main(argv=None):
     print('Input folder: {}'.format(input_path))
     print('Output folder: {}'.format(output_path))
     if text_output: print('Text versions of output files will be created')
+    if resume: print('Conversion will resume from the last checkpoint')
+    if workers > 1: print('Records will be converted using {} worker processes'.format(str(workers)))
 
     # --------------------
     # Iterate through input files
     # --------------------
 
-    today = datetime.date.today().strftime("%Y-%m-%d")
-
-    '''
-    ofile = open(os.path.join(output_path, '{n:03d}_cluster_{t}.lex'.format(n=file_count, t=today)), mode='wb')
-    tfile = open(os.path.join(output_path, '{n:03d}_cluster_{t}.txt'.format(n=file_count, t=today)), mode='w', encoding='utf-8', errors='replace')
-    dfile = open(os.path.join(output_path, '_duplicates_{}.txt'.format(today)), mode='w', encoding='utf-8', errors='replace')
-    writer = MARCWriter(ofile)
-    '''
-
-    for s in STATUSES:
-        file_count, record_count = 0, 0
-        ids = set()
-
-        # Open input and output files
-        FILES, WRITERS, file_count = new_files({}, {}, 'cluster', output_path, s, file_count, today, text_output)
-
-        status = {'add': 'n', 'upd': 'c', 'del': 'd'}[s]
-
-        for root, subdirs, files in os.walk(input_path):
-            for file in files:
-                if file.endswith('.{}'.format(s)):
-                    date_time('Processing file {} ...'.format(str(file)))
-
-                    ifile = open(os.path.join(root, file), mode='r', encoding='utf-8', errors='replace', newline='')
-                    i = 0
-
-                    c = csv.DictReader(ifile, delimiter='\t')
-                    for row in c:
-                        i += 1
-                        record_count += 1
-
-                        if record_count % MAX_RECORDS_PER_FILE == 0:
-                            date_time('Starting new output file')
-                            # Start new files
-                            FILES, WRITERS, file_count = new_files(FILES, WRITERS, 'cluster', output_path, s, file_count, today, text_output)
-
-                        if i % 1000 == 0:
-                            print('{} records processed'.format(str(i)), end='\r')
-
-                        nielsen = NielsenCSVProducts(row, status)
-                        marc = nielsen.marc()
-                        record_id = nielsen.record_id()
-                        WRITERS['int'][s].write(marc)
-                        if text_output:
-                            FILES['text'][s].write(str(marc) + '\n')
-                        if record_id:
-                            if record_id in ids:
-                                FILES['dup'][s].write(record_id + '\n')
-                            ids.add(record_id)
-
-                    print('{} records processed'.format(str(i)), end='\r')
-                    ifile.close()
-
-        # Close files
-        for f in ('int', 'uk', 'dup'):
-            FILES[f][s].close()
-        if text_output: FILES['text'][s].close()
+    convert_files('cluster', input_path, output_path, text_output, MAX_RECORDS_PER_FILE, workers, resume)
 
     date_time_exit()
 
 
 if __name__ == '__main__':
+    # Required for worker processes when running as a frozen executable
+    multiprocessing.freeze_support()
     main(sys.argv[1:])
@@ -7,7 +7,9 @@
 
 # Import required modules
 import getopt
+import multiprocessing
 from nielsenTools.nielsen_tools import *
+from nielsenTools.conversion_tools import *
 
 # Set threshold for garbage collection (helps prevent the program run out of memory)
 gc.set_threshold(400, 5, 5)
@@ -36,6 +38,8 @@ def main(argv=None):
     input_path = os.path.join(dir, 'Input', 'Organisations')
     output_path = os.path.join(dir, 'Output', 'Organisations')
     text_output = False
+    resume = False
+    workers = 1
 
     print('========================================')
     print('nielsen2marc_organisations')
@@ -45,7 +49,7 @@ def main(argv=None):
     magician()
 
     try:
-        opts, args = getopt.getopt(argv, 'i:o:t', ['input_path=', 'output_path=', 'help'])
+        opts, args = getopt.getopt(argv, 'i:o:t', ['input_path=', 'output_path=', 'workers=', 'resume', 'help'])
     except getopt.GetoptError as err:
         exit_prompt('Error: {}'.format(err))
     for opt, arg in opts:
@@ -53,6 +57,10 @@ def main(argv=None):
         elif opt in ['-i', '--input_path']: input_path = arg
         elif opt in ['-o', '--output_path']: output_path = arg
         elif opt == '-t': text_output = True
+        elif opt == '--resume': resume = True
+        elif opt == '--workers':
+            try: workers = int(arg)
+            except ValueError: exit_prompt('Error: Number of workers must be an integer')
         else:
             exit_prompt('Error: Option {} not recognised'.format(opt))
 
@@ -64,6 +72,8 @@ def main(argv=None):
         exit_prompt('Error: No path to output files has been specified')
     if not os.path.isdir(output_path):
         exit_prompt('Error: Invalid path to output files')
+    if workers < 1:
+        exit_prompt('Error: Number of workers must be at least 1')
 
     # --------------------
     # Parameters seem OK => start program
@@ -74,72 +84,19 @@ def main(argv=None):
     print('Input folder: {}'.format(input_path))
     print('Output folder: {}'.format(output_path))
     if text_output: print('Text versions of output files will be created')
+    if resume: print('Conversion will resume from the last checkpoint')
+    if workers > 1: print('Records will be converted using {} worker processes'.format(str(workers)))
 
     # --------------------
     # Iterate through input files
     # --------------------
 
-    file_count, record_count = 0, 0
-
-    '''
-    ofile = open(os.path.join(output_path, '{n:03d}_organisation_{t}.lex'.format(n=file_count, t=today)), mode='wb')
-    tfile = open(os.path.join(output_path, '{n:03d}_organisation_{t}.txt'.format(n=file_count, t=today)), mode='w', encoding='utf-8', errors='replace')
-    dfile = open(os.path.join(output_path, '_duplicates_{}.txt'.format(today)), mode='w', encoding='utf-8', errors='replace')
-    writer = MARCWriter(ofile)
-    '''
-
-    for s in STATUSES:
-        file_count, record_count = 0, 0
-        ids = set()
-
-        # Open input and output files
-        FILES, WRITERS, file_count = new_files({}, {}, 'organisation', output_path, s, file_count, today, text_output)
-
-        status = {'add': 'n', 'upd': 'c', 'del': 'd'}[s]
-
-        for root, subdirs, files in os.walk(input_path):
-            for file in files:
-                if file.endswith('.{}'.format(s)):
-                    date_time('Processing file {}'.format(str(file)))
-
-                    ifile = open(os.path.join(root, file), mode='r', encoding='utf-8', errors='replace', newline='')
-                    i = 0
-
-                    c = csv.DictReader(ifile, delimiter='\t')
-                    for row in c:
-                        i += 1
-                        record_count += 1
-
-                        if record_count % MAX_RECORDS_PER_FILE == 0:
-                            date_time('Starting new output file')
-                            # Start new files
-                            FILES, WRITERS, file_count = new_files(FILES, WRITERS, 'cluster', output_path, s, file_count, today,
-                                                       text_output)
-
-                        if i % 1000 == 0:
-                            print('{} records processed'.format(str(i)), end='\r')
-
-                        nielsen = NielsenTSVOrganisations(row, status)
-                        marc = nielsen.marc()
-                        record_id = nielsen.record_id()
-                        WRITERS['int'][s].write(marc)
-                        if text_output:
-                            FILES['text'][s].write(str(marc) + '\n')
-                        if record_id:
-                            if record_id in ids:
-                                FILES['dup'][s].write(record_id + '\n')
-                            ids.add(record_id)
-
-                    print('{} records processed'.format(str(i)), end='\r')
-                    ifile.close()
-
-        # Close files
-        for f in ('int', 'uk', 'dup'):
-            FILES[f][s].close()
-        if text_output: FILES['text'][s].close()
+    convert_files('organisation', input_path, output_path, text_output, MAX_RECORDS_PER_FILE, workers, resume)
 
     date_time_exit()
 
 
 if __name__ == '__main__':
+    # Required for worker processes when running as a frozen executable
+    multiprocessing.freeze_support()
     main(sys.argv[1:])
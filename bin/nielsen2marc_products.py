@@ -8,10 +8,12 @@
 # Import required modules
 import getopt
 import math
+import multiprocessing
 from nielsenTools.isbn_tools import *
 from nielsenTools.nielsen_tools import *
 from nielsenTools.database_tools import *
 from nielsenTools.functions import *
+from nielsenTools.conversion_tools import *
 
 # Set threshold for garbage collection (helps prevent the program run out of memory)
 gc.set_threshold(400, 5, 5)
@@ -40,6 +42,8 @@ def main(argv=None):
     input_path = os.path.join(dir, 'Input', 'Products')
     output_path = os.path.join(dir, 'Output', 'Products')
     text_output = False
+    resume = False
+    workers = 1
 
     print('========================================')
     print('nielsen2marc_products')
@@ -48,7 +52,7 @@ def main(argv=None):
           'for PRODUCTS to MARC 21 (Bibliographic)\n')
     magician()
 
-    try: opts, args = getopt.getopt(argv, 'i:o:t', ['input_path=', 'output_path=', 'help'])
+    try: opts, args = getopt.getopt(argv, 'i:o:t', ['input_path=', 'output_path=', 'workers=', 'resume', 'help'])
     except getopt.GetoptError as err:
         exit_prompt('Error: {}'.format(err))
     for opt, arg in opts:
@@ -56,6 +60,10 @@ def main(argv=None):
         elif opt in ['-i', '--input_path']: input_path = arg
         elif opt in ['-o', '--output_path']: output_path = arg
         elif opt == '-t': text_output = True
+        elif opt == '--resume': resume = True
+        elif opt == '--workers':
+            try: workers = int(arg)
+            except ValueError: exit_prompt('Error: Number of workers must be an integer')
         else: exit_prompt('Error: Option {} not recognised'.format(opt))
 
     if not input_path:
@@ -66,6 +74,8 @@ def main(argv=None):
         exit_prompt('Error: No path to output files has been specified')
     if not os.path.isdir(output_path):
         exit_prompt('Error: Invalid path to output files')
+    if workers < 1:
+        exit_prompt('Error: Number of workers must be at least 1')
 
     # --------------------
     # Parameters seem OK => start program
@@ -76,77 +86,19 @@ def main(argv=None):
     print('Input folder: {}'.format(input_path))
     print('Output folder: {}'.format(output_path))
     if text_output: print('Text versions of output files will be created')
-    if not os.path.exists(os.path.join(output_path, 'UK')):
-        os.makedirs(os.path.join(output_path, 'UK'))
+    if resume: print('Conversion will resume from the last checkpoint')
+    if workers > 1: print('Records will be converted using {} worker processes'.format(str(workers)))
 
     # --------------------
     # Iterate through input files
     # --------------------
 
-    today = datetime.date.today().strftime("%Y-%m-%d")
-
-    '''
-    ofile = open(os.path.join(output_path, '{n:03d}_product_{t}.lex'.format(n=file_count, t=today)), mode='wb')
-    ofileUK = open(os.path.join(output_path, '{n:03d}_product_{t}_UK.lex'.format(n=file_count, t=today)), mode='wb')
-    tfile = open(os.path.join(output_path, '{n:03d}_product_{t}.txt'.format(n=file_count, t=today)), mode='w', encoding='utf-8', errors='replace')
-    dfile = open(os.path.join(output_path, '_duplicates_{}.txt'.format(today)), mode='w', encoding='utf-8', errors='replace')
-    writer = MARCWriter(ofile)
-    writerUK = MARCWriter(ofileUK)
-    '''
-
-    for s in STATUSES:
-
-        file_count, record_count = 0, 0
-        ids = set()
-
-        # Open input and output files
-        FILES, WRITERS, file_count = new_files({}, {}, 'product', output_path, s, file_count, today, text_output)
-        status = {'add': 'n', 'upd': 'c', 'del': 'd'}[s]
-
-        for root, subdirs, files in os.walk(input_path):
-            for file in files:
-                if file.endswith('.{}'.format(s)):
-                    date_time('Processing file {}'.format(str(file)))
-
-                    ifile = open(os.path.join(root, file), mode='r', encoding='utf-8', errors='replace', newline='')
-                    i = 0
-
-                    c = csv.DictReader(ifile, delimiter='\t')
-                    for row in c:
-                        i += 1
-                        record_count += 1
-
-                        if record_count % MAX_RECORDS_PER_FILE == 0:
-                            date_time('Starting new output file')
-                            # Start new files
-                            FILES, WRITERS, file_count = new_files(FILES, WRITERS, 'product', output_path, s, file_count, today, text_output)
-
-                        if i % 1000 == 0:
-                            print('{} records processed'.format(str(i)), end='\r')
-
-                        nielsen = NielsenTSVProducts(row, status)
-                        marc = nielsen.marc()
-                        record_id = nielsen.record_id()
-                        WRITERS['int'][s].write(marc)
-                        if text_output:
-                            FILES['text'][s].write(str(marc) + '\n')
-                        if nielsen.is_uk():
-                            WRITERS['uk'][s].write(marc)
-                        if record_id:
-                            if record_id in ids:
-                                FILES['dup'][s].write(record_id + '\n')
-                            ids.add(record_id)
-
-                    print('{} records processed'.format(str(i)), end='\r')
-                    ifile.close()
-
-        # Close files
-        for f in ('int', 'uk', 'dup'):
-            FILES[f][s].close()
-        if text_output: FILES['text'][s].close()
+    convert_files('product', input_path, output_path, text_output, MAX_RECORDS_PER_FILE, workers, resume)
 
     date_time_exit()
 
 
 if __name__ == '__main__':
+    # Required for worker processes when running as a frozen executable
+    multiprocessing.freeze_support()
     main(sys.argv[1:])
@@ -38,6 +38,7 @@ OPTIONS = OrderedDict([
     # ('T', 'Parse ISBNs from TSV file'),
     ('S', 'Search for ISBNs'),
     ('X', 'eXport graph'),
+    ('A', 'save grAph snapshot for quick searches'),
     ('E', 'Exit program'),
 ])
 
@@ -51,6 +52,7 @@ ACTIONS = {
     # 'T': parse_tsv,
     'S': search_isbns,
     'X': export_graph,
+    'A': export_snapshot,
     'E': sys.exit,
 }
 
@@ -62,7 +64,7 @@ EXTENSIONS = {
     'S': ('.txt',),
 }
 
-NO_INPUT = ['I', 'X', 'E']
+NO_INPUT = ['I', 'X', 'A', 'E']
 
 
 # ====================
@@ -126,6 +128,10 @@ def usage():
         print('    -{}    {}'.format(o.lower(), OPTIONS[o]))
     print('ANY of the following:')
     print('    -c        Check ISBN format conflicts using Google Books API')
+    print('    -g        Store related ISBNs in the database as cluster ids (converts the database if necessary)')
+    print('    -k        Store ISBNs in the database as integers (converts the database if necessary)')
+    print('    -r <file> ISBN range table (RangeMessage.xml, or a JSON copy) used to find publisher prefixes')
+    print('              If not specified, {} will be used if it is present'.format(RANGE_MESSAGE_PATH))
     print('    --help    Display this message and exit')
     print('Option -i is not required with options {}'.format(', '.join(o.lower() for o in NO_INPUT)))
     for o in EXTENSIONS:
@@ -144,6 +150,9 @@ def main(argv=None):
 
     selected_option = None
     skip_check = True
+    range_path = None
+    integer_keys = False
+    cluster_ids = False
 
     dir = os.path.dirname(os.path.realpath(sys.argv[0]))
     input_path = os.path.join(dir, 'Input', 'Nielsen')
@@ -154,14 +163,17 @@ def main(argv=None):
     print('\nThis program analyses data relating to ISBN relationships\n')
     magician()
 
-    try: opts, args = getopt.getopt(argv, 'i:c' + ''.join(o.lower() for o in OPTIONS),
-                                    ['input_path=', 'help'])
+    try: opts, args = getopt.getopt(argv, 'i:r:cgk' + ''.join(o.lower() for o in OPTIONS),
+                                    ['input_path=', 'ranges=', 'cluster_ids', 'integer_keys', 'help'])
     except getopt.GetoptError as err:
         exit_prompt('Error: {}'.format(err))
     for opt, arg in opts:
         if opt == '--help': usage()
         elif opt in ['-i', '--input_path']: input_path = arg
+        elif opt in ['-r', '--ranges']: range_path = arg
         elif opt == '-c': skip_check = False
+        elif opt in ['-g', '--cluster_ids']: cluster_ids = True
+        elif opt in ['-k', '--integer_keys']: integer_keys = True
         elif opt.upper().strip('-') in OPTIONS:
             selected_option = opt.upper().strip('-')
         else: exit_prompt('Error: Option {} not recognised'.format(opt))
@@ -176,6 +188,21 @@ def main(argv=None):
     if not os.path.isfile(DATABASE_PATH):
         exit_prompt('Error: The file {} cannot be found'.format(DATABASE_PATH))
 
+    if range_path and not os.path.isfile(range_path):
+        exit_prompt('Error: The file {} cannot be found'.format(range_path))
+    try: prefix_table = load_prefix_table(range_path)
+    except Exception as err:
+        exit_prompt('Error: Could not read ISBN range table: {}'.format(err))
+    if prefix_table is not None:
+        set_prefix_table(prefix_table)
+        print('Publisher prefixes will be found using the range table {}'.format(prefix_table.source))
+
+    if integer_keys or cluster_ids:
+        db = IsbnDatabase()
+        if integer_keys: db.convert_to_integer_keys()
+        if cluster_ids: db.convert_to_cluster_ids()
+        db.close()
+
     if skip_check: print('ISBN format conflicts will not be checked')
 
     option = OptionHandler(input_path, selected_option, skip_check)
@@ -0,0 +1,444 @@
+#  -*- coding: utf-8 -*-
+
+"""Tools for converting Nielsen files to MARC used within nielsenTools."""
+
+# Import required modules
+import json
+import multiprocessing
+from collections import deque, namedtuple
+from functools import lru_cache
+from nielsenTools.nielsen_tools import *
+from nielsenTools.duplicate_tools import *
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Constants
+# ====================
+
+
+# Number of rows sent to a worker process at a time
+CHUNK_SIZE = 500
+
+# Number of chunks each worker may have queued before the reader waits for the writer
+CHUNKS_PER_WORKER = 4
+
+# Default maximum number of records in each output file
+MAX_RECORDS_PER_FILE = 400000
+
+# Number of records converted between checkpoints
+CHECKPOINT_INTERVAL = 10000
+
+# Nielsen file found within the input folder
+ManifestEntry = namedtuple('ManifestEntry', ['path', 'status', 'size'])
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def build_manifest(input_path):
+    """Function to find all the Nielsen files within a folder in a single pass.
+
+    Returns a dictionary mapping each status (add, upd or del) to a list of ManifestEntry tuples,
+    in the order in which the files should be processed."""
+    manifest = {s: [] for s in STATUSES}
+    for root, subdirs, files in os.walk(input_path):
+        for file in files:
+            s = file.rsplit('.', 1)[-1] if '.' in file else None
+            if s in manifest:
+                path = os.path.join(root, file)
+                manifest[s].append(ManifestEntry(path, s, os.path.getsize(path)))
+    return manifest
+
+
+def stream_workers(manifest, workers):
+    """Function to share worker processes between the status streams which have files.
+
+    Each stream is given one worker, and the rest are shared in proportion to the size of their files,
+    with any left over after rounding down going to the largest remainders.
+    The total is workers, or the number of streams if that is larger."""
+    streams = [s for s in manifest if manifest[s]]
+    sizes = {s: sum(entry.size for entry in manifest[s]) for s in streams}
+    total = sum(sizes.values())
+    if not total: sizes, total = dict.fromkeys(streams, 1), len(streams)
+    spare = max(workers - len(streams), 0)
+    # Integer division is used, so that the shares always add up exactly
+    quotas = {s: divmod(spare * sizes[s], total) for s in streams}
+    shares = {s: 1 + quotas[s][0] for s in streams}
+    left = spare + len(streams) - sum(shares.values())
+    for s in sorted(streams, key=lambda s: quotas[s][1], reverse=True)[:left]:
+        shares[s] += 1
+    return shares
+
+
+@lru_cache(maxsize=16)
+def column_plan(fieldnames):
+    """Function to compile the column plan for a header, once per header in each process"""
+    return ColumnPlan(fieldnames)
+
+
+def convert_product(row, status, columns=None):
+    """Function to convert a row from a Nielsen product file to MARC.
+
+    Returns a tuple (record, is_uk, record_id)."""
+    nielsen = NielsenTSVProducts(row, status, columns)
+    record = nielsen.marc()
+    return record, nielsen.is_uk(), nielsen.record_id()
+
+
+def convert_organisation(row, status, columns=None):
+    """Function to convert a row from a Nielsen organisation file to MARC.
+
+    Returns a tuple (record, is_uk, record_id)."""
+    nielsen = NielsenTSVOrganisations(row, status, columns)
+    return nielsen.marc(), False, nielsen.record_id()
+
+
+def convert_cluster(row, status, columns=None):
+    """Function to convert a row from a Nielsen cluster file to MARC.
+
+    Returns a tuple (record, is_uk, record_id)."""
+    nielsen = NielsenCSVProducts(row, status, columns)
+    return nielsen.marc(), False, nielsen.record_id()
+
+
+# Conversion function for each type of Nielsen file
+CONVERSIONS = {
+    'product': convert_product,
+    'organisation': convert_organisation,
+    'cluster': convert_cluster,
+}
+
+
+def iter_nielsen_records(conversion_type, paths, status):
+    """Function to convert Nielsen files to MARC one row at a time.
+
+    conversion_type is 'product', 'organisation' or 'cluster'.
+    paths is the path to a Nielsen TSV file, or a list of paths.
+    status is the record status (n, c or d), or the type of Nielsen file (add, upd or del).
+    Yields a tuple (record, is_uk, record_id) for each row."""
+    convert = CONVERSIONS[conversion_type]
+    status = STATUS_CODES.get(status, status)
+    if isinstance(paths, str): paths = [paths]
+    for path in paths:
+        with open(path, mode='rb') as ifile:
+            reader = TSVReader(ifile)
+            columns = reader.columns
+            for row in reader:
+                yield convert(row, status, columns)
+
+
+def iter_product_records(paths, status):
+    """Function to stream MARC bibliographic records from Nielsen product files"""
+    for record, is_uk, record_id in iter_nielsen_records('product', paths, status):
+        yield record
+
+
+def iter_org_records(paths, status):
+    """Function to stream MARC authority records from Nielsen organisation files"""
+    for record, is_uk, record_id in iter_nielsen_records('organisation', paths, status):
+        yield record
+
+
+def iter_cluster_records(paths, status):
+    """Function to stream MARC bibliographic records from Nielsen cluster files"""
+    for record, is_uk, record_id in iter_nielsen_records('cluster', paths, status):
+        yield record
+
+
+def iter_row_chunks(reader, conversion_type, status, text_output=False, chunk_size=CHUNK_SIZE, offsets=None):
+    """Function to split the rows from a TSVReader into chunks which can be sent to worker processes.
+
+    Each chunk is a tuple (conversion_type, fieldnames, status, rows, text_output),
+    where rows is a list of lists of values.
+    If offsets is a list (or deque), the position in the input file after each chunk is appended to it."""
+    fieldnames = reader.fieldnames
+    if not fieldnames: return
+    rows = []
+    for values in reader.iter_values():
+        rows.append(values)
+        if len(rows) == chunk_size:
+            if offsets is not None: offsets.append(reader.offset)
+            yield conversion_type, fieldnames, status, rows, text_output
+            rows = []
+    if rows:
+        if offsets is not None: offsets.append(reader.offset)
+        yield conversion_type, fieldnames, status, rows, text_output
+
+
+def convert_chunk(chunk):
+    """Function to convert a chunk of Nielsen rows to MARC.
+
+    Returns a list of tuples (marc, is_uk, record_id, text) in the same order as the input rows,
+    where marc is the record serialized as MARC 21 and text is the text version of the record
+    (or None if text output was not requested)."""
+    conversion_type, fieldnames, status, rows, text_output = chunk
+    convert = CONVERSIONS[conversion_type]
+    columns = column_plan(fieldnames)
+    results = []
+    for values in rows:
+        record, is_uk, record_id = convert(TSVRow(values, columns), status, columns)
+        # The text version is produced in the same pass, so that it reflects any fields trimmed from oversized records
+        if text_output: marc, text = record.as_marc_and_text()
+        else: marc, text = record.as_marc(), None
+        results.append((marc, is_uk, record_id, text))
+    return results
+
+
+def convert_chunks(function, chunks, pool=None, workers=1):
+    """Function to apply a conversion function to chunks of rows, optionally using a pool of worker processes.
+
+    Results are yielded chunk by chunk, in input order. No more than CHUNKS_PER_WORKER chunks per worker
+    are in progress at any time, so that memory use stays bounded however large the input is."""
+    if pool is None:
+        for chunk in chunks:
+            yield function(chunk)
+        return
+    pending = deque()
+    limit = max(workers, 1) * CHUNKS_PER_WORKER
+    for chunk in chunks:
+        pending.append(pool.apply_async(function, (chunk,)))
+        if len(pending) >= limit:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def conversion_pool(workers):
+    """Function to create a pool of worker processes, or None if conversion should run in a single process"""
+    if workers is None or workers <= 1: return None
+    return multiprocessing.Pool(processes=workers)
+
+
+def checkpoint_path(conversion_type, output_path, s):
+    """Function to return the path of the checkpoint file for a conversion"""
+    return os.path.join(output_path, '_checkpoint_{}_{}.json'.format(conversion_type, s))
+
+
+def load_checkpoint(path):
+    """Function to read a checkpoint file, returning None if there is no usable checkpoint"""
+    try:
+        with open(path, mode='r', encoding='utf-8') as cfile:
+            return json.load(cfile)
+    except (OSError, ValueError): return None
+
+
+def save_checkpoint(path, state):
+    """Function to write a checkpoint file.
+
+    The checkpoint is written to a temporary file which then replaces the old one,
+    so that a crash while saving cannot leave a partial checkpoint."""
+    temp = path + '.tmp'
+    with open(temp, mode='w', encoding='utf-8') as cfile:
+        json.dump(state, cfile)
+        cfile.flush()
+        os.fsync(cfile.fileno())
+    os.replace(temp, path)
+
+
+def file_size(f):
+    """Function to flush an output file to disk and return its size in bytes"""
+    f.flush()
+    os.fsync(f.fileno())
+    return os.fstat(f.fileno()).st_size
+
+
+def convert_status(conversion_type, s, paths, output_path, today, text_output=False,
+                   max_records=MAX_RECORDS_PER_FILE, pool=None, workers=1, resume=False, spill_dir=None):
+    """Function to convert a list of Nielsen files of one type (add, upd or del) to MARC files.
+
+    Output files are started afresh every max_records records.
+    Record IDs which occur more than once are written to a duplicates file.
+    They are found using a DuplicateDetector, which writes to temporary files in spill_dir if it is given.
+
+    Progress is saved to a checkpoint file every CHECKPOINT_INTERVAL records, once the output files have been
+    flushed to disk. If resume is True, conversion continues from the last checkpoint, if there is one.
+    Once all the files have been converted, the checkpoint is marked complete, so that resuming skips them;
+    convert_files deletes the checkpoints when every type of file has been converted."""
+    status = STATUS_CODES[s]
+    checkpoint = checkpoint_path(conversion_type, output_path, s)
+    ids_path = os.path.join(output_path, '_ids_{}_{}.txt'.format(conversion_type, s))
+    state = load_checkpoint(checkpoint) if resume else None
+    inputs = [[path, os.path.getsize(path)] for path in paths]
+
+    # Check that the input files have not changed since the checkpoint was saved
+    if state and state.get('inputs') != inputs:
+        raise ValueError('Input files have changed since checkpoint {} was saved'.format(checkpoint))
+    if state and state['complete']:
+        date_time('Conversion of .{} files is already complete'.format(s))
+        return
+    ids = DuplicateDetector(spill_dir=spill_dir)
+
+    if state:
+        date_time('Resuming conversion of .{} files from record {}'.format(s, str(state['record_count'])))
+        today = state['today']
+        file_count, record_count = state['file_count'], state['record_count']
+        FILES, WRITERS = reopen_files(conversion_type, output_path, s, file_count, today, state['sizes'], text_output)
+        with open(ids_path, mode='ab') as idsfile:
+            idsfile.truncate(state['sizes']['ids'])
+        with open(ids_path, mode='r', encoding='utf-8') as idsfile:
+            for line in idsfile:
+                ids.add(line.rstrip('\n'))
+        start_index, start_offset, start_count = state['input_index'], state['offset'], state['file_records']
+    else:
+        file_count, record_count = 0, 0
+        # Open output files
+        FILES, WRITERS, file_count = new_files({}, {}, conversion_type, output_path, s, file_count, today, text_output)
+        start_index, start_offset, start_count = 0, 0, 0
+    # Record IDs seen so far are also written to a file, so that they can be reloaded when resuming
+    idsfile = open(ids_path, mode='a' if state else 'w', encoding='utf-8')
+
+    def save(input_index, offset, file_records, complete=False):
+        sizes = {f: file_size(FILES[f][s]) for f in FILES if s in FILES[f]}
+        sizes['ids'] = file_size(idsfile)
+        save_checkpoint(checkpoint, {'conversion_type': conversion_type, 'status': s, 'today': today,
+                                     'inputs': inputs, 'complete': complete, 'input_index': input_index,
+                                     'input_file': paths[input_index] if input_index < len(paths) else None,
+                                     'offset': offset, 'file_records': file_records,
+                                     'file_count': file_count, 'record_count': record_count, 'sizes': sizes})
+
+    last_checkpoint = record_count
+    for index in range(start_index, len(paths)):
+        path = paths[index]
+        date_time('Processing file {}'.format(os.path.basename(path)))
+        ifile = open(path, mode='rb')
+        reader = TSVReader(ifile)
+        i = 0
+        if index == start_index and start_offset:
+            # Skip the rows which were converted before the checkpoint
+            ifile.seek(start_offset)
+            reader = TSVReader(ifile, fieldnames=reader.fieldnames)
+            i = start_count
+
+        offsets = deque()
+        chunks = iter_row_chunks(reader, conversion_type, status, text_output, offsets=offsets)
+        for results in convert_chunks(convert_chunk, chunks, pool, workers):
+            offset = offsets.popleft()
+            for marc, uk, record_id, text in results:
+                i += 1
+                record_count += 1
+
+                if record_count % max_records == 0:
+                    date_time('Starting new output file')
+                    # Start new files
+                    FILES, WRITERS, file_count = new_files(FILES, WRITERS, conversion_type, output_path, s, file_count, today, text_output)
+
+                if i % 1000 == 0:
+                    print('{} records processed'.format(str(i)), end='\r')
+
+                # Records have already been serialized by convert_chunk
+                WRITERS['both' if uk else 'int'][s].write(marc)
+                if text_output:
+                    FILES['text'][s].write(text + '\n')
+                if record_id:
+                    if ids.add(record_id):
+                        FILES['dup'][s].write(record_id + '\n')
+                    else: idsfile.write(record_id + '\n')
+
+            if record_count - last_checkpoint >= CHECKPOINT_INTERVAL:
+                save(index, offset, i)
+                last_checkpoint = record_count
+
+        print('{} records processed'.format(str(i)), end='\r')
+        ifile.close()
+        save(index + 1, 0, 0)
+
+    save(len(paths), 0, 0, complete=True)
+
+    # Close files
+    for f in FILES:
+        if s in FILES[f]: FILES[f][s].close()
+    idsfile.close()
+    os.remove(ids_path)
+    ids.close()
+
+
+def convert_stream(conversion_type, s, paths, output_path, today, text_output=False,
+                   max_records=MAX_RECORDS_PER_FILE, workers=1, resume=False, spill_dir=None):
+    """Function to convert a list of Nielsen files of one type (add, upd or del) using its own pool of workers.
+
+    This is run in a separate process for each type of file when the types are converted concurrently.
+    The process itself counts as one of its workers: it reads and writes the files,
+    and the rest of its workers (if any) convert the records."""
+    pool = multiprocessing.Pool(processes=workers - 1) if workers > 1 else None
+    try:
+        convert_status(conversion_type, s, paths, output_path, today, text_output, max_records, pool, workers - 1,
+                       resume, spill_dir)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def convert_files(conversion_type, input_path, output_path, text_output=False,
+                  max_records=MAX_RECORDS_PER_FILE, workers=1, resume=False, spill_dir=None):
+    """Function to convert all Nielsen files of a given type within a folder to MARC files.
+
+    The input folder is searched once. If there are files of more than one type (add, upd or del), and at least
+    as many workers as types, each type is converted concurrently in its own process, with its own output files
+    and a share of the workers in proportion to the size of its input files; the process of each type counts as
+    one of its share. Otherwise the types are converted one after another, sharing a pool of workers.
+    Either way, no more than workers processes are started.
+
+    If resume is True, an interrupted conversion is continued from its checkpoints, skipping the types of file
+    which were converted completely; the checkpoints are deleted once every type of file has been converted.
+    If spill_dir is given, record IDs used to find duplicates are partly held in temporary files in that folder."""
+    today = datetime.date.today().strftime("%Y-%m-%d")
+    if conversion_type == 'product' and not os.path.exists(os.path.join(output_path, 'UK')):
+        os.makedirs(os.path.join(output_path, 'UK'))
+    for s in STATUSES:
+        state = load_checkpoint(checkpoint_path(conversion_type, output_path, s))
+        if state and resume:
+            # Output file names include the date on which the conversion started
+            today = state['today']
+        elif state: os.remove(checkpoint_path(conversion_type, output_path, s))
+
+    manifest = build_manifest(input_path)
+    for s in STATUSES:
+        print('{} .{} files found ({:.1f} MB)'.format(str(len(manifest[s])), s,
+                                                     sum(entry.size for entry in manifest[s]) / 1048576))
+    streams = [s for s in STATUSES if manifest[s]]
+
+    if len(streams) > 1 and workers >= len(streams):
+        shares = stream_workers(manifest, workers)
+        processes = []
+        for s in STATUSES:
+            paths = [entry.path for entry in manifest[s]]
+            if s not in streams:
+                # Create empty output files, as for a sequential conversion
+                convert_status(conversion_type, s, paths, output_path, today, text_output, max_records,
+                               resume=resume, spill_dir=spill_dir)
+                continue
+            date_time('Converting .{} files using {} worker processes'.format(s, str(shares[s])))
+            process = multiprocessing.Process(target=convert_stream, name='nielsen2marc_{}'.format(s),
+                                              args=(conversion_type, s, paths, output_path, today, text_output,
+                                                    max_records, shares[s], resume, spill_dir))
+            process.start()
+            processes.append(process)
+        failed = []
+        for process in processes:
+            process.join()
+            if process.exitcode != 0: failed.append(process.name)
+        if failed:
+            raise RuntimeError('Conversion failed in {}'.format(', '.join(failed)))
+    else:
+        pool = conversion_pool(workers)
+        try:
+            for s in STATUSES:
+                convert_status(conversion_type, s, [entry.path for entry in manifest[s]], output_path, today,
+                               text_output, max_records, pool, workers, resume, spill_dir)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+    # Every type of file has been converted, so the checkpoints are no longer needed
+    for s in STATUSES:
+        checkpoint = checkpoint_path(conversion_type, output_path, s)
+        if os.path.isfile(checkpoint): os.remove(checkpoint)
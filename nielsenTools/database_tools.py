@@ -13,7 +13,9 @@ import sqlite3
 
 from nielsenTools.functions import *
 from nielsenTools.network_tools import *
+from nielsenTools.snapshot_tools import *
 from nielsenTools.nielsen_tools import *
+from nielsenTools.tsv_tools import *
 
 __author__ = 'Victoria Morris'
 __license__ = 'MIT License'
@@ -70,6 +72,41 @@ GRAPH_TABLES = {
     ]),
 }
 
+# Tables present only in databases which store clusters of related ISBNs as cluster ids (see convert_to_cluster_ids()).
+# Two ISBNs are related if they have the same cluster id, so a cluster of n ISBNs takes n rows rather than n*(n-1).
+# The primary key finds the cluster of an ISBN, and the unique constraint on (cluster_id, isbn) finds its members
+CLUSTER_TABLES = {
+    'isbn_clusters': ([
+        ('cluster_id', 'INTEGER'),
+        ('isbn', 'NCHAR(13) PRIMARY KEY'),
+    ]),
+}
+
+# Columns which hold ISBNs. In databases which use integer keys, these columns are declared without a type,
+# so that 13-digit ISBNs are stored as integers (see isbn_key()) and any other identifiers as text
+ISBN_COLUMNS = {
+    'isbns': ('isbn',),
+    'isbn_equivalents': ('isbna', 'isbnb'),
+    'bl_isbns': ('isbn',),
+    'isbn_org_links': ('isbn',),
+    'isbn_clusters': ('isbn',),
+}
+
+# Bits of PRAGMA user_version which record whether a database uses integer keys and cluster ids
+INTEGER_KEYS_FLAG = 1
+CLUSTER_IDS_FLAG = 2
+
+# Subquery returning the ISBNs loaded by IsbnDatabase.lookup(), for use in place of a list of literals
+SQL_LOOKUP = '(SELECT isbn FROM temp.isbn_lookup)'
+
+# Largest number of ISBNs looked up with parameters rather than through the temporary table
+# (older versions of SQLite allow at most 999 parameters in a statement)
+LOOKUP_PARAMETERS = 500
+
+# SQL expression converting a 13-digit ISBN held as text to an integer, as isbn_key() does
+SQL_ISBN_KEY = "CASE WHEN {0} GLOB '97[89][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]' " \
+               "THEN CAST({0} AS INTEGER) ELSE {0} END"
+
 
 # ====================
 #      Functions
@@ -86,6 +123,19 @@ def dedupe_row(row):
     return row
 
 
+def table_columns(table_name, integer_keys=False):
+    """Function to return the columns of a table, and their types"""
+    columns = GRAPH_TABLES[table_name] if table_name in GRAPH_TABLES else CLUSTER_TABLES[table_name]
+    if not integer_keys: return columns
+    return [(key, value.replace('NCHAR(13)', '').strip() if key in ISBN_COLUMNS.get(table_name, ()) else value)
+            for (key, value) in columns]
+
+
+def sql_order(value):
+    """Function to return a key for sorting values in the same order as SQLite, which sorts integers before text"""
+    return isinstance(value, str), value
+
+
 def diff(l1, l2):
     s1 = set(l1.split(';'))
     s2 = set(l2.split(';')) - s1
@@ -98,11 +148,11 @@ def diff(l1, l2):
 
 class IsbnGraphTable:
 
-    def __init__(self, table_name, conn, cursor):
+    def __init__(self, table_name, conn, cursor, integer_keys=False):
         self.name = table_name
         self.conn = conn
         self.cursor = cursor
-        self.columns = GRAPH_TABLES[table_name]
+        self.columns = table_columns(table_name, integer_keys)
         self.create()
 
     def create(self, silent=False):
@@ -168,8 +218,13 @@ class IsbnGraphTable:
 
 class IsbnDatabase:
 
-    def __init__(self):
-        """Open a new database connection, and ensure that the correct tables are present"""
+    def __init__(self, integer_keys=None, cluster_ids=None):
+        """Open a new database connection, and ensure that the correct tables are present.
+
+        If integer_keys is True, a new database is created with ISBNs stored as integers rather than text;
+        if cluster_ids is True, a new database is created with related ISBNs stored as clusters in isbn_clusters
+        rather than as pairs in isbn_equivalents. An existing database keeps the storage it was created with
+        (see convert_to_integer_keys() and convert_to_cluster_ids())."""
         date_time('Connecting to local database')
 
         self.conn = sqlite3.connect(DATABASE_PATH)
@@ -184,22 +239,139 @@ class IsbnDatabase:
         self.cursor.execute('PRAGMA journal_mode = OFF')
         self.cursor.execute('PRAGMA locking_mode = EXCLUSIVE')
         self.cursor.execute('PRAGMA count_changes = FALSE')
+        self.cursor.execute('PRAGMA temp_store = MEMORY')
+
+        # Find whether the database uses integer keys and cluster ids
+        existing = self.cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='isbns';").fetchone()[0]
+        if existing:
+            flags = self.cursor.execute('PRAGMA user_version').fetchone()[0]
+            self.integer_keys = bool(flags & INTEGER_KEYS_FLAG)
+            self.cluster_ids = bool(flags & CLUSTER_IDS_FLAG)
+            if integer_keys is not None and integer_keys != self.integer_keys:
+                raise ValueError('The database {} uses {} keys for ISBNs'.format(DATABASE_PATH, 'integer' if self.integer_keys else 'text'))
+            if cluster_ids is not None and cluster_ids != self.cluster_ids:
+                raise ValueError('The database {} stores related ISBNs as {}'.format(DATABASE_PATH, 'cluster ids' if self.cluster_ids else 'pairs'))
+        else:
+            self.integer_keys = bool(integer_keys)
+            self.cluster_ids = bool(cluster_ids)
+            self.set_flags()
+        self.key = isbn_key if self.integer_keys else isbn_text
+        self.snapshot = None
 
         # Create tables
-        self.tables = {table: IsbnGraphTable(table, self.conn, self.cursor) for table in GRAPH_TABLES}
+        self.tables = {table: IsbnGraphTable(table, self.conn, self.cursor, self.integer_keys) for table in GRAPH_TABLES}
+        if self.cluster_ids:
+            self.tables.update((table, IsbnGraphTable(table, self.conn, self.cursor, self.integer_keys))
+                               for table in CLUSTER_TABLES)
 
     def close(self):
         """Close the database connection"""
         self.conn.close()
         gc.collect()
 
+    def set_flags(self):
+        """Record whether the database uses integer keys and cluster ids"""
+        flags = (INTEGER_KEYS_FLAG if self.integer_keys else 0) | (CLUSTER_IDS_FLAG if self.cluster_ids else 0)
+        self.cursor.execute('PRAGMA user_version = {}'.format(flags))
+        self.conn.commit()
+
+    def convert_to_integer_keys(self):
+        """Convert a database which stores ISBNs as text to store them as integers"""
+        if self.integer_keys: return
+        date_time('Converting ISBNs to integer keys')
+        for name in ISBN_COLUMNS:
+            if name not in self.tables: continue
+            print('Converting table {} ...'.format(name))
+            table = self.tables[name]
+            indexed = self.cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='index' AND name=?;",
+                                          ('IDX_{}_0'.format(name),)).fetchone()[0]
+            self.cursor.execute('ALTER TABLE {0} RENAME TO {0}_text;'.format(name))
+            table.columns = table_columns(name, integer_keys=True)
+            table.create(silent=True)
+            self.cursor.execute('INSERT OR IGNORE INTO {0} SELECT {1} FROM {0}_text;'.format(
+                name, ', '.join(SQL_ISBN_KEY.format(key) if key in ISBN_COLUMNS[name] else key
+                                for (key, value) in table.columns)))
+            self.cursor.execute('DROP TABLE {}_text;'.format(name))
+            self.conn.commit()
+            if indexed: table.build_index()
+        self.integer_keys = True
+        self.key = isbn_key
+        self.set_flags()
+        gc.collect()
+
+    def convert_to_cluster_ids(self):
+        """Convert a database which stores related ISBNs as pairs in isbn_equivalents to store a cluster id
+        for each ISBN in isbn_clusters. Clusters are the connected components of isbn_equivalents,
+        so the result is the same as computing the transitive closure"""
+        if self.cluster_ids: return
+        date_time('Converting related ISBNs to cluster ids')
+        # Collective ISBNs are not related to any others, and should not join their clusters together
+        self.remove_adjacencies_from_collective()
+        clusters = DisjointSet()
+        self.cursor.execute('SELECT isbna, isbnb FROM isbn_equivalents')
+        for isbna, isbnb in self.cursor:
+            if isbna and isbnb: clusters.union(isbna, isbnb)
+        table = IsbnGraphTable('isbn_clusters', self.conn, self.cursor, self.integer_keys)
+        self.tables['isbn_clusters'] = table
+        cluster_ids = clusters.component_ids()
+        del clusters
+        print('{} ISBNs in {} clusters'.format(str(len(cluster_ids)), str(max(cluster_ids.values(), default=0))))
+        values = sorted(cluster_ids.items(), key=lambda item: isbn_text(item[0]))
+        del cluster_ids
+        for i in range(0, len(values), 10000):
+            self.cursor.executemany('INSERT OR REPLACE INTO isbn_clusters (isbn, cluster_id) VALUES (?, ?);',
+                                    values[i:i + 10000])
+        self.conn.commit()
+        del values
+        print('Emptying table isbn_equivalents ...')
+        self.tables['isbn_equivalents'].rebuild()
+        self.cluster_ids = True
+        self.set_flags()
+        gc.collect()
+
+    def export_snapshot(self):
+        """Write a snapshot of the graph of related ISBNs alongside the database (see snapshot_tools).
+
+        Searches and exports use the snapshot instead of querying the database for related ISBNs
+        until the database is next changed"""
+        if np is None:
+            print('numpy is required to write a graph snapshot')
+            return
+        path = snapshot_path(DATABASE_PATH)
+        graph = self.compact_graph()
+        date_time('Writing graph snapshot to {}'.format(path))
+        write_snapshot(graph, path, DATABASE_PATH)
+        del graph
+        gc.collect()
+
+    def current_snapshot(self):
+        """Return the graph snapshot of the database, or None if there is no snapshot
+        or the database has changed since it was written"""
+        if self.snapshot is None or not self.snapshot.is_current(DATABASE_PATH):
+            self.snapshot = load_snapshot(snapshot_path(DATABASE_PATH), DATABASE_PATH)
+        return self.snapshot
+
+    def related_isbns(self, column, join='INNER'):
+        """Return a JOIN clause which finds the ISBNs related to the ISBN in column, and the column which holds them"""
+        if self.cluster_ids:
+            return '{0} JOIN isbn_clusters AS clusters ON {1} = clusters.isbn ' \
+                   '{0} JOIN isbn_clusters AS related ON related.cluster_id = clusters.cluster_id ' \
+                   'AND related.isbn != clusters.isbn'.format(join, column), 'related.isbn'
+        return '{} JOIN isbn_equivalents ON {} = isbn_equivalents.isbna'.format(join, column), 'isbn_equivalents.isbnb'
+
+    def sort_key(self, column):
+        """Return an expression for sorting by an ISBN column in the same order as ISBNs held as text
+        (SQLite sorts integers before text)"""
+        return 'CAST({} AS TEXT)'.format(column) if self.integer_keys else column
+
     def clean(self, quick_clean=False, transitive=False):
         """Clean the database to remove unnecessary values"""
         date_time('Cleaning')
 
         self.remove_adjacencies_from_collective()
 
-        if transitive:
+        # Clusters are already complete if cluster ids are used
+        if transitive and not self.cluster_ids:
             self.transitive_closure()
 
         # Delete null entries
@@ -221,62 +393,76 @@ class IsbnDatabase:
 
     def remove_adjacencies_from_collective(self):
         # Remove adjacencies for collective ISBNs
-        collective = set(item[0] for item in self.cursor.execute("""SELECT isbn FROM isbns WHERE format='C' ;""").fetchall())
-        searchList = '\'' + '\', \''.join(collective) + '\''
+        collective = """(SELECT isbn FROM isbns WHERE format='C')"""
         for c in GRAPH_TABLES['isbn_equivalents']:
-            self.cursor.execute('DELETE FROM isbn_equivalents WHERE {} IN ({});'.format(c[0], searchList))
+            self.cursor.execute('DELETE FROM isbn_equivalents WHERE {} IN {};'.format(c[0], collective))
+            self.conn.commit()
+        if self.cluster_ids:
+            self.cursor.execute('DELETE FROM isbn_clusters WHERE isbn IN {};'.format(collective))
             self.conn.commit()
-        del collective
-        del searchList
         gc.collect()
 
     def transitive_closure(self, isbn_list=None):
         """Ensure that the ISBN table is complete by computing the transitive closure
-        (i.e. all subgraphs are complete)"""
-        date_time('Computing transitive closure of isbn_equivalents')
-        tfile = open('TRANSITIVE_CLOSURE_.txt', mode='w', encoding='utf-8', errors='replace')
-        record_count = 0
+        (i.e. all subgraphs are complete).
 
+        Clusters of related ISBNs are found in a single pass over isbn_equivalents, counting the pairs held for each ISBN;
+        clusters which already have all of their pairs are skipped, and the pairs of the others are inserted in order
+        of isbna and isbnb, in a single transaction. If isbn_list is given, only the clusters containing those ISBNs
+        are completed"""
+        date_time('Computing transitive closure of isbn_equivalents')
+        clusters = DisjointSet()
+        pairs = {}
+        self.cursor.execute('SELECT isbna, isbnb FROM isbn_equivalents')
+        for isbna, isbnb in self.cursor:
+            if isbna and isbnb:
+                clusters.union(isbna, isbnb)
+                pairs[isbna] = pairs.get(isbna, 0) + 1
+        roots = None
         if isbn_list:
-            self._transitive_closure(isbn_list, record_count, tfile)
-        else:
-            self.cursor.execute('SELECT DISTINCT isbna FROM isbn_equivalents')
-            result_list = self.cursor.fetchmany()
-            while result_list:
-                isbn_list = set(i[0] for i in result_list)
-                self._transitive_closure(isbn_list, record_count, tfile)
-                result_list = self.cursor.fetchmany()
-        tfile.close()
+            roots = set(clusters.find(i) for i in map(self.key, isbn_list) if i in clusters)
+
+        # A cluster of n ISBNs is complete if it has n * (n - 1) pairs
+        incomplete = {}
+        for root, related_isbns in clusters.components().items():
+            if roots is not None and root not in roots: continue
+            n = len(related_isbns)
+            if sum(pairs.get(isbn, 0) for isbn in related_isbns) != n * (n - 1):
+                incomplete[root] = sorted(related_isbns, key=sql_order)
+        del pairs
+        print('{} of {} clusters are incomplete'.format(str(len(incomplete)), str(len(clusters.sizes))))
+
+        def missing_pairs():
+            # Pairs are generated in the order of the index on (isbna, isbnb), so that they are inserted sequentially
+            record_count = 0
+            for isbna in sorted((isbn for related_isbns in incomplete.values() for isbn in related_isbns), key=sql_order):
+                for isbnb in incomplete[clusters.find(isbna)]:
+                    if isbna != isbnb:
+                        record_count += 1
+                        if record_count % 100000 == 0:
+                            print('\r{} records processed'.format(str(record_count)), end='\r')
+                        yield isbna, isbnb
+
+        self.cursor.executemany('INSERT OR IGNORE INTO isbn_equivalents (isbna, isbnb) VALUES (?, ?) ;', missing_pairs())
+        print('{} pairs added'.format(str(self.cursor.rowcount)))
+        self.conn.commit()
+        del clusters, incomplete
         gc.collect()
-        date_time('Reading transitive closure data from temporary file')
-        tfile = open('TRANSITIVE_CLOSURE_.txt', mode='r', encoding='utf-8', errors='replace')
-        sql_query = 'INSERT OR IGNORE INTO isbn_equivalents (isbna, isbnb) VALUES (?, ?) ;'
-        values = []
-        for filelineno, line in enumerate(tfile):
-            isbna, isbnb = line.strip().split('\t')
-            values.append((isbna, isbnb))
-            values.append((isbnb, isbna))
-            if filelineno % 10000 == 0:
-                print('\r{} records processed'.format(str(filelineno)), end='\r')
-                values = self.execute_all(sql_query, values)
-        print('\r{} records processed'.format(str(filelineno)), end='\r')
-        self.execute_all(sql_query, values)
-        tfile.close()
         return set()
 
-    def _transitive_closure(self, isbn_list, record_count, tfile):
-        while isbn_list:
-            isbn = isbn_list.pop()
-            record_count += 1
-            related_isbns = self.node_connected_component(isbn)
-            for isbna in related_isbns:
-                isbn_list.discard(isbna)
-                for isbnb in related_isbns:
-                    if isbna != isbnb:
-                        tfile.write('{}\t{}\n'.format(isbna, isbnb))
-            if record_count % 10000 == 0:
-                print('\r{} records processed'.format(str(record_count)), end='\r')
-        return record_count
+    def lookup(self, values):
+        """Return an SQL expression to follow IN which selects a set of ISBNs, and the parameters for it.
+
+        A small set is given as parameters; a larger set is loaded into the temporary table isbn_lookup
+        (emptied first, so it holds one set of ISBNs at a time), and the expression is SQL_LOOKUP"""
+        values = list(values)
+        if len(values) <= LOOKUP_PARAMETERS:
+            return '({})'.format(', '.join('?' * len(values))), values
+        self.cursor.execute('CREATE TEMP TABLE IF NOT EXISTS isbn_lookup (isbn PRIMARY KEY);')
+        self.cursor.execute('DELETE FROM temp.isbn_lookup;')
+        self.cursor.executemany('INSERT OR IGNORE INTO temp.isbn_lookup (isbn) VALUES (?);', ((v,) for v in values))
+        self.conn.commit()
+        return SQL_LOOKUP, ()
 
     def execute_all(self, query, values):
         if values:
@@ -319,13 +505,15 @@ class IsbnDatabase:
                 if file.endswith(('.add', '.upd', '.del')):
                     status = {'add': 'n', 'upd': 'c', 'del': 'd'}[file[-3:]]
                     date_time('Parsing Nielsen product file {} ...'.format(str(file)))
-                    ifile = open(os.path.join(root, file), mode='r', encoding='utf-8', errors='replace', newline='')
+                    ifile = open(os.path.join(root, file), mode='rb')
                     i = 0
-                    c = csv.DictReader(ifile, delimiter='\t')
+                    c = TSVReader(ifile)
+                    columns = c.columns
                     for row in c:
                         i += 1
-                        nielsen = NielsenTSVProducts(row, status)
-                        values.append((nielsen.sql_values() + (now,)))
+                        nielsen = NielsenTSVProducts(row, status, columns)
+                        sql_values = nielsen.sql_values()
+                        values.append(((self.key(sql_values[0]),) + sql_values[1:] + (now,)))
                         if i % 10000 == 0:
                             print('\r{} records processed'.format(str(i)), end='\r')
                             values = self.execute_all(query, values)
@@ -343,12 +531,13 @@ class IsbnDatabase:
                 if file.endswith(('.add', '.upd', '.del')):
                     status = {'add': 'n', 'upd': 'c', 'del': 'd'}[file[-3:]]
                     date_time('Parsing Nielsen organisation file {} ...'.format(str(file)))
-                    ifile = open(os.path.join(root, file), mode='r', encoding='utf-8', errors='replace', newline='')
+                    ifile = open(os.path.join(root, file), mode='rb')
                     i = 0
-                    c = csv.DictReader(ifile, delimiter='\t')
+                    c = TSVReader(ifile)
+                    columns = c.columns
                     for row in c:
                         i += 1
-                        nielsen = NielsenTSVOrganisations(row, status)
+                        nielsen = NielsenTSVOrganisations(row, status, columns)
                         values.append((nielsen.sql_values() + (now,)))
                         if i % 10000 == 0:
                             print('\r{} records processed'.format(str(i)), end='\r')
@@ -363,25 +552,25 @@ class IsbnDatabase:
                 if file.endswith(('.add', '.upd', '.del')):
                     date_time('Parsing ISBN equivalences from Nielsen cluster file {} ...'.format(str(file)))
 
-                    G = Graph(skip_check=skip_check)
+                    # Pairs of related ISBNs are only needed if the database stores them
+                    G = Graph(skip_check=skip_check, integer_keys=self.integer_keys, pairs=not self.cluster_ids)
 
-                    ifile = open(os.path.join(root, file), mode='r', encoding='utf-8', errors='replace', newline='')
+                    ifile = open(os.path.join(root, file), mode='rb')
                     i = 0
-                    c = csv.DictReader(ifile, delimiter='\t')
+                    c = TSVReader(ifile)
+                    columns = c.columns
                     for row in c:
                         i += 1
                         if i % 100 == 0:
                             print('{} records processed'.format(str(i)), end='\r')
-                        nielsen = NielsenCluster(row)
+                        nielsen = NielsenCluster(row, columns)
                         isbns = nielsen.get_alternative_formats()
 
                         if isbns:
-                            data = [(i.isbn, i.format) for i in isbns if i.isbn]
+                            # Each ISBN is converted to a key once, so that nodes and edges share the same key
+                            data = [(G.key(i.isbn), i.format) for i in isbns if i.isbn]
                             G.add_nodes(data)
-                            data = [(i.isbn, j.isbn) for i in isbns for j in isbns if
-                                    i.isbn and j.isbn and i.isbn != j.isbn and i.format != 'C' and j.format != 'C']
-
-                            G.add_edges(data)
+                            G.add_cluster(i for (i, f) in data if f != 'C')
                     print('{} records processed'.format(str(i)), end='\r')
 
                     ifile.close()
@@ -417,7 +606,7 @@ class IsbnDatabase:
                         dewey = record.get_dewey()
                         lc = record.get_lc()
                         for i in isbns:
-                            values['isbns'].append((record_id, i))
+                            values['isbns'].append((record_id, self.key(i)))
                         for d in dewey:
                             values['dewey'].append((record_id, d))
                         for l in lc:
@@ -433,22 +622,23 @@ class IsbnDatabase:
     def match_bl(self):
         ofile = open('bl_cross_references.txt', mode='w', encoding='utf-8', errors='replace')
         ofile.write('Record ID\tISBNs\tDewey\tLC\tRelated ISBNs\tRelated BL record IDs\tPossible Dewey\tPossible LC\n')
+        join, related = self.related_isbns('bl_isbns.isbn')
         self.cursor.execute("SELECT bl_isbns.bl, GROUP_CONCAT(bl_isbns.isbn, ';'), "
                             "GROUP_CONCAT(bl_dewey.dewey, ';'), "
                             "GROUP_CONCAT(bl_lc.lc, ';'), "
-                            "GROUP_CONCAT(isbn_equivalents.isbnb, ';'), "
+                            "GROUP_CONCAT({related}, ';'), "
                             "GROUP_CONCAT(bl_isbns2.bl, ';'), "
                             "GROUP_CONCAT(bl_dewey2.dewey, ';'), "
                             "GROUP_CONCAT(bl_lc2.lc, ';') "
                             "FROM bl_isbns "
                             "LEFT JOIN bl_dewey ON bl_isbns.bl = bl_dewey.bl "
                             "LEFT JOIN bl_lc ON bl_isbns.bl = bl_lc.bl "
-                            "INNER JOIN isbn_equivalents ON bl_isbns.isbn = isbn_equivalents.isbna "
-                            "INNER JOIN bl_isbns AS bl_isbns2 ON isbn_equivalents.isbnb = bl_isbns2.isbn "
+                            "{join} "
+                            "INNER JOIN bl_isbns AS bl_isbns2 ON {related} = bl_isbns2.isbn "
                             "LEFT JOIN bl_dewey AS bl_dewey2 ON bl_isbns2.bl = bl_dewey2.bl "
                             "LEFT JOIN bl_lc AS bl_lc2 ON bl_isbns2.bl = bl_lc2.bl "
                             "GROUP BY bl_isbns.bl "
-                            "ORDER BY bl_isbns.bl ASC ;")
+                            "ORDER BY bl_isbns.bl ASC ;".format(join=join, related=related))
         try: row = list(self.cursor.fetchone())
         except: row = None
         while row:
@@ -483,18 +673,23 @@ class IsbnDatabase:
                     print('\r{} records processed'.format(str(filelineno)), end='\r')
 
                     date_time('Searching for matches from file {}'.format(file))
-                    searchList = '\'' + '\', \''.join(i for i in isbn_list) + '\''
-                    self.cursor.execute("SELECT isbns.isbn, isbns.format, GROUP_CONCAT(isbn_equivalents.isbnb, ';'), "
+                    lookup, parameters = self.lookup(self.key(i) for i in isbn_list)
+                    snapshot = self.current_snapshot()
+                    if snapshot is None: join, related = self.related_isbns('isbns.isbn')
+                    else: join, related = '', 'NULL'
+                    if snapshot is not None: print('Using graph snapshot {}'.format(snapshot.path))
+                    self.cursor.execute("SELECT isbns.isbn, isbns.format, GROUP_CONCAT({related}, ';'), "
                                         "isbn_org_links.pub_status, isbn_org_links.avail_status, isbn_org_links.avail_date, "
                                         "isbn_org_links.org_id, o1.org_name, o1.org_address, o1.org_email, o1.org_url, "
                                         "isbn_org_links.imp_id, o2.org_name, o2.org_address, o2.org_email, o2.org_url "
-                                        "FROM isbns INNER JOIN isbn_equivalents ON isbns.isbn = isbn_equivalents.isbna "
+                                        "FROM isbns {join} "
                                         "LEFT JOIN isbn_org_links ON isbns.isbn = isbn_org_links.isbn "
                                         "LEFT JOIN organisations AS o1 on isbn_org_links.org_id = o1.org_id "
                                         "LEFT JOIN organisations AS o2 on isbn_org_links.imp_id = o2.org_id "
-                                        "WHERE isbns.isbn IN ({}) "
+                                        "WHERE isbns.isbn IN {lookup} "
                                         "GROUP BY isbns.isbn "
-                                        "ORDER BY isbns.isbn ASC ;".format(searchList))
+                                        "ORDER BY isbns.isbn ASC ;".format(join=join, related=related, lookup=lookup),
+                                        parameters)
                     record_count = 0
                     try: row = list(self.cursor.fetchone())
                     except: row = None
@@ -505,7 +700,9 @@ class IsbnDatabase:
                         isbn, format, related, pub_status, avail_status, avail_date, \
                         org_id, org_name, org_address, org_email, org_url, \
                         imp_id, imp_name, imp_address, imp_email, imp_url = dedupe_row(row)
-                        if isbn in isbn_list:
+                        if snapshot is not None:
+                            related = ';'.join(snapshot.related(isbn))
+                        if isbn in isbn_list and related:
                             line = isbn_list[isbn][0]
                             prefix = isbn_list[isbn][2]
                             valid = isbn_list[isbn][3]
@@ -583,11 +780,25 @@ class IsbnDatabase:
         print('Writing list of adjacencies ...')
         file = open(os.path.join(self.output_path, 'ISBNs_list.txt'), 'w', encoding='utf-8', errors='replace')
         file.write('Identifier\tPrefix\tFormat\tFormat checked?\tValid?\tRelated Identifiers\n')
+        snapshot = self.current_snapshot()
+        if snapshot is not None:
+            print('Using graph snapshot {}'.format(snapshot.path))
+            for i, isbn in enumerate(snapshot.keys.tolist()):
+                isbn, format = isbn_text(isbn), snapshot.format_names[snapshot.formats[i]]
+                component = snapshot.component(i)
+                adjacencies = ';'.join(map(isbn_text, snapshot.nodes(component[component != i]))) or 'None'
+                isbn = Isbn(content=isbn, format=format)
+                file.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(isbn.isbn, isbn.prefix, format,
+                                                             str(bool(snapshot.checked[i])), str(isbn.valid),
+                                                             adjacencies))
+            file.close()
+            return
+        join, related = self.related_isbns('isbns.isbn', join='LEFT')
         query = """
-        SELECT isbns.*, GROUP_CONCAT(isbn_equivalents.isbnb, ';')
-        FROM isbns LEFT JOIN isbn_equivalents ON isbns.isbn = isbn_equivalents.isbna
+        SELECT isbns.*, GROUP_CONCAT({related}, ';')
+        FROM isbns {join}
         GROUP BY isbns.isbn
-        ORDER BY isbns.isbn ASC;"""
+        ORDER BY {isbn} ASC;""".format(join=join, related=related, isbn=self.sort_key('isbns.isbn'))
         self.cursor.execute(query)
         try: row = list(self.cursor.fetchone())
         except: row = None
@@ -595,7 +806,7 @@ class IsbnDatabase:
             isbn, format, checked, adjacencies = dedupe_row(row)
             isbn = Isbn(content=isbn, format=format)
             file.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(isbn.isbn, isbn.prefix, format,
-                                                         'True' if checked == 1 else 'False', str(isbn.valid),
+                                                         str(checked == '1'), str(isbn.valid),
                                                          str(adjacencies)))
             try: row = list(self.cursor.fetchone())
             except: break
@@ -604,8 +815,8 @@ class IsbnDatabase:
     def write_isbns_by_format(self, f):
         print('Writing list of {} ISBNs ...'.format(f))
         file = open(os.path.join(self.output_path, 'ISBNS_{}.txt'.format(f)), 'w', encoding='utf-8', errors='replace')
-        query = """SELECT isbn FROM isbns WHERE format='{f}' ORDER BY isbn ASC;"""
-        self.cursor.execute(query.format(f=f))
+        query = """SELECT isbn FROM isbns WHERE format='{f}' ORDER BY {isbn} ASC;"""
+        self.cursor.execute(query.format(f=f, isbn=self.sort_key('isbn')))
         try: row = self.cursor.fetchone()
         except: row = list(self.cursor.fetchone())
         while row:
@@ -616,9 +827,15 @@ class IsbnDatabase:
 
     def get_formats(self, nodes):
         if not nodes: return None
+        snapshot = self.current_snapshot()
+        if snapshot is not None:
+            ids = snapshot.node_ids(nodes)
+            ids = ids[ids >= 0]
+            return {self.key(isbn_text(isbn)): snapshot.format_names[f]
+                    for isbn, f in zip(snapshot.nodes(ids), snapshot.formats[ids])}
         formats = {}
-        query = """SELECT isbn, format FROM isbns WHERE isbn IN ({searchList}) ORDER BY isbn ASC;"""
-        self.cursor.execute(query.format(searchList='\'' + '\', \''.join(nodes) + '\''))
+        lookup, parameters = self.lookup(nodes)
+        self.cursor.execute("""SELECT isbn, format FROM isbns WHERE isbn IN {} ORDER BY isbn ASC;""".format(lookup), parameters)
         try: row = self.cursor.fetchone()
         except: row = list(self.cursor.fetchone())
         while row:
@@ -629,13 +846,21 @@ class IsbnDatabase:
         return formats
 
     def node_connected_component(self, source):
+        snapshot = self.current_snapshot()
+        if snapshot is not None:
+            return set(self.key(isbn_text(isbn)) for isbn in snapshot.node_connected_component(source))
+        if self.cluster_ids:
+            self.cursor.execute("""SELECT isbn FROM isbn_clusters WHERE cluster_id IN
+            (SELECT cluster_id FROM isbn_clusters WHERE isbn = ?);""", (source,))
+            return set(item[0] for item in self.cursor.fetchall())
         seen = set()
         nextlevel = {source}
         while nextlevel:
             thislevel = nextlevel
             nextlevel = set()
-            query = """SELECT isbnb FROM isbn_equivalents WHERE isbna IN ({searchList}) ORDER BY isbna ASC; """
-            self.cursor.execute(query.format(searchList='\'' + '\', \''.join(thislevel) + '\''))
+            lookup, parameters = self.lookup(thislevel)
+            query = """SELECT isbnb FROM isbn_equivalents WHERE isbna IN {} ORDER BY isbna ASC; """
+            self.cursor.execute(query.format(lookup), parameters)
             row = self.cursor.fetchone()
             while row:
                 for v in row:
@@ -645,65 +870,70 @@ class IsbnDatabase:
                 row = self.cursor.fetchone()
         return seen
 
+    def compact_graph(self, batch_size=10000):
+        """Return the graph of related ISBNs as a CompactGraph.
+
+        The isbns table and the related ISBNs are each read once, and converted to arrays batch_size rows at a time,
+        so the rows are never all held as Python objects"""
+        date_time('Building compact graph')
+        self.cursor.execute('SELECT isbn, format, checked FROM isbns;')
+        graph = CompactGraph.from_batches(zip(*rows) for rows in iter(lambda: self.cursor.fetchmany(batch_size), []))
+        join, related = self.related_isbns('isbns.isbn')
+        self.cursor.execute('SELECT isbns.isbn, {} FROM isbns {};'.format(related, join))
+        graph.set_edges((graph.node_ids(u), graph.node_ids(v))
+                        for u, v in (zip(*rows) for rows in iter(lambda: self.cursor.fetchmany(batch_size), [])))
+        print('{} nodes and {} edges in graph'.format(str(len(graph)), str(len(graph.indices) // 2)))
+        return graph
+
     def add_graph_to_database(self, graph, skip_check=False):
+        """Merge the nodes and adjacencies of a graph into the database.
 
-        nodes = self.list_nodes()
+        The nodes are loaded into the temporary table isbn_staging and merged into isbns with an upsert,
+        which adds new nodes and takes the formats of nodes which have been checked in the graph.
+        Only nodes whose formats conflict with those in the database are passed to check_format"""
         print('\nMerging new file into exisiting graph ...')
-        print('{} nodes already in graph'.format(str(len(nodes))))
-        already_seen = graph.nodes.intersection(nodes)
-        new = graph.nodes.difference(already_seen)
-        print('{} nodes from file already in graph'.format(str(len(already_seen))))
-        print('{} nodes from file to be added to graph'.format(str(len(new))))
-        print('Check: {} + {} = {} should be the same as {}'.format(str(len(already_seen)),
-                                                                    str(len(new)),
-                                                                    str(len(already_seen) + len(new)),
-                                                                    str(len(graph.nodes))))
-        # Add new nodes
-        print('\nAdding new nodes ...')
-        i = 0
+        self.cursor.execute('CREATE TEMP TABLE IF NOT EXISTS isbn_staging (isbn PRIMARY KEY, format, checked);')
+        self.cursor.execute('DELETE FROM temp.isbn_staging;')
+        self.cursor.executemany('INSERT OR IGNORE INTO temp.isbn_staging (isbn, format, checked) VALUES (?, ?, ?);',
+                                ((node, graph.formats[node], graph.checked[node]) for node in graph.nodes))
+        self.conn.commit()
+        print('{} nodes already in graph'.format(str(self.cursor.execute('SELECT COUNT(*) FROM isbns;').fetchone()[0])))
         query = """
-        INSERT OR IGNORE INTO isbns (isbn, format, checked)
-        VALUES (?, ?, ?); """
-        values = []
-        for node in new:
-            i += 1
-            values.append((node, graph.formats[node], graph.checked[node]))
-            if i % 1000 == 0:
-                values = self.execute_all(query, values)
-        self.execute_all(query, values)
-        print('{} new nodes added to graph'.format(str(i)))
-
-        # Update existing nodes
+        SELECT COUNT(*), COUNT(CASE WHEN s.checked AND (i.format IS NOT s.format OR NOT i.checked) THEN 1 END)
+        FROM temp.isbn_staging AS s INNER JOIN isbns AS i ON i.isbn = s.isbn;"""
+        already_seen, checked = self.cursor.execute(query).fetchone()
+        new = len(graph.nodes) - already_seen
+        print('{} nodes from file already in graph'.format(str(already_seen)))
+        print('{} nodes from file to be added to graph'.format(str(new)))
+
+        # Resolve conflicting formats of existing nodes which have not been checked in the graph.
+        # check_format keeps the current format if it has been checked, or if the new format is U (unless it is C)
         print('\nUpdating existing nodes ...')
-        if already_seen:
-            i = 0
-            update_formats, update_checked = [], []
-            query = """
-            SELECT isbn, format, checked FROM isbns WHERE isbn IN ({searchList});"""
-            query = query.format(searchList='\'' + '\', \''.join(already_seen) + '\'')
-            self.cursor.execute(query)
-            row = list(self.cursor.fetchone())
-            while row:
-                isbn, format, checked = row[0], row[1], row[2]
-                if graph.checked[isbn]:
-                    i += 1
-                    update_formats.append([graph.formats[isbn], isbn])
-                    update_checked.append([graph.checked[isbn], isbn])
-                elif format != graph.formats[isbn]:
-                    i += 1
-                    f, c = check_format(isbn, format, graph.formats[isbn], checked, skip_check=skip_check)
-                    if f != format:
-                        update_formats.append([f, isbn])
-                    if c != checked:
-                        update_checked.append([c, isbn])
-                if i % 1000 == 0:
-                    update_formats = self.execute_all("""UPDATE OR REPLACE isbns SET format = ? WHERE isbn = ?;""", update_formats)
-                    update_checked = self.execute_all("""UPDATE OR REPLACE isbns SET checked = ? WHERE isbn = ?;""", update_checked)
-                try: row = list(self.cursor.fetchone())
-                except: break
-            self.execute_all("""UPDATE OR REPLACE isbns SET format = ? WHERE isbn = ?;""", update_formats)
-            self.execute_all("""UPDATE OR REPLACE isbns SET checked = ? WHERE isbn = ?;""", update_checked)
-            print('{} existing nodes updated'.format(str(i)))
+        query = """
+        SELECT s.isbn, i.format, s.format, i.checked
+        FROM temp.isbn_staging AS s INNER JOIN isbns AS i ON i.isbn = s.isbn
+        WHERE NOT s.checked AND i.format IS NOT s.format AND NOT i.checked AND (s.format != 'U' OR i.format = 'C');"""
+        updates = []
+        for isbn, format, new_format, checked in self.cursor.execute(query).fetchall():
+            f, c = check_format(isbn_text(isbn), format, new_format, checked, skip_check=skip_check)
+            if f != format or c != checked:
+                updates.append((f, c, isbn))
+        self.execute_all('UPDATE isbns SET format = ?, checked = ? WHERE isbn = ?;', updates)
+
+        # Add new nodes, and update existing nodes which have been checked in the graph
+        query = """
+        INSERT INTO isbns (isbn, format, checked)
+        SELECT isbn, format, checked FROM temp.isbn_staging WHERE true
+        ON CONFLICT (isbn) DO UPDATE SET format = excluded.format, checked = excluded.checked
+        WHERE excluded.checked AND (isbns.format IS NOT excluded.format OR NOT isbns.checked);"""
+        self.cursor.execute(query)
+        self.conn.commit()
+        print('{} new nodes added to graph'.format(str(new)))
+        print('{} existing nodes updated'.format(str(checked + len(updates))))
+
+        if self.cluster_ids:
+            self.add_clusters_to_database(graph)
+            return
 
         # Add new adjacencies
         i = 0
@@ -721,6 +951,45 @@ class IsbnDatabase:
         #self.clean()
         #self.dump_database()
 
+    def add_clusters_to_database(self, graph):
+        """Merge the connected components of a graph into isbn_clusters.
+
+        A component which shares ISBNs with existing clusters takes the lowest of their cluster ids,
+        and the other clusters are merged into it; other components are given new cluster ids.
+        This is called by add_graph_to_database once the nodes of the graph are in isbns and isbn_staging"""
+        # ISBNs stored as collective (C) are not related to any others, even if the graph gives them another format
+        self.cursor.execute("SELECT isbn FROM isbns WHERE format = 'C' "
+                            "AND isbn IN (SELECT isbn FROM temp.isbn_staging);")
+        graph.collective_isbns([isbn_text(row[0]) for row in self.cursor.fetchall()])
+        clusters = graph.clusters()
+        components = list(clusters.components().values())
+        del clusters
+
+        # Find the existing clusters of ISBNs in the graph
+        lookup, parameters = self.lookup(node for component in components for node in component)
+        self.cursor.execute('SELECT isbn, cluster_id FROM isbn_clusters WHERE isbn IN {};'.format(lookup), parameters)
+        existing = dict(self.cursor.fetchall())
+        merged = DisjointSet(existing.values())
+        for component in components:
+            merged.union_all(existing[node] for node in component if node in existing)
+        targets = {cluster_id: min(members) for members in merged.components().values() for cluster_id in members}
+        del merged
+
+        cluster_id = self.cursor.execute('SELECT MAX(cluster_id) FROM isbn_clusters;').fetchone()[0] or 0
+        values = []
+        for component in components:
+            target = next((targets[existing[node]] for node in component if node in existing), None)
+            if target is None:
+                cluster_id += 1
+                target = cluster_id
+            values.extend((node, target) for node in component)
+        self.execute_all('UPDATE isbn_clusters SET cluster_id = ? WHERE cluster_id = ?;',
+                         [(target, c) for c, target in targets.items() if target != c])
+        self.execute_all('INSERT OR REPLACE INTO isbn_clusters (isbn, cluster_id) VALUES (?, ?);', values)
+        print('{} clusters added to graph'.format(str(len(components))))
+        del components, existing, values
+        gc.collect()
+
 
 # ====================
 #  Control functions
@@ -788,6 +1057,7 @@ def index(input_path, skip_check=True) -> None:
 def export_graph(input_path, skip_check=True) -> None:
     db = IsbnDatabase()
     db.clean(transitive=True)
+    if np is not None: db.export_snapshot()
     db.dump_database()
     for f in ISBN_FORMATS:
         db.write_isbns_by_format(f=f)
@@ -795,6 +1065,14 @@ def export_graph(input_path, skip_check=True) -> None:
     db.close()
 
 
+def export_snapshot(input_path, skip_check=True) -> None:
+    db = IsbnDatabase()
+    # The snapshot finds related ISBNs from whole clusters, so the database is cleaned as it is before an export
+    db.clean(quick_clean=True, transitive=True)
+    db.export_snapshot()
+    db.close()
+
+
 
 
 
@@ -0,0 +1,167 @@
+#  -*- coding: utf-8 -*-
+
+"""Tools for detecting duplicate record identifiers used within nielsenTools."""
+
+# Import required modules
+import heapq
+import mmap
+import os
+import tempfile
+from array import array
+from bisect import bisect_left
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Constants
+# ====================
+
+
+# Number of new identifiers held in a set before they are sorted into a compact run
+BUFFER_SIZE = 65536
+
+# Minimum number of identifiers in a run before it is written to disk, when spilling is enabled
+SPILL_SIZE = 4194304
+
+# Longest string of digits which can be packed into a 64-bit integer together with its length
+MAX_PACKED_DIGITS = 17
+
+# Number of identifiers written to disk at a time when spilling a run
+WRITE_BLOCK = 65536
+
+
+# ====================
+#      Classes
+# ====================
+
+
+class SpilledRun:
+    """Sorted run of packed identifiers held in a memory-mapped temporary file"""
+
+    def __init__(self, values, spill_dir):
+        fd, self.path = tempfile.mkstemp(prefix='_ids_', suffix='.bin', dir=spill_dir)
+        length = 0
+        with os.fdopen(fd, mode='wb') as ofile:
+            block = array('q')
+            for value in values:
+                block.append(value)
+                if len(block) == WRITE_BLOCK:
+                    block.tofile(ofile)
+                    length += len(block)
+                    block = array('q')
+            block.tofile(ofile)
+            length += len(block)
+        self.file = open(self.path, mode='rb')
+        if length:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.values = memoryview(self.mmap).cast('q')
+        else: self.mmap, self.values = None, array('q')
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def close(self):
+        if self.mmap is not None:
+            self.values.release()
+            self.mmap.close()
+            self.mmap = None
+        self.values = array('q')
+        self.file.close()
+        try: os.remove(self.path)
+        except OSError: pass
+
+
+class DuplicateDetector:
+    """Memory-efficient set of record identifiers, used to find identifiers which occur more than once.
+
+    Identifiers made up of 1 to 17 ASCII digits (including ISBN-13s) are packed into 64-bit integers
+    together with their length, so that leading zeros are preserved. Packed identifiers are kept in sorted
+    arrays ('runs'), using 8 bytes each rather than the 100 or so bytes taken by a str in a set.
+    Any other identifiers are kept in an ordinary set.
+
+    New identifiers are collected in a small set, which is sorted into a new run once it holds buffer_size
+    identifiers. Runs of similar size are merged, so that there are only ever a few runs to search.
+    If spill_dir is given, runs of spill_size identifiers or more are written to temporary files in that folder
+    and memory-mapped, so that they are held in the operating system's file cache rather than in memory."""
+
+    def __init__(self, buffer_size=BUFFER_SIZE, spill_dir=None, spill_size=SPILL_SIZE):
+        self.buffer_size = buffer_size
+        self.spill_dir = spill_dir
+        self.spill_size = spill_size
+        self.pending = set()
+        self.runs = []
+        self.other = set()
+
+    @staticmethod
+    def pack(record_id):
+        """Return an identifier packed as an integer, or None if it cannot be packed"""
+        if 0 < len(record_id) <= MAX_PACKED_DIGITS and record_id.isascii() and record_id.isdigit():
+            return (int(record_id) << 5) | len(record_id)
+        return None
+
+    def __contains__(self, record_id):
+        value = self.pack(record_id)
+        if value is None: return record_id in self.other
+        return self._contains_packed(value)
+
+    def _contains_packed(self, value):
+        if value in self.pending: return True
+        for run in self.runs:
+            i = bisect_left(run, value)
+            if i < len(run) and run[i] == value: return True
+        return False
+
+    def add(self, record_id):
+        """Add an identifier, returning True if it has been added before"""
+        value = self.pack(record_id)
+        if value is None:
+            if record_id in self.other: return True
+            self.other.add(record_id)
+            return False
+        if self._contains_packed(value): return True
+        self.pending.add(value)
+        if len(self.pending) >= self.buffer_size: self._flush()
+        return False
+
+    def _flush(self):
+        """Sort the pending identifiers into a new run, merging runs of similar size"""
+        if not self.pending: return
+        self.runs.append(array('q', sorted(self.pending)))
+        self.pending = set()
+        while len(self.runs) > 1 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            second = self.runs.pop()
+            first = self.runs.pop()
+            merged = heapq.merge(first, second)
+            if self.spill_dir and len(first) + len(second) >= self.spill_size:
+                run = SpilledRun(merged, self.spill_dir)
+            else: run = array('q', merged)
+            for old in (first, second):
+                if isinstance(old, SpilledRun): old.close()
+            self.runs.append(run)
+
+    def __len__(self):
+        return len(self.pending) + sum(len(run) for run in self.runs) + len(self.other)
+
+    def close(self):
+        """Release memory and remove any temporary files"""
+        for run in self.runs:
+            if isinstance(run, SpilledRun): run.close()
+        self.runs = []
+        self.pending = set()
+        self.other = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -8,6 +8,7 @@ import locale
 import random
 import sys
 import unicodedata
+from functools import lru_cache
 import regex as re
 
 import nielsenTools.multiregex as mrx
@@ -25,6 +26,27 @@ __status__ = '4 - Beta Development'
 
 BRACKETS = [('[', ']'), ('(', ')'), ('{', '}')]
 
+# Patterns used by clean()
+RE_CLEAN_QUOTES = re.compile(r'[\u0022\u055A\u05F4\u2018-\u201F\u275B-\u275E\uFF07]')
+RE_CLEAN_CONTROL = re.compile(r'[\u0000-\u001F\u0080-\u009F\u2028\u2029]+')
+RE_CLEAN_ENDS = re.compile(r'^[:;/\s\?\$\.,\\\]\)}]|[;/\s\$\.,\\\[\({]+$')
+RE_CLEAN_SPACE = re.compile(r'\s+')
+
+# Characters which clean() removes from the start and end of a string
+CLEAN_LEADING = frozenset(':;/?$.,\\])} ')
+CLEAN_TRAILING = frozenset(';/$.,\\[({ ')
+
+# Number of cleaned strings remembered by clean(), and the longest string remembered
+# (short values such as codes, flags and publisher names are repeated many times)
+CLEAN_CACHE_SIZE = 65536
+CLEAN_CACHE_MAX_LENGTH = 100
+
+# Words (with any full stops which follow them) for expand_abbreviations()
+RE_ABBREVIATION_WORDS = re.compile(r'([\w\-]+\.*)')
+
+# Number of strings remembered by expand_abbreviations() (edition statements etc. are often repeated)
+ABBREVIATIONS_CACHE_SIZE = 16384
+
 
 # ====================
 #  General Functions
@@ -43,6 +65,8 @@ def usage(conversion_type='Products'):
     print('\nInput file names should end .add, .upd or .del')
     print('\nOptions')
     print('    -t          Also produce text versions of output files')
+    print('    --resume    Resume an interrupted conversion from its last checkpoint')
+    print('    --workers N Convert records using N worker processes (default 1)')
     print('    --help      Display this message and exit')
     if conversion_type == 'Products':
         print('    --database  Add ISBN information to database')
@@ -102,17 +126,29 @@ def check_file_location(file_path, file_ext='', function='input', exists=False):
 
 def clean(string):
     if string is None or not string: return None
-    string = re.sub(r'[\u0022\u055A\u05F4\u2018-\u201F\u275B-\u275E\uFF07]', '\'', string)
-    string = re.sub(r'[\u0000-\u001F\u0080-\u009F\u2028\u2029]+', '', string)
-    string = re.sub(r'^[:;/\s\?\$\.,\\\]\)}]|[;/\s\$\.,\\\[\({]+$', '', string.strip())
+    # Printable ASCII strings without quotation marks, double spaces or punctuation at either end need no changes
+    if string.isascii() and string.isprintable() and '"' not in string and '  ' not in string \
+            and string[0] not in CLEAN_LEADING and string[-1] not in CLEAN_TRAILING:
+        return string
+    if len(string) <= CLEAN_CACHE_MAX_LENGTH: return _clean_cached(string)
+    return _clean(string)
+
+
+def _clean(string):
+    string = RE_CLEAN_QUOTES.sub('\'', string)
+    string = RE_CLEAN_CONTROL.sub('', string)
+    string = RE_CLEAN_ENDS.sub('', string.strip())
     '''if to_strip:
         while len(string) > 0 and string[-1] in to_strip:
             string = re.sub(r'^[:;/\s]|[;/\s]+$', '',  string[:-1])'''
-    string = re.sub(r'\s+', ' ', string).strip()
+    string = RE_CLEAN_SPACE.sub(' ', string).strip()
     if string is None or not string: return None
     return unicodedata.normalize('NFC', string)
 
 
+_clean_cached = lru_cache(maxsize=CLEAN_CACHE_SIZE)(_clean)
+
+
 def clean_html(string):
     if string is None or not string: return None
     string = re.sub(r'</?(br|p|li|ul|ol)\s*/?>|\t', '\n', string)
@@ -199,11 +235,17 @@ def split_long(text, isbn=None):
 
 def expand_abbreviations(string, plurals=True, case=True):
     if string is None or not string: return None
+    return _expand_abbreviations(string, plurals, case)
+
+
+@lru_cache(maxsize=ABBREVIATIONS_CACHE_SIZE)
+def _expand_abbreviations(string, plurals=True, case=True):
+    abbreviations = mrx.Abbreviations.instance()
 
     # Expand single-word abbreviations
-    words = re.split('([\w\-]+\.*)', string)
+    words = RE_ABBREVIATION_WORDS.split(string)
     for i, word in enumerate(words):
-        words[i] = mrx.Abbreviations().sub(words[i])
+        words[i] = abbreviations.sub(words[i])
         if word != '' and case:
             if word.isupper():
                 words[i] = words[i].upper()
@@ -8,6 +8,14 @@
 # Import required modules
 import pyperclip
 import regex as re
+from collections import namedtuple
+from functools import lru_cache
+
+from nielsenTools.prefix_tools import *
+
+# numpy is optional; it is only used by normalise_isbns() and network_tools.CompactGraph
+try: import numpy as np
+except ImportError: np = None
 
 __author__ = 'Victoria Morris'
 __license__ = 'MIT License'
@@ -101,6 +109,26 @@ def query(isbn):
 
 ISBN_FORMATS = ['U', 'P', 'E', 'A', 'C', 'O', 'X']
 
+# Number of normalised ISBNs remembered by normalise_isbn()
+# (the same related ISBNs recur across cluster, product and MARC files)
+ISBN_CACHE_SIZE = 131072
+
+# Result of normalising an ISBN: the 13-digit ISBN (or the input digits if they are not a valid ISBN,
+# or None if there are not 10 or 13 of them), the publisher prefix, whether the ISBN is valid,
+# and the format implied by any qualifier (such as 'pbk.') in the input, or None
+NormalisedIsbn = namedtuple('NormalisedIsbn', ['isbn', 'prefix', 'valid', 'format'])
+
+# Result of normalising a batch of ISBNs with normalise_isbns()
+IsbnBatch = namedtuple('IsbnBatch', ['isbn', 'valid', 'isbn10', 'check_digit'])
+
+# Check digit weights for the first 12 digits of an ISBN-13 and the first 9 digits of an ISBN-10
+ISBN_13_WEIGHTS = (1, 3) * 6
+ISBN_10_WEIGHTS = tuple(range(10, 1, -1))
+
+# Range table used to find publisher prefixes (see set_prefix_table());
+# if no range table has been loaded, prefixes are found using RE_PUB_PREFIX and RE_PUB_PREFIX_979
+PREFIX_TABLE = None
+
 
 # ====================
 #  Regular expressions
@@ -109,6 +137,7 @@ ISBN_FORMATS = ['U', 'P', 'E', 'A', 'C', 'O', 'X']
 
 RE_ISBN10 = re.compile(r'ISBN\x20(?=.{13}$)\d{1,5}([- ])\d{1,7}'r'\1\d{1,6}\1(\d|X)$|[- 0-9X]{10,16}')
 RE_ISBN13 = re.compile(r'97[89]{1}(?:-?\d){10,16}|97[89]{1}[- 0-9]{10,16}')
+RE_NOT_ISBN_CHARACTER = re.compile(r'[^0-9X]')
 
 RE_PUB_PREFIX = re.compile(r'^(?P<pub>0[01][0-9]|'
                            r'0[2-6][0-9]{2}|'
@@ -147,17 +176,9 @@ class Isbn(object):
             self.prefix = ''
             self.valid = False
         else:
-            self.isbn = re.sub(r'[^0-9X]', '', content.upper())
-            if is_isbn_10(self.isbn):
-                self.isbn = isbn_convert(self.isbn)
-            if not is_isbn_13(self.isbn):
-                self.valid = False
-                if not (len(self.isbn) == 10 or len(self.isbn) == 13):
-                    self.isbn = None
-            self.prefix = isbn_prefix(self.isbn)
-
-            if get_resource_format(content):
-                self.format = get_resource_format(content)
+            self.isbn, self.prefix, self.valid, resource_format = normalise_isbn(content)
+            if resource_format:
+                self.format = resource_format
 
     def set_format(self, format):
         self.format = format
@@ -229,6 +250,21 @@ def isbn13_convert(isbn13):
     return isbn13[3:-1] + isbn_10_check_digit(isbn13[3:-1])
 
 
+def isbn_key(isbn):
+    """Function to return a 13-digit ISBN as an integer, for graphs and databases which use integer keys.
+
+    Only 13-digit strings beginning 978 or 979 are converted, so that str() gives back the original ISBN;
+    anything else is returned unchanged."""
+    if isinstance(isbn, str) and len(isbn) == 13 and isbn[:3] in ('978', '979') and isbn.isascii() and isbn.isdigit():
+        return int(isbn)
+    return isbn
+
+
+def isbn_text(isbn):
+    """Function to return an ISBN held as an integer key as a string; anything else is returned unchanged"""
+    return str(isbn) if isinstance(isbn, int) else isbn
+
+
 def get_resource_format(s):
     if re.search(r'\b(pack|set|seri(es|a))\b', s, re.I):
         return 'C'
@@ -277,11 +313,34 @@ def check_format(isbn, current_format, new_format, checked, skip_check=False):
     return f, True
 
 
-def isbn_prefix(isbn):
-    """Function to return the publisher prefix from a 13-digit ISBN"""
-    if is_null(isbn): return ''
-    if is_isbn_10(isbn): isbn = isbn_convert(isbn)
-    if not is_isbn_13(isbn): return ''
+@lru_cache(maxsize=ISBN_CACHE_SIZE)
+def normalise_isbn(content):
+    """Function to strip, validate and convert an ISBN and find its prefix in a single pass.
+
+    Returns a NormalisedIsbn tuple; ISBN-10s are converted to ISBN-13s."""
+    isbn = RE_NOT_ISBN_CHARACTER.sub('', content.upper())
+    valid = False
+    if len(isbn) == 10:
+        if isbn[:9].isdigit() and isbn_10_check_digit(isbn[:9]) == isbn[9]:
+            isbn = '978' + isbn[:9] + isbn_13_check_digit('978' + isbn[:9])
+            valid = True
+    elif len(isbn) == 13:
+        valid = isbn[:3] in ('978', '979') and isbn[:12].isdigit() and isbn_13_check_digit(isbn[:12]) == isbn[12]
+    else: isbn = None
+    return NormalisedIsbn(isbn, _isbn_13_prefix(isbn) if valid else '', valid, get_resource_format(content))
+
+
+def set_prefix_table(table):
+    """Function to set the range table used to find publisher prefixes (or None to use regular expressions)"""
+    global PREFIX_TABLE
+    PREFIX_TABLE = table
+    normalise_isbn.cache_clear()
+
+
+def _isbn_13_prefix(isbn):
+    """Function to return the publisher prefix from a valid 13-digit ISBN"""
+    if PREFIX_TABLE is not None:
+        return PREFIX_TABLE.prefix(isbn)
     if isbn.startswith('979'):
         isbn = isbn[3:]
         try: return '979' + RE_PUB_PREFIX_979.search(isbn).group('pub')
@@ -293,6 +352,115 @@ def isbn_prefix(isbn):
     return ''
 
 
+def isbn_prefix(isbn):
+    """Function to return the publisher prefix from a 13-digit ISBN"""
+    if is_null(isbn): return ''
+    if is_isbn_10(isbn): isbn = isbn_convert(isbn)
+    if not is_isbn_13(isbn): return ''
+    return _isbn_13_prefix(isbn)
+
+
+def isbn_prefixes(isbns):
+    """Function to return a dictionary of the publisher prefixes of a list of ISBNs (such as a search list).
+
+    ISBN-10s are converted to ISBN-13s; invalid ISBNs have an empty prefix.
+    If a range table has been loaded, valid ISBNs are looked up together, in order,
+    and ISBN-13s without hyphens (such as those in the database) are used as they are."""
+    isbn13s = {}
+    for isbn in isbns:
+        if is_null(isbn): continue
+        if PREFIX_TABLE is not None and len(isbn) == 13 and isbn[:3] in ('978', '979') \
+                and isbn.isascii() and isbn.isdigit():
+            isbn13s[isbn] = isbn if isbn_13_check_digit(isbn[:12]) == isbn[12] else None
+            continue
+        normalised = normalise_isbn(isbn)
+        isbn13s[isbn] = normalised.isbn if normalised.valid else None
+    if PREFIX_TABLE is None:
+        return {isbn: _isbn_13_prefix(isbn13) if isbn13 else '' for isbn, isbn13 in isbn13s.items()}
+    prefixes = PREFIX_TABLE.prefixes(isbn13 for isbn13 in isbn13s.values() if isbn13)
+    return {isbn: prefixes[isbn13] if isbn13 else '' for isbn, isbn13 in isbn13s.items()}
+
+
+def normalise_isbns(isbns):
+    """Function to strip, validate and convert a sequence of ISBNs (such as a search list) in a single batch.
+
+    Returns an IsbnBatch of four sequences, each with one item for each input ISBN:
+        isbn - the 13-digit ISBN (or the input digits if they are not a valid ISBN, or '' if there are not 10 or 13 of them)
+        valid - whether the ISBN is valid
+        isbn10 - the 10-digit form of a valid ISBN beginning 978, or ''
+        check_digit - the correct check digit for the input digits, or '' if they are not a 10- or 13-digit ISBN
+    If numpy is available the sequences are numpy arrays, and check digits are calculated for all ISBNs at once;
+    otherwise they are lists."""
+    stripped = [isbn if isbn.isascii() and isbn.isdigit() else RE_NOT_ISBN_CHARACTER.sub('', isbn.upper())
+                for isbn in (isbn or '' for isbn in isbns)]
+    if np is None: return _normalise_isbns_scalar(stripped)
+
+    n = len(stripped)
+    lengths = np.fromiter(map(len, stripped), dtype=np.int64, count=n)
+    batch = IsbnBatch(np.full(n, '', dtype='U13'), np.zeros(n, dtype=bool),
+                      np.full(n, '', dtype='U10'), np.full(n, '', dtype='U1'))
+    check_characters = np.array(list('0123456789X'))
+    for length in (10, 13):
+        rows = np.flatnonzero(lengths == length)
+        if not rows.size: continue
+        # Matrix of digits, with one row per ISBN; X becomes 40
+        digits = np.frombuffer(''.join(stripped[i] for i in rows).encode('ascii'),
+                               dtype=np.uint8).reshape(-1, length).astype(np.int64) - 48
+        batch.isbn[rows] = [stripped[i] for i in rows]
+        if length == 10:
+            numeric = (digits[:, :9] < 10).all(axis=1)
+            check = (11 - digits[:, :9] @ ISBN_10_WEIGHTS % 11) % 11
+            valid = numeric & (np.where(digits[:, 9] == 40, 10, digits[:, 9]) == check)
+            isbn10s = digits[valid]
+            body = np.hstack((np.tile((9, 7, 8), (len(isbn10s), 1)), isbn10s[:, :9]))
+        else:
+            numeric = (digits[:, :12] < 10).all(axis=1)
+            check = (10 - digits[:, :12] @ ISBN_13_WEIGHTS % 10) % 10
+            valid = numeric & (digits[:, 12] == check) & (digits[:, 0] == 9) & (digits[:, 1] == 7) \
+                & ((digits[:, 2] == 8) | (digits[:, 2] == 9))
+            body = digits[valid, :12]
+            isbn10s = body[body[:, 2] == 8, 3:]
+        batch.valid[rows] = valid
+        batch.check_digit[rows[numeric]] = check_characters[check[numeric]]
+        if length == 10:
+            isbn13s = np.hstack((body, ((10 - body @ ISBN_13_WEIGHTS % 10) % 10)[:, None]))
+            batch.isbn[rows[valid]] = _digit_strings(isbn13s)
+            batch.isbn10[rows[valid]] = [stripped[i] for i in rows[valid]]
+        else:
+            isbn10s = np.hstack((isbn10s, ((11 - isbn10s @ ISBN_10_WEIGHTS % 11) % 11)[:, None]))
+            batch.isbn10[rows[valid][body[:, 2] == 8]] = _digit_strings(isbn10s)
+    return batch
+
+
+def _digit_strings(digits):
+    """Function to convert a matrix of digits (with 10 for X) to an array of strings, one for each row"""
+    characters = np.where(digits == 10, ord('X'), digits + 48).astype(np.uint8)
+    return np.ascontiguousarray(characters).view('S{}'.format(digits.shape[1])).ravel().astype('U')
+
+
+def _normalise_isbns_scalar(stripped):
+    """Function to normalise a list of stripped ISBNs one at a time, for normalise_isbns() when numpy is not available"""
+    batch = IsbnBatch([], [], [], [])
+    for isbn in stripped:
+        valid, isbn10, check = False, '', None
+        if len(isbn) == 10:
+            check = isbn_10_check_digit(isbn[:9]) if isbn[:9].isdigit() else None
+            if check is not None and check == isbn[9]:
+                valid, isbn10 = True, isbn
+                isbn = '978' + isbn[:9] + isbn_13_check_digit('978' + isbn[:9])
+        elif len(isbn) == 13:
+            check = isbn_13_check_digit(isbn[:12]) if isbn[:12].isdigit() else None
+            valid = check is not None and check == isbn[12] and isbn[:3] in ('978', '979')
+            if valid and isbn.startswith('978'):
+                isbn10 = isbn[3:12] + isbn_10_check_digit(isbn[3:12])
+        else: isbn = ''
+        batch.isbn.append(isbn)
+        batch.valid.append(valid)
+        batch.isbn10.append(isbn10)
+        batch.check_digit.append(check or '')
+    return batch
+
+
 def is_null(var):
     """Function to test whether a variable is null"""
     if var is None or not var: return True
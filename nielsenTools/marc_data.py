@@ -17,7 +17,12 @@ __status__ = '4 - Beta Development'
 
 LEADER_LENGTH, DIRECTORY_ENTRY_LENGTH = 24, 12
 SUBFIELD_INDICATOR, END_OF_FIELD, END_OF_RECORD = chr(0x1F), chr(0x1E), chr(0x1D)
+END_OF_RECORD_BYTES = END_OF_RECORD.encode('utf-8')
 ALEPH_CONTROL_FIELDS = ['DB ', 'SYS']
+MAX_RECORD_LENGTH = 99999
+
+# Fields which may be removed from records which would otherwise exceed MAX_RECORD_LENGTH, in this order
+REMOVABLE_FIELDS = ('505', '520', '545')
 
 ILLUSTRATIONS = {
     'ill': 'a',
@@ -96,14 +101,36 @@ class MARCWriter(object):
         self.file_handle = file_handle
 
     def write(self, record):
-        if not isinstance(record, Record): raise RecordWritingError
-        self.file_handle.write(record.as_marc())
+        """Write a Record, or a record which has already been serialized as MARC 21 bytes"""
+        if isinstance(record, (bytes, bytearray)): self.file_handle.write(record)
+        elif isinstance(record, Record): self.file_handle.write(record.as_marc())
+        else: raise RecordWritingError
 
     def close(self):
         self.file_handle.close()
         self.file_handle = None
 
 
+class MARCFanOutWriter(object):
+    """Writer which serializes each record once and writes the same bytes to several MARCWriters"""
+
+    def __init__(self, *writers):
+        self.writers = list(writers)
+
+    def write(self, record):
+        """Write a Record (or pre-serialized MARC 21 bytes) to every writer, returning the bytes written"""
+        if isinstance(record, Record): record = record.as_marc()
+        elif not isinstance(record, (bytes, bytearray)): raise RecordWritingError
+        for writer in self.writers:
+            writer.write(record)
+        return record
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+
 class Record(object):
     def __init__(self, data='', leader=' ' * LEADER_LENGTH):
         self.leader = '{}22{}4500'.format(leader[0:10], leader[12:20])
@@ -236,38 +263,50 @@ class Record(object):
         if field_count == 0: raise FieldsError
 
     def as_marc(self):
-        fields, directory, base_address, record_length = self._as_marc()
-        if record_length > 99999:
+        """Return the record as MARC 21 binary data.
+
+        Each field is encoded exactly once. If the record would exceed 99999 octets, 505, 520 and 545 fields
+        are removed until it fits, without encoding the remaining fields again."""
+        return self._encode()[0]
+
+    def as_marc_and_text(self):
+        """Return the record as MARC 21 binary data together with its text version (as str(record)),
+        both produced in the same pass over the fields"""
+        return self._encode(text=True)
+
+    def _encode(self, text=False):
+        encoded = [field.as_marc() for field in self.fields]
+        texts = [str(field) for field in self.fields] if text else None
+        record_length = LEADER_LENGTH + 2 + sum(DIRECTORY_ENTRY_LENGTH + len(data) for data in encoded)
+        if record_length > MAX_RECORD_LENGTH:
             print('Record size exceeds 99999 octets - removing fields')
-        while record_length > 99999:
-            for f in self.get_fields('505', '520', '545'):
-                self.fields.remove(f)
-                break
-            fields, directory, base_address, record_length = self._as_marc()
-
-        strleader = '%05d%s%05d%s' % (record_length, self.leader[5:12], base_address, self.leader[17:])
-        leader = strleader.encode('utf-8')
-        return leader + directory + fields
-
-    def _as_marc(self):
-        fields, directory = b'', b''
-        offset = 0
-
-        for field in self.fields:
-            field_data = field.as_marc()
-            fields += field_data
-            if field.tag.isdigit():
-                directory += ('%03d' % int(field.tag)).encode('utf-8')
-            else:
-                directory += ('%03s' % field.tag).encode('utf-8')
-            directory += ('%04d%05d' % (len(field_data), offset)).encode('utf-8')
-            offset += len(field_data)
-
-        directory += END_OF_FIELD.encode('utf-8')
-        fields += END_OF_RECORD.encode('utf-8')
+            i = 0
+            while record_length > MAX_RECORD_LENGTH and i < len(self.fields):
+                if self.fields[i].tag.upper() in REMOVABLE_FIELDS:
+                    record_length -= DIRECTORY_ENTRY_LENGTH + len(encoded[i])
+                    del self.fields[i]
+                    del encoded[i]
+                    if text: del texts[i]
+                else: i += 1
+
+        directory, offset = [], 0
+        for field, data in zip(self.fields, encoded):
+            directory.append('%03d%04d%05d' % (int(field.tag), len(data), offset) if field.tag.isdigit()
+                             else '%03s%04d%05d' % (field.tag, len(data), offset))
+            offset += len(data)
+        directory.append(END_OF_FIELD)
+        directory = ''.join(directory).encode('utf-8')
         base_address = LEADER_LENGTH + len(directory)
-        record_length = base_address + len(fields)
-        return fields, directory, base_address, record_length
+        record_length = base_address + offset + 1
+
+        leader = ('%05d%s%05d%s' % (record_length, self.leader[5:12], base_address, self.leader[17:])).encode('utf-8')
+        encoded[:0] = (leader, directory)
+        encoded.append(END_OF_RECORD_BYTES)
+        if text:
+            texts.insert(0, '=LDR  {}'.format(self.leader))
+            text = '\n'.join(texts) + '\n'
+        else: text = None
+        return b''.join(encoded), text
 
     def get_isbns(self):
         isbns = set()
@@ -374,18 +413,20 @@ class Field(object):
     def as_marc(self):
         if self.is_control_field():
             return (self.data + END_OF_FIELD).encode('utf-8')
-        marc = self.indicator1 + self.indicator2
-        for subfield in self:
-            try: marc += SUBFIELD_INDICATOR + subfield[0] + subfield[1]
+        marc = [self.indicator1, self.indicator2]
+        subfields = self.subfields
+        for i in range(0, len(subfields) - 1, 2):
+            try: marc.append(SUBFIELD_INDICATOR + subfields[i] + subfields[i + 1])
             except Exception as e:
                 print(str(e))
-                try: print('SUBFIELD 1: {}\n'.format(subfield[0]))
+                try: print('SUBFIELD 1: {}\n'.format(subfields[i]))
                 except: pass
                 try:
-                    print('SUBFIELD 2: {}\n'.format(subfield[1]))
+                    print('SUBFIELD 2: {}\n'.format(subfields[i + 1]))
                 except: pass
                 print(str(self.tag))
-        return (marc + END_OF_FIELD).encode('utf-8')
+        marc.append(END_OF_FIELD)
+        return ''.join(marc).encode('utf-8')
 
 
 # ====================
@@ -393,9 +434,9 @@ class Field(object):
 # ====================
 
 
-def create_graph_from_marc_file(file, skip_check=False):
+def create_graph_from_marc_file(file, skip_check=False, pairs=True):
 
-    G = Graph(skip_check=skip_check)
+    G = Graph(skip_check=skip_check, pairs=pairs)
 
     print('\n\nSearching file {} ...'.format(str(file)))
     print('----------------------------------------')
@@ -412,11 +453,9 @@ def create_graph_from_marc_file(file, skip_check=False):
         isbns = record.get_isbns()
 
         if isbns:
-            data = [(i.isbn, i.format, None) for i in isbns if i.isbn]
+            data = [(G.key(i.isbn), i.format) for i in isbns if i.isbn]
             G.add_nodes(data)
-            data = [(i.isbn, j.isbn) for i in isbns for j in isbns if
-                    i.isbn and j.isbn and i.isbn != j.isbn and i.format != 'C' and j.format != 'C']
-            G.add_edges(data)
+            G.add_cluster(i for (i, f) in data if f != 'C')
 
     G.check_graph()
     gc.collect()
@@ -429,7 +468,8 @@ def add_from_marc_files(input_path, skip_check=False):
 
     for file in os.listdir(input_path):
         if file.endswith('.lex'):
-            G = create_graph_from_marc_file(os.path.join(input_path, file), skip_check=skip_check)
+            G = create_graph_from_marc_file(os.path.join(input_path, file), skip_check=skip_check,
+                                            pairs=not db.cluster_ids)
             db.add_graph_to_database(G, skip_check)
 
     db.close()
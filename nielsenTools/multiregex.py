@@ -14,10 +14,32 @@ __status__ = '4 - Beta Development'
 
 
 class MultiRegex(object):
+    """Base class for making multiple regex replacements in a single pass.
+
+    Subclasses list their patterns in regexes, each wrapped in a named group. A match is replaced by:
+    - nothing, for a group named AllElse;
+    - the name of the group with UUUxxxx decoded as the character \\uxxxx, if the name contains UUU;
+    - the value of the attribute with the same name as the group, if there is one
+      (if the attribute is callable, it is called with the match object);
+    - otherwise the name of the group.
+
+    The replacement for each group is worked out once, when the class is instantiated,
+    so each match only needs a single lookup."""
+
     simple = False
     regexes = ()
 
+    @classmethod
+    def instance(cls):
+        """Return an instance of the class shared by all callers, so that its pattern is only compiled once"""
+        instance = cls.__dict__.get('_instance')
+        if instance is None:
+            instance = cls()
+            cls._instance = instance
+        return instance
+
     def __init__(self):
+        self._replacements = {}
         try:
             self._rx = re.compile('|'.join(self.regexes), flags=re.IGNORECASE)
         except:
@@ -26,34 +48,49 @@ class MultiRegex(object):
                     re.compile(r)
                 except:
                     print('Error in regex: {}'.format(str(r)))
+            return
+        for k in self._rx.groupindex:
+            self._replacements[k] = self.replacement(k)
+
+    def replacement(self, k):
+        """Return the replacement for a match of the group named k: either a string, or a callable"""
+        if k == 'AllElse':
+            return ''
+        if 'UUU' in str(k):
+            return bytes(str(k).replace('UUU', '\\' + 'u'), 'ascii').decode('unicode-escape')
+        try: return getattr(self, k)
+        except AttributeError: return str(k)
 
     def sub(self, s):
         if not s or s is None: return ''
         return self._rx.sub(self._sub, s)
 
     def _sub(self, mo):
-        try:
-            for k, v in mo.groupdict().items():
-                if v:
-                    if k == 'AllElse':
-                        return ''
-                    if 'UUU' in str(k):
-                        return bytes(str(k).replace('UUU', '\\' + 'u'), 'ascii').decode('unicode-escape')
-                    try:
-                        sub = getattr(self, k)
-                        if callable(sub):
-                            return sub(mo)
-                        else:
-                            return sub
-                    except:
-                        return str(k)
-
-        except:
-            print('\nError MR: {0}\n'.format(str(sys.exc_info())))
+        # Each pattern is wrapped in a named group, which is the last group to be closed when the pattern matches
+        k = mo.lastgroup
+        if k is None or not mo.group(k):
+            # Otherwise find the first named group which matched
+            k = next((k for k, v in mo.groupdict().items() if v), None)
+            if k is None:
+                print('\nError MR: no named group matched {0}\n'.format(str(mo.group())))
+                return None
+        sub = self._replacements[k]
+        if callable(sub):
+            try: return sub(mo)
+            except: return str(k)
+        return sub
 
 
 class Abbreviations(MultiRegex):
     simple = True
+
+    # Common abbreviations which are looked up in a table before the pattern is tried
+    plain = (
+        'approx', 'aufl', 'ausg', 'bd', 'bde', 'bibl', 'ca', 'cd', 'cm', 'col', 'cols', 'corr', 'diagr', 'diagrs',
+        'dvd', 'ed', 'edn', 'enl', 'facsim', 'facsims', 'fig', 'figs', 'fol', 'hbk', 'hrsg', 'ill', 'illus', 'ills',
+        'impr', 'incl', 'introd', 'izd', 'min', 'mins', 'mm', 'no', 'nos', 'pbk', 'pl', 'pls', 'port', 'ports', 'pp',
+        'pt', 'pts', 'repr', 'rev', 'ser', 'suppl', 'tom', 'v', 'vol', 'vols', 'wyd', 'yr', 'yrs',
+    )
     regexes = (
         r'(?P<January>^jan(uary)?\.*$)',
         r'(?P<February>^feb(ruary)?\.*$)',
@@ -205,3 +242,20 @@ class Abbreviations(MultiRegex):
         r'(?P<zeszyt>^zesz(yt)?\.*$)',      # Polish
         r'(?P<zvezek>^zv(ezek)?\.*$)',      # Slovenian, volumes
         )
+
+    def __init__(self):
+        MultiRegex.__init__(self)
+        # Keys are lower-case words, with and without a full stop; only words which the pattern changes are included
+        self.table = {}
+        for word in self.plain:
+            for key in (word, word + '.'):
+                value = MultiRegex.sub(self, key)
+                if value != key: self.table[key] = value
+
+    def sub(self, s):
+        if not s or s is None: return ''
+        # The pattern ignores case, so ASCII words can be looked up in lower case
+        if s.isascii():
+            try: return self.table[s.lower()]
+            except KeyError: pass
+        return MultiRegex.sub(self, s)
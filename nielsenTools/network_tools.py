@@ -20,22 +20,36 @@ __status__ = '4 - Beta Development'
 
 
 class Graph:
+    """Graph of related ISBNs.
 
-    def __init__(self, skip_check=False):
+    If integer_keys is True, 13-digit ISBNs are held as integers (see isbn_key()), which take about half the memory
+    of strings and are quicker to hash. ISBNs are given to and returned from the methods of the graph as strings,
+    but nodes, adjacencies, formats and checked are keyed by the integers.
+
+    If pairs is False, edges are not held in adjacencies, which for a cluster of k ISBNs take memory and time
+    in proportion to k * k. Instead each group of related nodes (from add_cluster or add_edge) is held in groups,
+    and clusters() joins them in a DisjointSet; this is enough for databases which use cluster ids."""
+
+    def __init__(self, skip_check=False, integer_keys=False, pairs=True):
         self.nodes = set()
         self.adjacencies = {}
         self.formats = {}
         self.checked = {}
+        self.groups = []
         self.skip_check = skip_check
+        self.integer_keys = integer_keys
+        self.pairs = pairs
+        self.key = isbn_key if integer_keys else isbn_text
 
     def __contains__(self, node):
-        return node in self.nodes
+        return self.key(node) in self.nodes
 
     def __iter__(self):
         return iter(self.nodes)
 
     def add_node(self, node, format='U'):
 
+        node = self.key(node)
         if node not in self.nodes:
             self.nodes.add(node)
             self.adjacencies[node] = set()
@@ -55,16 +69,17 @@ class Graph:
         if self.formats[node] == 'C':
             self.checked[node] = True
             return
-        if node.startswith(('978311', '9783484')):
+        isbn = isbn_text(node)
+        if isbn.startswith(('978311', '9783484')):
             self.formats[node] = 'P'
             self.checked[node] = True
             return
         if 'E' in [self.formats[node], format] and 'P' in [self.formats[node], format]:
             print('\nTrying Google ...')
-            try: e = query(node)
+            try: e = query(isbn)
             except: pass
             else:
-                print('Resolved format of {} using Google Books'.format(node))
+                print('Resolved format of {} using Google Books'.format(isbn))
                 if e:
                     self.formats[node] = 'P'
                     self.checked[node] = False
@@ -79,9 +94,9 @@ class Graph:
             return
         f = None
         while f not in ISBN_FORMATS:
-            pyperclip.copy(node)
+            pyperclip.copy(isbn)
             f = input('Please enter the format of ISBN {} '
-                      '(current formats are {}, {}): '.format(node, self.formats[node], format)).upper()
+                      '(current formats are {}, {}): '.format(isbn, self.formats[node], format)).upper()
             self.formats[node] = f
             self.checked[node] = True
         return
@@ -92,30 +107,36 @@ class Graph:
             self.add_node(node, format)
 
     def remove_node(self, node):
+        # Edges are symmetric, so the node only needs to be removed from the adjacencies of its own neighbours
+        node = self.key(node)
         self.nodes.discard(node)
-        self.adjacencies.pop(node, None)
+        for n in self.adjacencies.pop(node, ()):
+            self.adjacencies[n].discard(node)
         self.formats.pop(node, None)
         self.checked.pop(node, None)
-        for n in self.adjacencies:
-            self.adjacencies[n].discard(node)
 
     def remove_nodes(self, nodes):
         for n in nodes:
             self.remove_node(n)
 
     def collective_isbn(self, node):
+        node = self.key(node)
         self.formats[node] = 'C'
-        self.adjacencies[node] = set()
-        for n in self.adjacencies:
+        for n in self.adjacencies.get(node, ()):
             self.adjacencies[n].discard(node)
+        self.adjacencies[node] = set()
 
     def collective_isbns(self, nodes):
         for n in nodes:
             self.collective_isbn(n)
             
     def add_edge(self, u, v):
-        if u in self and v in self and u != v:
+        u, v = self.key(u), self.key(v)
+        if u in self.nodes and v in self.nodes and u != v:
             if self.formats[u] != 'C' and self.formats[v] != 'C':
+                if not self.pairs:
+                    self.groups.append((u, v))
+                    return
                 self.adjacencies[u].add(v)
                 self.adjacencies[v].add(u)
             
@@ -124,37 +145,72 @@ class Graph:
             u, v = e
             self.add_edge(u, v)
 
+    def add_cluster(self, nodes):
+        """Add edges between every pair of a group of related nodes (such as the ISBNs in one cluster record),
+        as add_edge does for each pair, without making a list of the pairs"""
+        cluster = set(self.key(n) for n in nodes)
+        cluster = [n for n in cluster if n in self.nodes and self.formats[n] != 'C']
+        if len(cluster) < 2: return
+        if not self.pairs:
+            self.groups.append(tuple(cluster))
+            return
+        for n in cluster:
+            self.adjacencies[n].update(cluster)
+            self.adjacencies[n].discard(n)
+
     def check_graph(self):
         print('\nChecking graph ...')
         collective = [n for n in self.nodes if self.formats[n] == 'C' and len(self.adjacencies[n]) > 0]
         for n in collective:
-            self.adjacencies[n] = set()
-            neighours = [a for a in self.nodes if n in self.adjacencies[a]]
-            for a in neighours:
+            for a in self.adjacencies[n]:
                 self.adjacencies[a].discard(n)
+            self.adjacencies[n] = set()
 
     def write_graph(self, path):
         self.check_graph()
         for f in ISBN_FORMATS:
             file = open(path.replace('.graph', '_{}.txt'.format(f)), 'w', encoding='utf-8', errors='replace')
-            for node in sorted(self.formats):
+            for node in sorted(self.formats, key=isbn_text):
                 if self.formats[node] == f:
-                    file.write(node + '\n')
+                    file.write(isbn_text(node) + '\n')
             file.close()
 
         file = open(path.replace('.graph', '_groups.txt'), 'w', encoding='utf-8', errors='replace')
         for connected_component in sorted(self.connected_components(), key=len, reverse=True):
-            file.write(' '.join(s + '|' + self.formats[s] for s in sorted(connected_component)) + '\n')
-        for n in sorted(self.isolates()):
-            file.write(n + '|' + self.formats[n] + '\n')
+            file.write(' '.join(isbn_text(s) + '|' + self.formats[s]
+                                for s in sorted(connected_component, key=isbn_text)) + '\n')
+        for n in sorted(self.isolates(), key=isbn_text):
+            file.write(isbn_text(n) + '|' + self.formats[n] + '\n')
         file.close()
 
         file = open(path, 'w', encoding='utf-8', errors='replace')
-        for node in sorted(self.nodes):
-            file.write('{}\t{}\t{}\t{}\n'.format(node, self.formats[node], str(self.checked[node]), ';'.join(sorted(self.adjacencies[node]))))
+        for node in sorted(self.nodes, key=isbn_text):
+            file.write('{}\t{}\t{}\t{}\n'.format(isbn_text(node), self.formats[node], str(self.checked[node]),
+                                                  ';'.join(sorted(map(isbn_text, self.adjacencies[node])))))
         file.close()
 
+    def clusters(self):
+        """Return a DisjointSet of the nodes which are related to at least one other node.
+
+        Groups are joined only once the graph is complete, since a later record may make one of their nodes
+        collective (or remove it), and collective nodes are not related to any other node."""
+        clusters = DisjointSet()
+        for group in self.groups:
+            group = [n for n in group if n in self.nodes and self.formats[n] != 'C']
+            if len(group) > 1: clusters.union_all(group)
+        for node in self.nodes:
+            for adj in self.adjacencies[node]:
+                clusters.union(node, adj)
+        return clusters
+
     def connected_components(self):
+        if not self.pairs:
+            clusters = self.clusters()
+            for c in clusters.components().values():
+                yield set(c)
+            for v in self:
+                if v not in clusters: yield {v}
+            return
         seen = set()
         for v in self:
             if v not in seen:
@@ -163,7 +219,10 @@ class Graph:
                 seen.update(c)
 
     def node_connected_component(self, n):
-        return set(self._plain_bfs(n))
+        if not self.pairs:
+            n = self.key(n)
+            return next((c for c in self.connected_components() if n in c), set())
+        return set(self._plain_bfs(self.key(n)))
 
     def _plain_bfs(self, source):
         seen = set()
@@ -178,4 +237,281 @@ class Graph:
                     nextlevel.update(self.adjacencies[v])
 
     def isolates(self):
+        if not self.pairs:
+            clusters = self.clusters()
+            return [n for n in self if n not in clusters]
         return [n for n in self if len(self.adjacencies[n]) == 0]
+
+
+class DisjointSet:
+    """Union-find structure for tracking equivalence classes of ISBNs (or other keys), such as clusters.
+
+    Memory and time are proportional to the number of ISBNs, however large the classes are:
+    each ISBN holds a link to another ISBN in its class, and the links are shortened as they are followed."""
+
+    def __init__(self, items=()):
+        self.parents = {}
+        self.sizes = {}
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return item in self.parents
+
+    def __iter__(self):
+        return iter(self.parents)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, item):
+        if item not in self.parents:
+            self.parents[item] = item
+            self.sizes[item] = 1
+
+    def find(self, item):
+        """Return the representative of the class containing item, adding item if it is not already present"""
+        parents = self.parents
+        root = parents.setdefault(item, item)
+        if root == item:
+            self.sizes.setdefault(item, 1)
+            return root
+        while parents[root] != root:
+            root = parents[root]
+        # Path compression
+        while parents[item] != root:
+            parents[item], item = root, parents[item]
+        return root
+
+    def union(self, a, b):
+        """Merge the classes containing a and b, returning the representative of the merged class"""
+        a, b = self.find(a), self.find(b)
+        if a == b: return a
+        if self.sizes[a] < self.sizes[b]: a, b = b, a
+        self.parents[b] = a
+        self.sizes[a] += self.sizes.pop(b)
+        return a
+
+    def union_all(self, items):
+        """Merge the classes containing all of items"""
+        root = None
+        for item in items:
+            root = self.find(item) if root is None else self.union(root, item)
+        return root
+
+    def components(self):
+        """Return a dictionary of the classes, as lists keyed by their representatives"""
+        components = {}
+        for item in self.parents:
+            components.setdefault(self.find(item), []).append(item)
+        return components
+
+    def component_ids(self):
+        """Return a dictionary of component ids keyed by item.
+
+        Components are numbered from 1 in order of their first ISBN (as text), so ids do not depend on the order
+        in which ISBNs were added."""
+        first = {root: isbn_text(min(members, key=isbn_text)) for root, members in self.components().items()}
+        numbers = {root: i for i, root in enumerate(sorted(first, key=first.get), start=1)}
+        return {item: numbers[self.find(item)] for item in self.parents}
+
+
+class CompactGraph:
+    """Read-only graph of related ISBNs held in numpy arrays, for graphs too large for Graph.
+
+    Nodes are numbered by id from 0 in order of their ISBNs (as text). keys holds the ISBNs, as integers if all of them
+    are 13-digit ISBNs (see isbn_key()) and as text otherwise; formats holds the index of each format
+    in format_names (which begins with ISBN_FORMATS), and checked whether each format has been checked.
+    Edges are held in compressed sparse row form: the neighbours of node i are indices[indptr[i]:indptr[i + 1]],
+    in order of id. Each node takes 18 bytes (if its key is an integer) and each edge 8, in both directions.
+
+    ISBNs are given to and returned from the methods of the graph in the same form as by Graph.
+    A graph is created with nodes but no edges, from arrays made by key_array() and format_array(); see set_edges()."""
+
+    def __init__(self, keys=None, formats=None, checked=None, format_names=None):
+        if np is None: raise ImportError('numpy is required for CompactGraph')
+        self.format_names = list(ISBN_FORMATS) if format_names is None else format_names
+        keys = np.empty(0, dtype=np.int64) if keys is None else keys
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.formats = np.zeros(len(keys), dtype=np.uint8) if formats is None else formats[order]
+        self.checked = np.zeros(len(keys), dtype=bool) if checked is None else checked[order]
+        self.indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+
+    @classmethod
+    def from_batches(cls, batches):
+        """Return a CompactGraph with nodes from batches of (ISBNs, formats, checked) sequences,
+        which are converted to arrays one batch at a time"""
+        keys, formats, checked, format_names = [], [], [], list(ISBN_FORMATS)
+        for isbns, batch_formats, batch_checked in batches:
+            keys.append(key_array(isbns))
+            formats.append(format_array(batch_formats, format_names))
+            checked.append(np.fromiter((bool(c) for c in batch_checked), dtype=bool, count=len(keys[-1])))
+        if not keys: return cls()
+        # If any ISBNs are held as text, they all must be
+        if any(k.dtype.kind != 'i' for k in keys): keys = [k.astype(str) for k in keys]
+        return cls(np.concatenate(keys), np.concatenate(formats), np.concatenate(checked), format_names)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """Return a CompactGraph with the same nodes and edges as a Graph"""
+        nodes = list(graph.nodes)
+        compact = cls.from_batches([(nodes, [graph.formats[n] for n in nodes], [graph.checked[n] for n in nodes])])
+        compact.set_edges([(compact.node_ids(n for n in nodes for adj in graph.adjacencies[n]),
+                            compact.node_ids(adj for n in nodes for adj in graph.adjacencies[n]))])
+        return compact
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, node):
+        return self.node_ids([node])[0] >= 0
+
+    def __iter__(self):
+        return iter(self.keys.tolist())
+
+    def set_edges(self, batches):
+        """Set the edges of the graph from batches of (u, v) arrays of node ids.
+
+        Edges are made symmetric; loops, repeated edges, edges to unknown nodes (with id -1)
+        and edges to collective ISBNs are dropped, as they are by Graph.add_edge()."""
+        n = len(self.keys)
+        collective = self.formats == self.format_names.index('C')
+        codes = []
+        for u, v in batches:
+            u, v = np.asarray(u, dtype=np.int64), np.asarray(v, dtype=np.int64)
+            keep = (u >= 0) & (v >= 0) & (u != v)
+            u, v = u[keep], v[keep]
+            keep = ~(collective[u] | collective[v])
+            u, v = u[keep], v[keep]
+            codes.append(np.unique(np.concatenate((u * n + v, v * n + u))))
+        codes = np.unique(np.concatenate(codes)) if codes else np.empty(0, dtype=np.int64)
+        self.indices = (codes % n).astype(np.int32) if n else np.empty(0, dtype=np.int32)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        if n: np.cumsum(np.bincount(codes // n, minlength=n), out=self.indptr[1:])
+
+    def node_ids(self, nodes):
+        """Return the ids of nodes as an array, with -1 for nodes which are not in the graph"""
+        if self.keys.dtype.kind == 'i':
+            values = [n if isinstance(n, int) else isbn_key(n) for n in nodes]
+            found = np.fromiter((isinstance(v, int) for v in values), dtype=bool, count=len(values))
+            values = np.fromiter((v if isinstance(v, int) else 0 for v in values), dtype=np.int64, count=len(values))
+        else:
+            # Integer keys become text when they are put in the array
+            values = list(nodes)
+            found = np.fromiter((v is not None for v in values), dtype=bool, count=len(values))
+            values = np.array(['' if v is None else v for v in values], dtype=str)
+        if not len(values): return np.empty(0, dtype=np.int64)
+        ids = np.searchsorted(self.keys, values)
+        found &= ids < len(self.keys)
+        found[found] = self.keys[ids[found]] == values[found]
+        return np.where(found, ids, -1)
+
+    def nodes(self, ids):
+        """Return the ISBNs of an array of node ids"""
+        return self.keys[ids].tolist()
+
+    def format(self, node):
+        return self.format_names[self.formats[self.node_ids([node])[0]]]
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def neighbours(self, ids):
+        """Return the neighbours of an array of node ids (including repeats) as an array of ids"""
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = self.indptr[ids]
+        lengths = self.indptr[ids + 1] - starts
+        # Position of each neighbour in indices: the start of its node's row plus its offset within the row
+        offsets = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.indices[offsets]
+
+    def component_labels(self):
+        """Return an array which gives the lowest id in the connected component of each node.
+
+        Each node takes the lowest label of its neighbours, and labels are then replaced by the labels of the nodes
+        they point to, until nothing changes; the number of passes grows with the logarithm of the diameter
+        of the largest component, rather than with the number of nodes."""
+        labels = np.arange(len(self.keys))
+        rows = np.repeat(labels, self.degrees())
+        while True:
+            new = labels.copy()
+            np.minimum.at(new, rows, labels[self.indices])
+            new = new[new]
+            if np.array_equal(new, labels): return labels
+            labels = new
+
+    def components(self):
+        """Return a list of the connected components of the graph, each as an array of ids"""
+        labels = self.component_labels()
+        order = np.argsort(labels, kind='stable')
+        return np.split(order, np.flatnonzero(np.diff(labels[order])) + 1) if len(order) else []
+
+    def connected_components(self):
+        for component in self.components():
+            yield set(self.nodes(component))
+
+    def node_connected_component(self, n):
+        source = self.node_ids([n])
+        if source[0] < 0: return set()
+        seen = np.zeros(len(self.keys), dtype=bool)
+        seen[source] = True
+        nextlevel = source
+        while nextlevel.size:
+            nextlevel = np.unique(self.neighbours(nextlevel))
+            nextlevel = nextlevel[~seen[nextlevel]]
+            seen[nextlevel] = True
+        return set(self.nodes(np.flatnonzero(seen)))
+
+    def isolates(self):
+        return self.nodes(np.flatnonzero(self.degrees() == 0))
+
+    def write_graph(self, path):
+        """Write the graph to the same files as Graph.write_graph()"""
+        for f in ISBN_FORMATS:
+            code = self.format_names.index(f)
+            file = open(path.replace('.graph', '_{}.txt'.format(f)), 'w', encoding='utf-8', errors='replace')
+            for node in self.nodes(np.flatnonzero(self.formats == code)):
+                file.write(isbn_text(node) + '\n')
+            file.close()
+
+        file = open(path.replace('.graph', '_groups.txt'), 'w', encoding='utf-8', errors='replace')
+        # Ids are in order of ISBN, so each component is already sorted
+        for component in sorted(self.components(), key=len, reverse=True):
+            file.write(' '.join(isbn_text(s) + '|' + self.format_names[f]
+                                for s, f in zip(self.nodes(component), self.formats[component])) + '\n')
+        isolates = np.flatnonzero(self.degrees() == 0)
+        for n, f in zip(self.nodes(isolates), self.formats[isolates]):
+            file.write(isbn_text(n) + '|' + self.format_names[f] + '\n')
+        file.close()
+
+        file = open(path, 'w', encoding='utf-8', errors='replace')
+        for i, node in enumerate(self.keys.tolist()):
+            adjacencies = self.nodes(self.indices[self.indptr[i]:self.indptr[i + 1]])
+            file.write('{}\t{}\t{}\t{}\n'.format(isbn_text(node), self.format_names[self.formats[i]], str(bool(self.checked[i])),
+                                                  ';'.join(map(isbn_text, adjacencies))))
+        file.close()
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def key_array(isbns):
+    """Function to return ISBNs as a numpy array of integer keys if they are all 13-digit ISBNs, or of text otherwise"""
+    keys = [isbn_key(isbn_text(isbn)) for isbn in isbns]
+    if all(isinstance(key, int) for key in keys): return np.array(keys, dtype=np.int64)
+    return np.array([isbn_text(key) for key in keys], dtype=str)
+
+
+def format_array(formats, format_names):
+    """Function to return formats as a numpy array of their indexes in the list format_names,
+    adding any formats which are not already in the list"""
+    codes = {f: i for i, f in enumerate(format_names)}
+    for f in formats:
+        if f not in codes:
+            codes[f] = len(format_names)
+            format_names.append(f)
+    return np.fromiter((codes[f] for f in formats), dtype=np.uint8, count=len(formats))
@@ -7,6 +7,7 @@ import math
 from nielsenTools.marc_data import *
 from nielsenTools.onix import *
 from nielsenTools.functions import *
+from nielsenTools.tsv_tools import *
 
 __author__ = 'Victoria Morris'
 __license__ = 'MIT License'
@@ -22,6 +23,10 @@ __status__ = '4 - Beta Development'
 STATUSES = ['add', 'upd', 'del']
 
 
+# Record status (Leader/05) for each type of Nielsen file
+STATUS_CODES = {'add': 'n', 'upd': 'c', 'del': 'd'}
+
+
 AUDIENCE_CODES = {
     'G':    'g',  # General
     'J':	'j',  # Children / Juvenile
@@ -1134,19 +1139,37 @@ ORG_FIELDS_MULTIVALUED = {
 }
 
 
+# Parts of a contributor name, numbered by contributor
+CONTRIBUTOR_NAME_PARTS = ('CR', 'CRT', 'CCI',
+                          'ICTBN', 'ICFN', 'ICKNP', 'ICKN', 'ICNAK', 'ICKNS',
+                          'ICLAN', 'ICTAN', 'ICCY', 'ICPP', 'ICAFF')
+
+
+# Related product columns (ID, ID type, relationship, ID type name) for related ISBNs, products and works
+RELATED_PRODUCT_PREFIXES = tuple(('R{}I'.format(letter), 'R{}IT'.format(letter),
+                                  'R{}T'.format(letter), 'R{}ITN'.format(letter)) for letter in ['I', 'P', 'W'])
+
+
+# Distributor name columns for each distribution area, in order of preference
+DISTRIBUTOR_PREFIXES = {c: tuple('{}{}DN'.format(c, distributor_type) for distributor_type in ['A', 'P', 'R', 'D', 'W', 'U'])
+                        for c in DISTRIBUTION_AREAS}
+
+
+# Subject category text descriptions used to test for literary form etc.
+SUBJECT_TEXT_PREFIXES = ('BIC2ST', 'BISACT', 'THEMAST', 'UKSLCAFT', 'UKSLCANFT', 'UKSLCCT')
+
+
 # ====================
 #      Classes
 # ====================
 
 class ContribName:
 
-    def __init__(self, i, row):
+    def __init__(self, i, row, columns=None):
+        if columns is None: columns = ColumnPlan.from_row(row)
         self.name = {}
-        for name_part in ['CR', 'CRT', 'CCI',
-                          'ICTBN', 'ICFN', 'ICKNP', 'ICKN', 'ICNAK', 'ICKNS',
-                          'ICLAN', 'ICTAN', 'ICCY', 'ICPP', 'ICAFF']:
-            try: self.name[name_part] = clean(row['{}{}'.format(name_part, str(i))])
-            except: self.name[name_part] = None
+        for name_part in CONTRIBUTOR_NAME_PARTS:
+            self.name[name_part] = clean(columns.get(row, name_part, i))
 
         try: self.role = ONIX_CONTRIBUTOR_ROLES[self.name['CR']]
         except: self.role = None
@@ -1187,8 +1210,9 @@ class ContribName:
 
 class NielsenCluster:
 
-    def __init__(self, csv_row):
+    def __init__(self, csv_row, columns=None):
         self.row = csv_row
+        self.columns = columns if columns is not None else ColumnPlan.from_row(csv_row)
         try: self.isbn = Isbn(clean(self.row['ISBN13']), format='U')
         except: self.isbn = None
         self.isbns = set()
@@ -1197,16 +1221,12 @@ class NielsenCluster:
         if self.isbn:
             self.alternative_formats.add(self.isbn)
 
-        for letter in ['I', 'P', 'W']:
-            for i in range(1, 10):
-                try: related_id = clean(self.row['R{}I{}'.format(letter, str(i))])
-                except: related_id = None
-                try: related_id_type = clean(self.row['R{}IT{}'.format(letter, str(i))])
-                except: related_id_type = None
-                try: relationship = clean(self.row['R{}T{}'.format(letter, str(i))])
-                except: relationship = None
-                try: related_id_type_name = clean(self.row['R{}ITN{}'.format(letter, str(i))])
-                except: related_id_type_name = None
+        for id_prefix, id_type_prefix, relationship_prefix, id_type_name_prefix in RELATED_PRODUCT_PREFIXES:
+            for i, key in self.columns.numbered(id_prefix):
+                related_id = clean(self.row[key])
+                related_id_type = clean(self.columns.get(self.row, id_type_prefix, i))
+                relationship = clean(self.columns.get(self.row, relationship_prefix, i))
+                related_id_type_name = clean(self.columns.get(self.row, id_type_name_prefix, i))
                 if related_id and related_id_type and relationship:
                     if related_id_type in ['02', '03', '15'] or is_isbn_13(related_id) or related_id_type_name in ['Contract_Head_ISBN', 'Release Identifier']:
                         # ISBNs
@@ -1245,9 +1265,10 @@ class NielsenCluster:
 
 class NielsenTSVOrganisations:
 
-    def __init__(self, csv_row, status='c'):
+    def __init__(self, csv_row, status='c', columns=None):
         self.row = csv_row
         self.status = status
+        self.columns = columns if columns is not None else ColumnPlan.from_row(csv_row)
 
         self.values = {}
         for v in ORG_FIELDS:
@@ -1255,15 +1276,17 @@ class NielsenTSVOrganisations:
             except: self.values[v] = None
         for v in ORG_FIELDS_REPEATABLE:
             self.values[v] = set()
-            for i in range(1, 5):
-                try: val =  clean(self.row['{}{}'.format(v, str(i))])
-                except: val = None
+            for i, key in self.columns.numbered(v, 5):
+                val = clean(self.row[key])
                 if val: self.values[v].add(val)
         for v in ORG_FIELDS_MULTIVALUED:
             if self.values[v]:
                 self.values[v] = set([clean(val) for val in self.values[v].split(';') if clean(val)])
             else: self.values[v] = set()
 
+    def record_id(self):
+        return self.values['ORGID']
+
     def sql_values(self):
         if not self.values['ORGID']: return None
         org_address = ', '.join(v for v in [self.values['ORGAL1'], self.values['ORGAL2'], self.values['ORGAL3'],
@@ -1443,9 +1466,10 @@ class NielsenTSVOrganisations:
 
 class NielsenTSVProducts:
 
-    def __init__(self, csv_row, status):
+    def __init__(self, csv_row, status, columns=None):
         self.row = csv_row
         self.status = status
+        self.columns = columns if columns is not None else ColumnPlan.from_row(csv_row)
         self.UK = False
         self.multimedia, self.ebook, self.audio = False, False, False
 
@@ -1458,18 +1482,16 @@ class NielsenTSVProducts:
         if not self.values['PUBPD']:
             if 'UKLPUBD' in self.row: self.values['PUBPD'] = clean(self.row['UKLPUBD'])
             elif 'UKNBDLPD' in self.row: self.values['PUBPD'] = clean(self.row['UKNBDLPD'])
-        self.values['NAC'], i = '|', 1
-        while self.values['NAC'] == '|' and i in range(1, 10):
-            try: self.values['NAC'] = AUDIENCE_CODES[clean(self.row['NAC{}'.format(str(i))])]
+        self.values['NAC'] = '|'
+        for i in self.columns.numbers(('NAC', 'OAC')):
+            try: self.values['NAC'] = AUDIENCE_CODES[clean(self.columns.get(self.row, 'NAC', i))]
             except:
-                try: self.values['NAC'] = ONIX_AUDIENCE_CODES[clean(self.row['OAC{}'.format(str(i))])]
+                try: self.values['NAC'] = ONIX_AUDIENCE_CODES[clean(self.columns.get(self.row, 'OAC', i))]
                 except: self.values['NAC'] = '|'
-            i += 1
-        i = 1
-        while not self.values['PFC'] and i in range(1, 10):
-            try: self.values['PFC'] = clean(self.row['PFD{}'.format(str(i))])
-            except: self.values['PFC'] = None
-            i += 1
+            if self.values['NAC'] != '|': break
+        for i, key in self.columns.numbered('PFD'):
+            if self.values['PFC']: break
+            self.values['PFC'] = clean(self.row[key])
 
         self.material_type = self.material_type()
 
@@ -1496,6 +1518,12 @@ class NielsenTSVProducts:
         if self.values['PFC'][:2] == 'P3': return 'VM'
         return None
 
+    def subject_text(self):
+        """Return the subject category descriptions as a single string, for testing for literary form etc."""
+        return '|' + '|'.join(self.row[key] or ''
+                              for subject_type in SUBJECT_TEXT_PREFIXES if self.columns.key(subject_type, 1)
+                              for i, key in self.columns.numbered(subject_type, 6 if subject_type.startswith('UKSLC') else 10))
+
     def sql_values(self):
         if not self.values['ISBN13']: return None
         return self.values['ISBN13'], self.values['IMPID'], self.values['PUBID'], self.row['PUBSC'], \
@@ -1600,9 +1628,7 @@ class NielsenTSVProducts:
             # 24-29 - Accompanying matter
             data += '||||||'
             # 30-31 - Literary text for sound recordings
-            test_string = '|' + '|'.join(self.row['{}{}'.format(subject_type, str(i))]
-                                         for subject_type in [s for s in ['BIC2ST', 'BISACT', 'THEMAST', 'UKSLCAFT', 'UKSLCANFT', 'UKSLCCT'] if '{}1'.format(s) in self.row]
-                                         for i in range(1, 6 if subject_type.startswith('UKSLC') else 10)).lower()
+            test_string = self.subject_text().lower()
             test_string_2 = ''
             test_string_2 += 'a' if 'autobiography' in test_string else ''
             test_string_2 += 'b' if 'biography' in test_string else ''
@@ -1690,7 +1716,7 @@ class NielsenTSVProducts:
             # PCTCT*    Product Content: Text Description
             test_string = self.values['PFCT'] or ''
             test_string += '|' + (self.values['ILL'] or '')
-            try: test_string += '|' + '|'.join(self.row['PCTCT{}'.format(i)] for i in range(1, 10))
+            try: test_string += '|' + '|'.join(self.row[key] for i, key in self.columns.numbered('PCTCT'))
             except: pass
             data += (''.join(RE_NATURE_OF_CONTENTS[x] for x in RE_NATURE_OF_CONTENTS if re.search(x, test_string)).strip() + '||||')[:4]
             # 28 - Government publication
@@ -1704,9 +1730,7 @@ class NielsenTSVProducts:
             # 32 - Undefined
             data += ' '
             # 33 - Literary form
-            test_string = '|' + '|'.join(self.row['{}{}'.format(subject_type, str(i))]
-                                         for subject_type in [s for s in ['BIC2ST', 'BISACT', 'THEMAST', 'UKSLCAFT', 'UKSLCANFT', 'UKSLCCT'] if '{}1'.format(s) in self.row]
-                                         for i in range(1, 6 if subject_type.startswith('UKSLC') else 10)).lower()
+            test_string = self.subject_text().lower()
             for s in ['PFC', 'PFCT']:
                 if self.values[s]: test_string += '|' + self.values[s].lower()
             test_string = test_string.lower()
@@ -1787,9 +1811,8 @@ class NielsenTSVProducts:
 
         # 034 - Coded Cartographic Mathematical Data (R)
         # MS*   Map scale as stored
-        for i in range(1, 2):
-            try: MS = clean(self.row['MS{}'.format(str(i))])
-            except: MS = None
+        for i, key in self.columns.numbered('MS', 2):
+            MS = clean(self.row[key])
             if MS:
                 MS = re.sub(r'[^0-9]', '', MS.split(':')[-1])
                 record.add_field(Field('034', ['1', ' '], ['a', 'a', 'b', MS]))
@@ -1804,25 +1827,21 @@ class NielsenTSVProducts:
         # TFT*  Language translated from original language: Text Description
         languages = set()
         translations = set()
-        for i in range(1, 10):
-            try: l = clean(self.row['LC{}'.format(str(i))])
-            except: l = None
+        for i, key in self.columns.numbered('LC'):
+            l = clean(self.row[key])
             if l: languages.add(l)
-        for i in range(1, 10):
-            try: LT =  clean(self.row['LT{}'.format(str(i))])
-            except: LT = None
+        for i, key in self.columns.numbered('LT'):
+            LT = clean(self.row[key])
             if LT:
                 for l in LANGUAGE_REPLACEMENTS: LT = LT.replace(l, LANGUAGE_REPLACEMENTS[l])
                 for l in LT.split(','):
                     try: languages.add(LANGUAGES_CODES[l.strip()])
                     except: pass
-        for i in range(1, 5):
-            try: l = clean(self.row['TFC{}'.format(str(i))])
-            except: l = None
+        for i, key in self.columns.numbered('TFC', 5):
+            l = clean(self.row[key])
             if l: translations.add(l)
-        for i in range(1, 10):
-            try: TFT =  clean(self.row['TFT{}'.format(str(i))])
-            except: TFT = None
+        for i, key in self.columns.numbered('TFT'):
+            TFT = clean(self.row[key])
             if TFT:
                 for l in LANGUAGE_REPLACEMENTS: TFT = TFT.replace(l, LANGUAGE_REPLACEMENTS[l])
                 for l in TFT.split(','):
@@ -1839,18 +1858,16 @@ class NielsenTSVProducts:
 
         # 050 - Library of Congress Call Number (R)
         # LOCC*     Library of Congress Classification as stored
-        for i in range(1, 10):
-            try: LOCC = clean(self.row['LOCC{}'.format(str(i))])
-            except: LOCC = None
+        for i, key in self.columns.consecutive('LOCC'):
+            LOCC = clean(self.row[key])
             if LOCC: record.add_field(Field('050', [' ', '4'], ['a', LOCC]))
             else: break
 
         # 072 - Subject Category Code (R)
         for c in ['BIC2SC', 'BISACC', 'THEMASC', 'UKSLCAFC', 'UKSLCANFC', 'UKSLCCC']:
             terms = set()
-            for i in range(1, 6 if c.startswith('UKSLC') else 10):
-                try: v = clean(self.row['{}{}'.format(c, str(i))])
-                except: v = None
+            for i, key in self.columns.numbered(c, 6 if c.startswith('UKSLC') else 10):
+                v = clean(self.row[key])
                 if v: terms.add(v)
             for v in sorted(terms):
                 record.add_field(Field('072', [' ', '7'], ['a', v, '2', SUBJECT_CATEGORY_SOURCE_CODES[c]]))
@@ -1863,10 +1880,10 @@ class NielsenTSVProducts:
         # 082 - Dewey Decimal Classification Number (R)
         # DEWS*     DDC Edition No
         # DEWEY*    DDC value
-        for i in range(1, 10):
-            try: DEWS = clean(re.sub(r'[^0-9]', '', self.row['DEWS{}'.format(str(i))]))
+        for i, key in self.columns.consecutive('DEWEY'):
+            try: DEWS = clean(re.sub(r'[^0-9]', '', self.columns.get(self.row, 'DEWS', i)))
             except: DEWS = None
-            try: DEWEY = clean(re.sub(r'[^0-9\.]', '', self.row['DEWEY{}'.format(str(i))]))
+            try: DEWEY = clean(re.sub(r'[^0-9\.]', '', self.row[key]))
             except: DEWEY = None
             if DEWEY:
                 subfields = ['a', DEWEY]
@@ -1876,8 +1893,8 @@ class NielsenTSVProducts:
 
         # 100 - Main Entry-Personal Name (NR)
         names = set()
-        for i in range(1, 10):
-            name = ContribName(i, self.row)
+        for i in self.columns.numbers(CONTRIBUTOR_NAME_PARTS):
+            name = ContribName(i, self.row, self.columns)
             if str(name) != '':
                 names.add(name)
 
@@ -1988,9 +2005,8 @@ class NielsenTSVProducts:
 
         # 255 - Cartographic Mathematical Data (R)
         # MS*   Map scale as stored
-        for i in range(1, 2):
-            try: MS = clean(self.row['MS{}'.format(str(i))])
-            except: MS = None
+        for i, key in self.columns.numbered('MS', 2):
+            MS = clean(self.row[key])
             if MS and ':' in MS:
                 MS = MS.split(':', 1)
                 MS = '{}:{}'.format(re.sub(r'[^0-9]', '', MS[0]), re.sub(r'[^0-9,]]', '', re.sub(r'\s+', ',', MS[1].strip())))
@@ -2050,11 +2066,9 @@ class NielsenTSVProducts:
         for c in DISTRIBUTION_AREAS:
             d = set()
             subfields = ['a', '[{}] :'.format(DISTRIBUTION_AREAS[c][0])]
-            for i in range (1, 10):
-                for distributor_type in ['A', 'P', 'R', 'D', 'W', 'U']:
-                    try: DN = clean(self.row['{}{}DN{}'.format(c, distributor_type, str(i))])
-                    except: DN = None
-                    if DN: d.add(DN)
+            for i, prefix, key in self.columns.interleaved(DISTRIBUTOR_PREFIXES[c]):
+                DN = clean(self.row[key])
+                if DN: d.add(DN)
             if d:
                 d = '[distributor] ' + ' :|[distributor] '.join(d)
                 for DN in d.split('|'):
@@ -2124,8 +2138,8 @@ class NielsenTSVProducts:
         content_types = set()
         try: content_types.add(ONIX_PRODUCT_FORM[self.values['PFC']][1])
         except: pass
-        for i in range(1, 10):
-            try: content_types.add((ONIX_PRODUCT_CONTENT_TYPE_MAP[self.row['PCTC{}'.format(str(i))]]).rda_text)
+        for i, key in self.columns.numbered('PCTC'):
+            try: content_types.add((ONIX_PRODUCT_CONTENT_TYPE_MAP[self.row[key]]).rda_text)
             except: pass
         for v in content_types:
             if v:
@@ -2172,14 +2186,10 @@ class NielsenTSVProducts:
                         subfields.extend(['h', '{} tax'.format(CCPRTOP)])
                     if CCPRA: subfields.extend(['j', CCPRA])
                     # xxxtDN*       The Org name of the 'distributor'
-                    i = 1
                     DN = None
-                    while not DN and i in range(1, 10):
-                        for distributor_type in ['A', 'P', 'R', 'D', 'W', 'U']:
-                            try: DN = clean(self.row['{}{}DN{}'.format(c, distributor_type, str(i))])
-                            except: pass
-                            if DN: break
-                        i += 1
+                    for i, prefix, key in self.columns.interleaved(DISTRIBUTOR_PREFIXES[c]):
+                        DN = clean(self.row[key])
+                        if DN: break
                     if DN: subfields.extend(['m', DN])
                     subfields.extend(['2', 'onixpt'])
                     record.add_field(Field('365', [' ', ' '], subfields))
@@ -2235,15 +2245,12 @@ class NielsenTSVProducts:
                 if NBDPAC: subfields.extend(['2', 'onixas'])
                 record.add_field(Field('366', [' ', ' '], subfields))
 
-        for i in range(1, 10):
-            try: NBDAA = clean(self.row['OTHERNBDAA{}'.format(str(i))])
-            except: NBDAA = None
-            try: NBDEAD = clean(re.sub(r'[^0-9]', '', self.row['OTHERNBDEAD{}'.format(str(i))]))
+        for i, key in self.columns.numbered('OTHERNBDAA'):
+            NBDAA = clean(self.row[key])
+            try: NBDEAD = clean(re.sub(r'[^0-9]', '', self.columns.get(self.row, 'OTHERNBDEAD', i)))
             except: NBDEAD = None
-            try: NBDPAC = clean(self.row['OTHERNBDPAC{}'.format(str(i))])
-            except: NBDPAC = None
-            try: NBDPAT = clean(self.row['OTHERNBDPAT{}'.format(str(i))])
-            except: NBDPAT = None
+            NBDPAC = clean(self.columns.get(self.row, 'OTHERNBDPAC', i))
+            NBDPAT = clean(self.columns.get(self.row, 'OTHERNBDPAT', i))
             if NBDAA and NBDEAD:
                 subfields = ['b', NBDEAD]
                 if NBDPAC: subfields.extend(['c', NBDPAC])
@@ -2295,29 +2302,24 @@ class NielsenTSVProducts:
         # PFDT*     Product Form Detail: Text Description
         # PFFSD*    Product Form Feature Safety Type: Text Description
         for c in ['PFDT', 'PFFSD']:
-            for i in range(1, 10):
-                try: v = clean(self.row['{}{}'.format(c, str(i))])
-                except: v = None
+            for i, key in self.columns.consecutive(c):
+                v = clean(self.row[key])
                 if v: record.add_field(Field('500', [' ', ' '], ['a', '{}.'.format(v)]))
                 else: break
 
         # PWU*      Product Website URL
         # PWTT*     Product Website Type: Text Description
-        for i in range(1, 10):
-            try: PWU = self.row['PWU{}'.format(str(i))].strip()
-            except: PWU = None
-            if PWU == '': PWU = None
-            try: PWTT = clean(self.row['PWTT{}'.format(str(i))])
-            except: PWTT = None
+        for i, key in self.columns.consecutive('PWU'):
+            PWU = (self.row[key] or '').strip() or None
+            PWTT = clean(self.columns.get(self.row, 'PWTT', i))
             if not PWTT or 'unspecified' in PWTT.lower(): PWTT = 'Related website'
             if PWU: record.add_field(Field('500', [' ', ' '], ['a', '{}: {}.'.format(PWTT, PWU)]))
             else: break
 
         # 521 - Target Audience Note (R)
         # OAT*  ONIX Audience level: Text Description
-        for i in range(1, 10):
-            try: OAT = clean(self.row['OAT{}'.format(str(i))])
-            except: OAT = None
+        for i, key in self.columns.consecutive('OAT'):
+            OAT = clean(self.row[key])
             if OAT: record.add_field(Field('521', [' ', ' '], ['a', '{}.'.format(OAT)]))
             else: break
 
@@ -2337,16 +2339,13 @@ class NielsenTSVProducts:
         # CIS   A statement of the contained items
         if self.values['CIS']: record.add_field(Field('501', [' ', ' '], ['a', self.values['CIS'] + '.']))
 
-        for i in range(1, 10):
+        for i, key in self.columns.consecutive('CIID'):
             # CIID*     Contained Item Identifier
             # CIPFCT*   Contained Item: Product Form Text Description
             # CINOP*    Contained item number of identical pieces
-            try: CIID = clean(self.row['CIID{}'.format(str(i))])
-            except: CIID = None
-            try: CIPFCT = clean(self.row['CIPFCT{}'.format(str(i))])
-            except: CIPFCT = None
-            try: CINOP = clean(self.row['CINOP{}'.format(str(i))])
-            except: CINOP = None
+            CIID = clean(self.row[key])
+            CIPFCT = clean(self.columns.get(self.row, 'CIPFCT', i))
+            CINOP = clean(self.columns.get(self.row, 'CINOP', i))
             if CIID:
                 CIID = 'Contains {} of {}{}.'.format('a copy' if CINOP == '1' else '{} copies'.format(CINOP),
                                                     CIID, ' ({})'.format(CIPFCT) if CIPFCT else '')
@@ -2379,19 +2378,15 @@ class NielsenTSVProducts:
 
         # 538 - System Details Note (R)
         # 563 - Binding Information (R)
-        for i in range(1, 10):
+        for i, key in self.columns.consecutive('PFFT'):
             # PFFT*     Product Form Feature Type: Code (ONIX code list 79)
             # PFFTT*    Product Form Feature Type: Text Description
             # PFFVT*    Product Form Feature Value: Text
             # PFFD*     Product Form Feature Description
-            try: PFFT = clean(self.row['PFFT{}'.format(str(i))])
-            except: PFFT = None
-            try: PFFTT = clean(self.row['PFFTT{}'.format(str(i))])
-            except: PFFTT = None
-            try: PFFVT = clean(self.row['PFFVT{}'.format(str(i))])
-            except: PFFVT = None
-            try: PFFD = clean(self.row['PFFD{}'.format(str(i))])
-            except: PFFD = None
+            PFFT = clean(self.row[key])
+            PFFTT = clean(self.columns.get(self.row, 'PFFTT', i))
+            PFFVT = clean(self.columns.get(self.row, 'PFFVT', i))
+            PFFD = clean(self.columns.get(self.row, 'PFFD', i))
             if PFFT and PFFTT:
                 if PFFVT: PFFTT = PFFVT.replace(' - ', ': ')
                 if PFFD: PFFTT = '{} ({})'.format(PFFTT, PFFD)
@@ -2406,15 +2401,13 @@ class NielsenTSVProducts:
         # LS    Language statement
         # TS    Translation statement
         languages = set()
-        for i in range(1, 10):
-            try: l = clean(self.row['LT{}'.format(str(i))])
-            except: l = None
+        for i, key in self.columns.numbered('LT'):
+            l = clean(self.row[key])
             if l: languages.add(l)
         LS = ', '.join(languages)
         translations = set()
-        for i in range(1, 5):
-            try: l = clean(self.row['TFT{}'.format(str(i))])
-            except: l = None
+        for i, key in self.columns.numbered('TFT', 5):
+            l = clean(self.row[key])
             if l: translations.add(l)
         TF = ', '.join(translations)
         try: TS = clean(self.row['TS'])
@@ -2436,22 +2429,18 @@ class NielsenTSVProducts:
         # 650 - Subject Added Entry-Topical Term (R)
         # BIC2QT*   BIC Qualifier, version 2.1: Text Description
         bic_qualifiers = []
-        for i in range(1, 10):
-            try: BIC2QC = clean(self.row['BIC2QC{}'.format(str(i))])
-            except: BIC2QC = None
-            try: BIC2QT = clean(self.row['BIC2QT{}'.format(str(i))])
-            except: BIC2QT = None
+        for i, key in self.columns.consecutive('BIC2QC'):
+            BIC2QC = clean(self.row[key])
+            BIC2QT = clean(self.columns.get(self.row, 'BIC2QT', i))
             if BIC2QT and BIC2QC:
                 bic_qualifiers.extend(['z' if BIC2QC[0] == '1' else 'y' if BIC2QC[0] == '3' else 'x', BIC2QT])
             else: break
 
         # THEMAQT*  Thema Qualifier: Text
         thema_qualifiers = []
-        for i in range(1, 10):
-            try: THEMAQC = clean(self.row['THEMAQC{}'.format(str(i))])
-            except: THEMAQC = None
-            try: THEMAQT = clean(self.row['THEMAQT{}'.format(str(i))])
-            except: THEMAQT = None
+        for i, key in self.columns.consecutive('THEMAQC'):
+            THEMAQC = clean(self.row[key])
+            THEMAQT = clean(self.columns.get(self.row, 'THEMAQT', i))
             if THEMAQC and THEMAQT:
                 thema_qualifiers.extend(['z' if THEMAQC[0] == '1' else 'y' if THEMAQC[0] == '3' else 'x', THEMAQT])
             else: break
@@ -2467,9 +2456,8 @@ class NielsenTSVProducts:
         for c in ['BIC2ST', 'BISACT', 'THEMAST', 'UKSLCAFT', 'UKSLCANFT', 'UKSLCCT', 'LOCSH', 'NASI']:
             delim = ' / ' if c == 'BISACT' else ' - ' if c == 'LOCSH' else None
             terms = set()
-            for i in range(1, 6 if c.startswith('UKSLC') else 10):
-                try: v = clean(self.row['{}{}'.format(c, str(i))])
-                except: v = None
+            for i, key in self.columns.consecutive(c, 6 if c.startswith('UKSLC') else 10):
+                v = clean(self.row[key])
                 if v: terms.add(v)
                 else: break
             for v in sorted(terms):
@@ -2519,13 +2507,10 @@ class NielsenTSVProducts:
         # RWI*      Related Work ID
         # RWITN*    Related Work ID Name
         # RWTT*     Related Work Type Text
-        for i in range(1, 10):
-            try: RWI = clean(self.row['RWI{}'.format(str(i))])
-            except: RWI = None
-            try: RWITN = clean(self.row['RWITN{}'.format(str(i))])
-            except: RWITN = None
-            try: RWTT = clean(self.row['RWTT{}'.format(str(i))])
-            except: RWTT = None
+        for i, key in self.columns.consecutive('RWI'):
+            RWI = clean(self.row[key])
+            RWITN = clean(self.columns.get(self.row, 'RWITN', i))
+            RWTT = clean(self.columns.get(self.row, 'RWTT', i))
             if RWI:
                 subfields = []
                 if RWTT: subfields.extend(['i', RWTT])
@@ -2541,30 +2526,202 @@ class NielsenTSVProducts:
         return record
 
 
+class NielsenCSVProducts:
+
+    def __init__(self, csv_row, status, columns=None):
+        self.row = csv_row
+        self.status = status
+        self.columns = columns if columns is not None else ColumnPlan.from_row(csv_row)
+        self.values = {}
+        for v in ['ISBN13', 'FTS']:
+            try: self.values[v] = clean(self.row[v])
+            except: self.values[v] = None
+        if not self.values['ISBN13']: self.values['ISBN13'] = '[NO RECORD IDENTIFIER]'
+
+    def record_id(self):
+        if self.values['ISBN13'] and self.values['ISBN13'] != '[NO RECORD IDENTIFIER]':
+            return self.values['ISBN13']
+        return None
+
+    def marc(self):
+
+        # Leader (NR)
+        record = Record(leader='     {}am a22     2  4500'.format(self.status))
+
+        # 001 - Control Number
+        record.add_field(Field(tag='001', data=self.values['ISBN13']))
+
+        # 003 - Control Number Identifier (NR)
+        record.add_field(Field(tag='003', data='UK-WkNB'))
+
+        # 005 - Date and Time of Latest Transaction (NR)
+        record.add_field(Field(tag='005', data='{}.0'.format(datetime.datetime.now().strftime('%Y%m%d%H%M%S'))))
+
+        # 007 - Physical Description Fixed Field-General Information (R)
+
+        # 008 - Fixed-Length Data Elements-General Information (NR)
+        # 00-05 - Date entered on file
+        data = datetime.datetime.now().strftime('%y%m%d')
+        # 06 - Type of date/Publication status
+        # 07-10 - Date 1
+        # 11-14 - Date 2
+        data += 'nuuuuuuuu'
+        # 15-17 - Place of publication, production, or execution
+        data += 'xx '
+        data += '|||||||||||||||||'
+        # 35-37 - Language
+        data += '   '
+        # 38 - Modified record
+        data += '|'
+        # 39 - Cataloging source
+        data += ' '
+        record.add_field(Field(tag='008', data=data))
+
+        # 020 - International Standard Book Number (R)
+        try: v = clean(re.sub(r'[^0-9X]', '', self.row['ISBN13'].upper()))
+        except: v = None
+        if v: record.add_field(Field('020', [' ', ' '], ['a', v]))
+
+        cluster = NielsenCluster(self.row, self.columns)
+        for isbn in cluster.isbns:
+            if ':' not in isbn:
+                record.add_field(Field('020', [' ', ' '], ['z', isbn]))
+
+        for isbn in cluster.isbns:
+            if ':' in isbn:
+                identifier_type, identifier = isbn.split(':', 1)
+                record.add_field(Field('024', ['7', ' '], ['a', identifier, '2', identifier_type]))
+
+        # 100 - Main Entry-Personal Name (NR)
+        names = set()
+        for i in self.columns.numbers(CONTRIBUTOR_NAME_PARTS):
+            name = ContribName(i, self.row, self.columns)
+            if str(name) != '':
+                names.add(name)
+
+        authors = [str(n) for n in names if n.role == 'author']
+        if len(authors) > 1: resp = ', '.join(authors[:-1]) + ' and ' + authors[-1]
+        elif authors: resp = authors[0]
+        else: resp = ''
+
+        editors = [str(n) for n in names if n.role == 'editor']
+        if len(editors) > 1: resp += ' ; edited by ' + ', '.join(editors[:-1]) + ' and ' + editors[-1]
+        elif editors: resp += ' ; edited by ' + editors[0]
+
+        others = [clean('{} {}'.format(n.role, str(n))) for n in names if n.role not in ['author', 'editor']]
+        resp += ' ; '.join(others)
+
+        if resp != '': resp = clean(resp) + '.'
+
+        authors = [n for n in names if n.role == 'author']
+        if authors:
+            author = authors[0]
+            record.add_field(author.as_marc())
+            authors.remove(author)
+
+        # 245 - Title Statement (NR)
+        # LA    Leading Article of Title. Usually A or The
+        # TL    Main text of Title
+        # ST    Subtitle of text
+        # PVNO* Volume or Part number
+        # PT*   Title of this volume or part
+        # YS    Year Statement
+        try: TL = clean(self.row['FTS'])
+        except: TL = None
+        if not TL: TL = '[TITLE NOT PROVIDED]'
+        if resp: TL += ' /'
+        else: TL += '.'
+        subfields = ['a', TL]
+        if resp: subfields.extend(['c', resp])
+        indicators = ['1' if resp else '0', '0']
+        record.add_field(Field('245', indicators, subfields))
+
+        # 700 - Added Entry-Personal Name (R)
+        for name in authors:
+            record.add_field(name.as_marc(tag_start='7'))
+
+        editors = [n for n in names if n.role == 'editor']
+        for name in editors:
+            record.add_field(name.as_marc(tag_start='7'))
+
+        others = [n for n in names if n.role not in ['author', 'editor']]
+        for name in others:
+            record.add_field(name.as_marc(tag_start='7'))
+
+        # 787 - Other Relationship Entry (R)
+        for isbn, relationship in cluster.related:
+            record.add_field(Field('787', ['1', ' '], ['i', relationship, 'z', isbn.isbn]))
+
+        record.add_field(Field('FMT', [' ', ' '], ['a', 'BK']))
+
+        record.add_field(Field('SRC', [' ', ' '], ['a', 'Record converted from Nielsen CSV data to MARC21 by Collection Metadata.']))
+
+        return record
+
+
+
 # ====================
 #     Function for
 #    file handling
 # ====================
 
 
+def output_file_paths(conversion_type, output_path, status, file_count, today):
+    """Function to return the paths of the output files for a conversion"""
+    paths = {'int': os.path.join(output_path, '{n:03d}_{c}_{s}_{t}.lex'.format(n=file_count, c=conversion_type, s=status, t=today)),
+             'text': os.path.join(output_path, '{n:03d}_{c}_{s}_{t}.txt'.format(n=file_count, c=conversion_type, s=status, t=today)),
+             'dup': os.path.join(output_path, '_duplicates_{}_{}_{}.txt'.format(conversion_type, status, today))}
+    if conversion_type == 'product':
+        paths['uk'] = os.path.join(output_path, 'UK', '{n:03d}_{c}_{s}_{t}_UK.lex'.format(n=file_count, c=conversion_type, s=status, t=today))
+    return paths
+
+
 def new_files(FILES, WRITERS, conversion_type, output_path, status, file_count, today, text_output=False):
     if file_count == 0:
         for f in ('int', 'uk', 'dup', 'text'):
             FILES[f] = {}
             WRITERS[f] = {}
+        WRITERS['both'] = {}
     else:
         for f in ('int', 'uk', 'text'):
             try: FILES[f][status].close()
             except: pass
     file_count += 1
-    FILES['int'][status] = open(os.path.join(output_path, '{n:03d}_{c}_{s}_{t}.lex'.format(n=file_count, c=conversion_type, s=status, t=today)), mode='wb')
+    paths = output_file_paths(conversion_type, output_path, status, file_count, today)
+    FILES['int'][status] = open(paths['int'], mode='wb')
     if conversion_type == 'product':
-        FILES['uk'][status] = open(os.path.join(output_path, 'UK', '{n:03d}_{c}_{s}_{t}_UK.lex'.format(n=file_count, c=conversion_type, s=status, t=today)), mode='wb')
+        FILES['uk'][status] = open(paths['uk'], mode='wb')
     if text_output:
-        FILES['text'][status] = open(os.path.join(output_path, '{n:03d}_{c}_{s}_{t}.txt'.format(n=file_count, c=conversion_type, s=status, t=today)), mode='w', encoding='utf-8', errors='replace')
+        FILES['text'][status] = open(paths['text'], mode='w', encoding='utf-8', errors='replace')
     if file_count == 1:
-        FILES['dup'][status] = open(os.path.join(output_path, '_duplicates_{}_{}_{}.txt'.format(conversion_type, status, today)), mode='w', encoding='utf-8', errors='replace')
+        FILES['dup'][status] = open(paths['dup'], mode='w', encoding='utf-8', errors='replace')
     WRITERS['int'][status] = MARCWriter(FILES['int'][status])
     if conversion_type == 'product':
         WRITERS['uk'][status] = MARCWriter(FILES['uk'][status])
-    return FILES, WRITERS, file_count
\ No newline at end of file
+        # UK records are serialized once and written to both the main and the UK file
+        WRITERS['both'][status] = MARCFanOutWriter(WRITERS['int'][status], WRITERS['uk'][status])
+    return FILES, WRITERS, file_count
+
+
+def reopen_files(conversion_type, output_path, status, file_count, today, sizes, text_output=False):
+    """Function to reopen the current output files of an interrupted conversion.
+
+    Each file is truncated to the size given in sizes, discarding anything written after that point,
+    and opened for appending."""
+    FILES, WRITERS = {}, {'both': {}}
+    for f in ('int', 'uk', 'dup', 'text'):
+        FILES[f] = {}
+        WRITERS[f] = {}
+    paths = output_file_paths(conversion_type, output_path, status, file_count, today)
+    for f in ('int', 'uk', 'dup', 'text'):
+        if f not in paths or f not in sizes: continue
+        if f == 'text' and not text_output: continue
+        with open(paths[f], mode='ab') as ofile:
+            ofile.truncate(sizes[f])
+        if f in ('int', 'uk'):
+            FILES[f][status] = open(paths[f], mode='ab')
+            WRITERS[f][status] = MARCWriter(FILES[f][status])
+        else: FILES[f][status] = open(paths[f], mode='a', encoding='utf-8', errors='replace')
+    if status in WRITERS['uk']:
+        WRITERS['both'][status] = MARCFanOutWriter(WRITERS['int'][status], WRITERS['uk'][status])
+    return FILES, WRITERS
\ No newline at end of file
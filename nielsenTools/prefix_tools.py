@@ -0,0 +1,161 @@
+#  -*- coding: utf-8 -*-
+
+"""Tools for finding the registrant (publisher) prefix of an ISBN from the ISBN International range table."""
+
+# Import required modules
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+from bisect import bisect_right
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Constants
+# ====================
+
+
+# Number of digits following a prefix which are compared with the ranges in the range table
+RANGE_DIGITS = 7
+
+# Name of the range table file loaded by the scripts if it is present in the folder in which they are run
+# (available as RangeMessage.xml from https://www.isbn-international.org/range_file_generation)
+RANGE_MESSAGE_PATH = 'RangeMessage.xml'
+
+
+# ====================
+#       Classes
+# ====================
+
+
+class PrefixRules:
+    """Sorted ranges for the digits following a single prefix, with the number of digits assigned in each range"""
+
+    def __init__(self, rules):
+        self.starts, self.ends, self.lengths = [], [], []
+        for start, end, length in sorted(rules):
+            self.starts.append(start)
+            self.ends.append(end)
+            self.lengths.append(length)
+
+    def find(self, value):
+        """Return the index of the range containing value, or -1 if it is not in a range"""
+        i = bisect_right(self.starts, value) - 1
+        if i < 0 or value > self.ends[i]: return -1
+        return i
+
+    def as_list(self):
+        return [['{:0{n}d}-{:0{n}d}'.format(start, end, n=RANGE_DIGITS), length]
+                for start, end, length in zip(self.starts, self.ends, self.lengths)]
+
+
+class PrefixTable:
+    """ISBN range table, used to split ISBN-13s into EAN prefix, registration group and registrant.
+
+    The table can be loaded from the RangeMessage.xml file published by the International ISBN Agency,
+    or from a JSON file written by save(), which has the form
+        {"EAN.UCCPrefixes": {"978": [["0000000-5999999", 1], ...], ...},
+         "RegistrationGroups": {"978-0": [["0000000-1999999", 2], ...], ...}}
+    Each prefix maps to a list of ranges for the 7 digits following it, with the number of those digits
+    which belong to the registration group (or registrant); a length of 0 means the range is not in use."""
+
+    def __init__(self, path=None):
+        self.groups = {}
+        self.registrants = {}
+        self.source = None
+        if path: self.load(path)
+
+    def load(self, path):
+        """Load the range table from an XML or JSON file"""
+        with open(path, mode='rb') as ifile:
+            data = ifile.read()
+        if data.lstrip()[:1] in (b'{', b'['):
+            self._load_json(json.loads(data.decode('utf-8')))
+        else: self._load_xml(ElementTree.fromstring(data))
+        self.source = path
+
+    def _load_xml(self, root):
+        for name, table in (('EAN.UCCPrefixes/EAN.UCC', self.groups), ('RegistrationGroups/Group', self.registrants)):
+            for element in root.iterfind(name):
+                prefix = element.findtext('Prefix', '').replace('-', '').strip()
+                table[prefix] = PrefixRules(parse_rule(rule.findtext('Range', ''), rule.findtext('Length', ''))
+                                            for rule in element.iterfind('Rules/Rule'))
+
+    def _load_json(self, data):
+        for name, table in (('EAN.UCCPrefixes', self.groups), ('RegistrationGroups', self.registrants)):
+            for prefix, rules in data.get(name, {}).items():
+                table[prefix.replace('-', '')] = PrefixRules(parse_rule(r, length) for r, length in rules)
+
+    def save(self, path):
+        """Write the range table to a JSON file, which can be loaded more quickly than the XML file"""
+        data = {'EAN.UCCPrefixes': {prefix: rules.as_list() for prefix, rules in sorted(self.groups.items())},
+                'RegistrationGroups': {prefix[:3] + '-' + prefix[3:]: rules.as_list()
+                                       for prefix, rules in sorted(self.registrants.items())}}
+        with open(path, mode='w', encoding='utf-8') as ofile:
+            json.dump(data, ofile, indent=1)
+
+    def __len__(self):
+        return len(self.registrants)
+
+    def _split(self, isbn):
+        """Return (prefix, group, end) for a valid ISBN-13: the publisher prefix, the EAN prefix and
+        registration group, and the last 7-digit value after the registration group with the same publisher prefix"""
+        rules = self.groups.get(isbn[:3])
+        if rules is None: return '', None, None
+        i = rules.find(int(isbn[3:3 + RANGE_DIGITS]))
+        if i < 0 or not rules.lengths[i]: return '', None, None
+        group = isbn[:3 + rules.lengths[i]]
+        rules = self.registrants.get(group)
+        if rules is None: return group, None, None
+        i = rules.find(range_value(isbn, group))
+        if i < 0 or not rules.lengths[i]: return group, None, None
+        return isbn[:len(group) + rules.lengths[i]], group, rules.ends[i]
+
+    def prefix(self, isbn):
+        """Return the publisher prefix (EAN prefix, registration group and registrant) of a valid ISBN-13.
+
+        If the registrant range is not in use, only the EAN prefix and registration group are returned;
+        if the registration group is not known, an empty string is returned."""
+        return self._split(isbn)[0]
+
+    def prefixes(self, isbns):
+        """Return a dictionary of the publisher prefixes of valid ISBN-13s.
+
+        The ISBNs are sorted, so that ISBNs which fall in the same registrant range share a single lookup."""
+        results = {}
+        prefix, group, end = None, None, None
+        for isbn in sorted(set(isbns)):
+            if not (group and isbn.startswith(prefix) and range_value(isbn, group) <= end):
+                prefix, group, end = self._split(isbn)
+            results[isbn] = prefix
+        return results
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def parse_rule(value_range, length):
+    """Function to convert a range such as 0000000-1999999 and its length to a (start, end, length) tuple"""
+    start, end = value_range.strip().split('-')
+    return int(start), int(end), int(length)
+
+
+def range_value(isbn, prefix):
+    """Function to return the 7 digits of an ISBN-13 following a prefix as an integer, padded with zeros"""
+    return int(isbn[len(prefix):12].ljust(RANGE_DIGITS, '0')[:RANGE_DIGITS])
+
+
+def load_prefix_table(path=None):
+    """Function to load the range table from path, or from RANGE_MESSAGE_PATH if it exists.
+
+    Returns None if no path is given and RANGE_MESSAGE_PATH does not exist."""
+    if path is None:
+        if not os.path.isfile(RANGE_MESSAGE_PATH): return None
+        path = RANGE_MESSAGE_PATH
+    return PrefixTable(path)
@@ -0,0 +1,160 @@
+#  -*- coding: utf-8 -*-
+
+"""Tools for saving graphs of related ISBNs as snapshot files, which are memory-mapped when they are loaded."""
+
+# Import required modules
+import json
+import os
+import struct
+
+from nielsenTools.network_tools import *
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Constants
+# ====================
+
+
+# A snapshot file begins with SNAPSHOT_MAGIC, the version of the file format and the length of a JSON header,
+# which gives the database the snapshot was made from and the dtype, shape and offset of each array.
+# The arrays follow the header, each starting at a multiple of SNAPSHOT_ALIGNMENT bytes.
+# Snapshots written with a different version of the file format are ignored
+SNAPSHOT_MAGIC = b'ISBNSNAP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_ALIGNMENT = 64
+SNAPSHOT_PREAMBLE = struct.Struct('<8sII')
+
+# Extension of snapshot files, which are written alongside the database
+SNAPSHOT_EXTENSION = '.snapshot'
+
+# Arrays held in a snapshot file, in the order in which they are written
+SNAPSHOT_ARRAYS = ['keys', 'formats', 'checked', 'indptr', 'indices',
+                   'component_ids', 'component_indptr', 'component_members']
+
+
+# ====================
+#       Classes
+# ====================
+
+
+class GraphSnapshot(CompactGraph):
+    """CompactGraph loaded from a snapshot file, with its arrays memory-mapped from the file.
+
+    Loading takes the same time however large the graph is, and processes which load the same snapshot share
+    its pages in memory. As well as the arrays of CompactGraph, a snapshot holds the connected components:
+    component_ids gives the component of each node, numbered from 0 in order of their first ISBNs,
+    and the nodes of component c are component_members[component_indptr[c]:component_indptr[c + 1]], in order of id."""
+
+    def __init__(self, path):
+        with open(path, mode='rb') as ifile:
+            magic, version, length = SNAPSHOT_PREAMBLE.unpack(ifile.read(SNAPSHOT_PREAMBLE.size))
+            if magic != SNAPSHOT_MAGIC: raise ValueError('{} is not a graph snapshot'.format(path))
+            if version != SNAPSHOT_VERSION:
+                raise ValueError('The graph snapshot {} has version {}, not {}'.format(path, version, SNAPSHOT_VERSION))
+            header = json.loads(ifile.read(length).decode('utf-8'))
+        self.path = path
+        self.source = header['source']
+        self.format_names = header['format_names']
+        for name in SNAPSHOT_ARRAYS:
+            dtype, shape, offset = header['arrays'][name]
+            if shape[0]: setattr(self, name, np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=tuple(shape)))
+            else: setattr(self, name, np.empty(shape, dtype=dtype))
+
+    def is_current(self, database_path):
+        """Return True if the database has not changed since the snapshot was written"""
+        return self.source == database_signature(database_path)
+
+    def component_labels(self):
+        return self.component_members[self.component_indptr[:-1]][self.component_ids]
+
+    def components(self):
+        if not len(self.keys): return []
+        return np.split(self.component_members, self.component_indptr[1:-1])
+
+    def component(self, i):
+        """Return the ids of the nodes in the same connected component as node id i, including i"""
+        c = self.component_ids[i]
+        return self.component_members[self.component_indptr[c]:self.component_indptr[c + 1]]
+
+    def node_connected_component(self, n):
+        i = self.node_ids([n])[0]
+        if i < 0: return set()
+        return set(self.nodes(self.component(i)))
+
+    def related(self, n):
+        """Return the ISBNs related to an ISBN (those in the same connected component), as text in order of ISBN"""
+        i = self.node_ids([n])[0]
+        if i < 0: return []
+        component = self.component(i)
+        return [isbn_text(node) for node in self.nodes(component[component != i])]
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def snapshot_path(database_path):
+    """Function to return the path of the snapshot file of a database"""
+    return os.path.splitext(database_path)[0] + SNAPSHOT_EXTENSION
+
+
+def database_signature(database_path):
+    """Function to return the size and modification time of a database, which change whenever it is written to"""
+    try: stat = os.stat(database_path)
+    except OSError: return None
+    return {'path': os.path.abspath(database_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def write_snapshot(graph, path, database_path):
+    """Function to write a CompactGraph made from a database to a snapshot file.
+
+    The file is written under a temporary name and then renamed, so that processes which have the old snapshot
+    loaded keep their copy, and no process ever loads a partly written file"""
+    component_ids = np.unique(graph.component_labels(), return_inverse=True)[1].astype(np.int32)
+    component_members = np.argsort(component_ids, kind='stable').astype(np.int32)
+    component_indptr = np.zeros(int(component_ids.max(initial=-1)) + 2, dtype=np.int64)
+    np.cumsum(np.bincount(component_ids, minlength=len(component_indptr) - 1), out=component_indptr[1:])
+    arrays = {'keys': graph.keys, 'formats': graph.formats, 'checked': graph.checked,
+              'indptr': graph.indptr, 'indices': graph.indices, 'component_ids': component_ids,
+              'component_indptr': component_indptr, 'component_members': component_members}
+
+    header = {'source': database_signature(database_path), 'format_names': graph.format_names, 'arrays': {}}
+    # The offsets of the arrays depend on the length of the header, so they are found by increasing the space
+    # allowed for the header until it fits
+    start = SNAPSHOT_ALIGNMENT
+    while True:
+        offset = start
+        for name in SNAPSHOT_ARRAYS:
+            header['arrays'][name] = [arrays[name].dtype.str, list(arrays[name].shape), offset]
+            offset += -(-arrays[name].nbytes // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+        data = json.dumps(header).encode('utf-8')
+        if SNAPSHOT_PREAMBLE.size + len(data) <= start: break
+        start += SNAPSHOT_ALIGNMENT * (1 + (SNAPSHOT_PREAMBLE.size + len(data) - start) // SNAPSHOT_ALIGNMENT)
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, mode='wb') as ofile:
+        ofile.write(SNAPSHOT_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(data)))
+        ofile.write(data)
+        for name in SNAPSHOT_ARRAYS:
+            dtype, shape, offset = header['arrays'][name]
+            ofile.write(b'\0' * (offset - ofile.tell()))
+            ofile.write(np.ascontiguousarray(arrays[name]).tobytes())
+    os.replace(temporary_path, path)
+
+
+def load_snapshot(path, database_path):
+    """Function to load a snapshot file as a GraphSnapshot.
+
+    Returns None if numpy is not installed, if the file does not exist or cannot be read,
+    or if the database has changed since the snapshot was written."""
+    if np is None or not os.path.isfile(path): return None
+    try: snapshot = GraphSnapshot(path)
+    except (OSError, ValueError, KeyError): return None
+    if not snapshot.is_current(database_path): return None
+    return snapshot
@@ -0,0 +1,207 @@
+#  -*- coding: utf-8 -*-
+
+"""Tools for reading Nielsen TSV files used within nielsenTools."""
+
+# Import required modules
+import csv
+import re
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Constants
+# ====================
+
+
+# Carriage returns which are not part of a CRLF line ending (treated as line breaks by csv.reader)
+RE_LONE_CR = re.compile(r'(?<=\r)(?![\r\n]*$)')
+
+
+# ====================
+#       Classes
+# ====================
+
+
+class ColumnPlan:
+    """Plan for extracting values from the rows of a Nielsen TSV file.
+
+    The plan is compiled once from the header of the file. It records the index of each column, and which
+    members of numbered column families (e.g. LC1 to LC9, BIC2ST1 to BIC2ST9) are present, so that rows only
+    need to be probed for columns which the file actually contains."""
+
+    def __init__(self, fieldnames):
+        self.fieldnames = tuple(fieldnames or ())
+        # If a column name is repeated, the last occurrence is used (as by csv.DictReader)
+        self.index = {}
+        for i, name in enumerate(self.fieldnames):
+            self.index[name] = i
+        # Numbered columns, keyed by (prefix, number), for numbers 1 to 9
+        self.keys = {}
+        for name in self.index:
+            if name and name[-1] in '123456789':
+                self.keys[(name[:-1], int(name[-1]))] = name
+        self._cache = {}
+
+    @classmethod
+    def from_row(cls, row):
+        """Compile a plan from the keys of a single row dictionary"""
+        if isinstance(row, TSVRow): return row.columns
+        return cls(key for key in row if key is not None)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.fieldnames)
+
+    def key(self, prefix, n):
+        """Return the name of column <prefix><n>, or None if it is not present"""
+        return self.keys.get((prefix, n))
+
+    def get(self, row, prefix, n):
+        """Return the value of column <prefix><n> in a row, or None if the column is not present"""
+        key = self.keys.get((prefix, n))
+        if key is None: return None
+        return row[key]
+
+    def numbered(self, prefix, stop=10):
+        """Return (n, name) for each column <prefix><n> which is present, for n from 1 to stop - 1"""
+        try: return self._cache[('numbered', prefix, stop)]
+        except KeyError: pass
+        columns = tuple((n, self.keys[(prefix, n)]) for n in range(1, stop) if (prefix, n) in self.keys)
+        self._cache[('numbered', prefix, stop)] = columns
+        return columns
+
+    def consecutive(self, prefix, stop=10):
+        """Return (n, name) for columns <prefix>1, <prefix>2 ... up to the first which is not present"""
+        try: return self._cache[('consecutive', prefix, stop)]
+        except KeyError: pass
+        columns = []
+        for n in range(1, stop):
+            if (prefix, n) not in self.keys: break
+            columns.append((n, self.keys[(prefix, n)]))
+        columns = tuple(columns)
+        self._cache[('consecutive', prefix, stop)] = columns
+        return columns
+
+    def interleaved(self, prefixes, stop=10):
+        """Return (n, prefix, name) for each column <prefix><n> which is present,
+        ordered by n and then by the order of prefixes"""
+        try: return self._cache[('interleaved', prefixes, stop)]
+        except KeyError: pass
+        columns = tuple((n, prefix, self.keys[(prefix, n)])
+                        for n in range(1, stop) for prefix in prefixes if (prefix, n) in self.keys)
+        self._cache[('interleaved', prefixes, stop)] = columns
+        return columns
+
+    def numbers(self, prefixes, stop=10):
+        """Return the numbers n for which any column <prefix><n> is present"""
+        try: return self._cache[('numbers', prefixes, stop)]
+        except KeyError: pass
+        numbers = tuple(n for n in range(1, stop) if any((prefix, n) in self.keys for prefix in prefixes))
+        self._cache[('numbers', prefixes, stop)] = numbers
+        return numbers
+
+
+class TSVRow:
+    """Read-only view of a single row of a Nielsen TSV file.
+
+    Values are looked up by column name, as for a row returned by csv.DictReader, but the row only holds
+    the list of values and a reference to the column plan shared by every row in the file.
+    Columns missing from the end of a short row have the value None."""
+
+    __slots__ = ('values', 'columns')
+
+    def __init__(self, values, columns):
+        self.values = values
+        self.columns = columns
+
+    def __getitem__(self, key):
+        i = self.columns.index[key]
+        try: return self.values[i]
+        except IndexError: return None
+
+    def __contains__(self, key):
+        return key in self.columns.index
+
+    def __iter__(self):
+        return iter(self.columns.index)
+
+    def __len__(self):
+        return len(self.columns.index)
+
+    def get(self, key, default=None):
+        try: return self[key]
+        except KeyError: return default
+
+    def keys(self):
+        return self.columns.index.keys()
+
+    def items(self):
+        return ((key, self[key]) for key in self.columns.index)
+
+
+class TSVReader:
+    """Reader for Nielsen TSV files, returning a TSVRow for each row.
+
+    The file must be opened in binary mode. Lines which contain no quotation marks are simply split on tabs;
+    any other lines are passed to csv.reader, so the values returned are the same as those from
+    csv.DictReader(ifile, delimiter='\t'). Blank lines are skipped.
+
+    If fieldnames is None the first row of the file is used as the header.
+    The offset attribute holds the position in the file after the last row read, so that reading can be
+    resumed from that point by seeking to it and supplying the fieldnames."""
+
+    def __init__(self, file, fieldnames=None, encoding='utf-8', errors='replace'):
+        self.file = file
+        self.encoding = encoding
+        self.errors = errors
+        try: self.offset = file.tell()
+        except (AttributeError, OSError): self.offset = 0
+        self.line_num = 0
+        self._lines = self._read_lines()
+        self._pending = None
+        self._csv = csv.reader(self._csv_lines(), delimiter='\t')
+        if fieldnames is None:
+            fieldnames = next(self.iter_values(), [])
+        self.columns = ColumnPlan(fieldnames)
+        self.fieldnames = self.columns.fieldnames
+
+    def _read_lines(self):
+        """Yield decoded lines, splitting on carriage returns in the same way as a file opened with newline=''"""
+        for line in self.file:
+            self.offset += len(line)
+            line = line.decode(self.encoding, self.errors)
+            if '\r' in line.rstrip('\r\n'):
+                yield from RE_LONE_CR.split(line)
+            else: yield line
+
+    def _csv_lines(self):
+        while True:
+            if self._pending is not None:
+                line, self._pending = self._pending, None
+                yield line
+            else:
+                try: yield next(self._lines)
+                except StopIteration: return
+
+    def iter_values(self):
+        """Yield the list of values for each row"""
+        for line in self._lines:
+            self.line_num += 1
+            if '"' in line:
+                self._pending = line
+                values = next(self._csv)
+            else:
+                values = line.rstrip('\r\n').split('\t')
+                if values == ['']: values = []
+            if values: yield values
+
+    def __iter__(self):
+        columns = self.columns
+        for values in self.iter_values():
+            yield TSVRow(values, columns)
@@ -0,0 +1,138 @@
+#  -*- coding: utf-8 -*-
+
+"""Tests that databases which store related ISBNs as pairs and as cluster ids find the same clusters.
+
+Each test is run with ISBNs held as text and as integer keys."""
+
+# Import required modules
+import random
+
+import pytest
+
+import nielsenTools.database_tools as database_tools
+from nielsenTools.network_tools import *
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Constants
+# ====================
+
+
+A, B, C, D = '9780000000019', '9780000000026', '9780000000033', '9780000000040'
+
+# Formats used in random files; E is left out, since a conflict between E and P is resolved using Google Books
+FORMATS = ['P', 'P', 'P', 'U', 'C']
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def open_database(path, integer_keys, cluster_ids, monkeypatch):
+    monkeypatch.setattr(database_tools, 'DATABASE_PATH', str(path))
+    return database_tools.IsbnDatabase(integer_keys=integer_keys, cluster_ids=cluster_ids)
+
+
+def add_file(db, records):
+    """Function to add a file of records, each a list of (ISBN, format) tuples, as add_nielsen does.
+
+    The database is cleaned after each file, as clusters stored as pairs depend on when the transitive closure
+    is computed if an ISBN in a cluster later becomes collective"""
+    G = Graph(skip_check=True, integer_keys=db.integer_keys, pairs=not db.cluster_ids)
+    for record in records:
+        data = [(G.key(isbn), format) for isbn, format in record]
+        G.add_nodes(data)
+        G.add_cluster(i for (i, f) in data if f != 'C')
+    G.check_graph()
+    db.add_graph_to_database(G, skip_check=True)
+    db.clean(quick_clean=True, transitive=True)
+
+
+def clusters(db):
+    """Function to return the clusters of related ISBNs in a database as a set of frozensets of ISBNs"""
+    groups = DisjointSet()
+    if db.cluster_ids:
+        for isbn, cluster_id in db.cursor.execute('SELECT isbn, cluster_id FROM isbn_clusters;').fetchall():
+            groups.union(isbn_text(isbn), ('cluster', cluster_id))
+    else:
+        for isbna, isbnb in db.cursor.execute('SELECT isbna, isbnb FROM isbn_equivalents;').fetchall():
+            groups.union(isbn_text(isbna), isbn_text(isbnb))
+    result = set()
+    for members in groups.components().values():
+        members = frozenset(m for m in members if isinstance(m, str))
+        if len(members) > 1: result.add(members)
+    return result
+
+
+def build(tmp_path, monkeypatch, integer_keys, cluster_ids, files):
+    db = open_database(tmp_path / '{}_{}.db'.format(integer_keys, cluster_ids), integer_keys, cluster_ids, monkeypatch)
+    for records in files:
+        add_file(db, records)
+    return db
+
+
+def random_files(seed, count=5, records=40, isbns=120):
+    rnd = random.Random(seed)
+    pool = [isbn13(str(978000000000 + i)) for i in range(isbns)]
+    return [[[(isbn, rnd.choice(FORMATS)) for isbn in rnd.sample(pool, rnd.randint(2, 5))]
+             for r in range(records)] for f in range(count)]
+
+
+def isbn13(digits):
+    """Function to add the check digit to the first 12 digits of an ISBN-13"""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+# ====================
+#        Tests
+# ====================
+
+
+@pytest.fixture(params=[False, True], ids=['text', 'integer_keys'])
+def integer_keys(request):
+    return request.param
+
+
+def test_collective_isbn_in_database(tmp_path, monkeypatch, integer_keys):
+    # A is stored as collective, so it does not relate B and D when a later file gives it another format
+    files = [[[(A, 'C'), (C, 'P')]], [[(A, 'P'), (B, 'P')], [(A, 'P'), (D, 'P')], [(B, 'P'), (C, 'P')]]]
+    for cluster_ids in (False, True):
+        db = build(tmp_path, monkeypatch, integer_keys, cluster_ids, files)
+        assert clusters(db) == {frozenset([B, C])}
+        db.close()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_files(tmp_path, monkeypatch, integer_keys, seed):
+    files = random_files(seed)
+    pairs = build(tmp_path, monkeypatch, integer_keys, False, files)
+    expected = clusters(pairs)
+    pairs.close()
+    db = build(tmp_path, monkeypatch, integer_keys, True, files)
+    assert clusters(db) == expected
+    db.close()
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_convert_to_cluster_ids(tmp_path, monkeypatch, integer_keys, seed):
+    db = build(tmp_path, monkeypatch, integer_keys, False, random_files(seed))
+    # ISBNs which become collective keep their pairs until the database is cleaned,
+    # but do not join clusters together when the database is converted
+    db.cursor.execute("UPDATE isbns SET format = 'C' WHERE isbn IN (SELECT isbna FROM isbn_equivalents LIMIT 3);")
+    db.conn.commit()
+    collective = {isbn_text(row[0]) for row in db.cursor.execute("SELECT isbn FROM isbns WHERE format = 'C';")}
+    groups = DisjointSet()
+    for isbna, isbnb in db.cursor.execute('SELECT isbna, isbnb FROM isbn_equivalents;').fetchall():
+        if isbn_text(isbna) not in collective and isbn_text(isbnb) not in collective:
+            groups.union(isbn_text(isbna), isbn_text(isbnb))
+    expected = {frozenset(members) for members in groups.components().values()}
+    db.convert_to_cluster_ids()
+    assert clusters(db) == expected
+    db.close()
@@ -0,0 +1,148 @@
+#  -*- coding: utf-8 -*-
+
+"""Tests for the rules for collective (C) ISBNs in network_tools.Graph.
+
+Each test is run with ISBNs held as text and as integer keys."""
+
+# Import required modules
+import pytest
+
+from nielsenTools.network_tools import *
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+# ====================
+#      Constants
+# ====================
+
+
+A, B, C, D = '9780000000019', '9780000000026', '9780000000033', '9780000000040'
+
+
+# ====================
+#      Fixtures
+# ====================
+
+
+@pytest.fixture(params=[False, True], ids=['text', 'integer_keys'])
+def graph(request):
+    """Graph in which A is related to B, C and D, and B is related to C"""
+    G = Graph(skip_check=True, integer_keys=request.param)
+    G.add_nodes([(A, 'P'), (B, 'E'), (C, 'P'), (D, 'U')])
+    G.add_edges([(A, B), (A, C), (A, D), (B, C)])
+    return G
+
+
+@pytest.fixture(params=[(False, True), (True, True), (False, False), (True, False)],
+                ids=['text-pairs', 'integer_keys-pairs', 'text-groups', 'integer_keys-groups'])
+def cluster_graph(request):
+    """Empty graph, with or without pairs of related nodes"""
+    integer_keys, pairs = request.param
+    return Graph(skip_check=True, integer_keys=integer_keys, pairs=pairs)
+
+
+def adjacencies(G):
+    """Function to return the adjacencies of a graph as sets of ISBNs"""
+    return {isbn_text(n): set(map(isbn_text, a)) for n, a in G.adjacencies.items()}
+
+
+# ====================
+#        Tests
+# ====================
+
+
+def test_remove_node(graph):
+    graph.remove_node(A)
+    assert A not in graph
+    assert adjacencies(graph) == {B: {C}, C: {B}, D: set()}
+    assert graph.key(A) not in graph.formats and graph.key(A) not in graph.checked
+
+
+def test_remove_missing_node(graph):
+    before = adjacencies(graph)
+    graph.remove_node('9780000000057')
+    assert adjacencies(graph) == before
+
+
+def test_collective_isbn(graph):
+    graph.collective_isbn(A)
+    assert graph.formats[graph.key(A)] == 'C'
+    assert adjacencies(graph) == {A: set(), B: {C}, C: {B}, D: set()}
+
+
+def test_add_node_collective(graph):
+    # A node which is added again as C keeps its edges until the graph is checked
+    graph.add_node(B, 'C')
+    assert graph.formats[graph.key(B)] == 'C' and graph.checked[graph.key(B)]
+    graph.check_graph()
+    assert adjacencies(graph) == {A: {C, D}, B: set(), C: {A}, D: {A}}
+
+
+def test_check_graph(graph):
+    graph.formats[graph.key(A)] = 'C'
+    graph.formats[graph.key(C)] = 'C'
+    graph.check_graph()
+    assert adjacencies(graph) == {A: set(), B: set(), C: set(), D: set()}
+    assert set(map(isbn_text, graph.isolates())) == {A, B, C, D}
+
+
+def test_check_graph_without_collective(graph):
+    before = adjacencies(graph)
+    graph.check_graph()
+    assert adjacencies(graph) == before
+
+
+def test_add_edge_to_collective(graph):
+    graph.collective_isbn(A)
+    graph.add_edge(A, B)
+    graph.add_edge(D, A)
+    assert adjacencies(graph)[A] == set()
+    assert A not in adjacencies(graph)[B] and A not in adjacencies(graph)[D]
+
+
+def components(G):
+    """Function to return the connected components of a graph as sorted lists of ISBNs"""
+    return sorted(sorted(map(isbn_text, c)) for c in G.connected_components())
+
+
+def test_add_cluster(cluster_graph):
+    G = cluster_graph
+    G.add_nodes([(A, 'P'), (B, 'E'), (C, 'P'), (D, 'U')])
+    G.add_cluster([A, B, B])
+    G.add_cluster([B, C])
+    assert components(G) == [[A, B, C], [D]]
+    assert sorted(map(isbn_text, G.node_connected_component(C))) == [A, B, C]
+    assert list(map(isbn_text, G.isolates())) == [D]
+    if G.pairs: assert adjacencies(G) == {A: {B}, B: {A, C}, C: {B}, D: set()}
+    else: assert adjacencies(G) == {A: set(), B: set(), C: set(), D: set()}
+
+
+def test_add_cluster_skips_collective(cluster_graph):
+    G = cluster_graph
+    G.add_nodes([(A, 'C'), (B, 'E'), (C, 'P'), (D, 'U')])
+    G.add_cluster([A, B, D])
+    G.add_cluster([A, C])
+    assert components(G) == [[A], [B, D], [C]]
+
+
+def test_clusters_after_collective(cluster_graph):
+    # B is made collective by a later record, so A and C are related only through D
+    G = cluster_graph
+    G.add_nodes([(A, 'P'), (B, 'E'), (C, 'P'), (D, 'U')])
+    G.add_cluster([A, B])
+    G.add_cluster([B, C, D])
+    G.add_node(B, 'C')
+    G.check_graph()
+    assert components(G) == [[A], [B], [C, D]]
+    G.remove_node(D)
+    assert components(G) == [[A], [B], [C]]
+
+
+def test_connected_components(graph):
+    graph.collective_isbn(A)
+    components = sorted(sorted(map(isbn_text, c)) for c in graph.connected_components())
+    assert components == [[A], [B, C], [D]]